@@ -0,0 +1,375 @@
+from CellSim import World, SlotSet, ALL_DIRECTIONS, DIRECTIONS, DIR_NUMBER, neighborIndexTables
+from random import randint
+import numpy as np
+
+
+class BulkSlotSet( SlotSet ):
+   '''A SlotSet which also adds, discards and exchanges arrays of indices
+   at once, working on NumPy views of its arrays.'''
+   def addAll( self, indices ):
+      '''Add each of indices (unique, none of them members).'''
+      indices = np.asarray( indices, dtype=np.intc )
+      where = np.frombuffer( self._where, dtype=np.intc )
+      where[ indices ] = np.arange( len(self._slots), len(self._slots) + len(indices), dtype=np.intc )
+      self._slots.frombytes( indices.tobytes() )
+
+   def discardAll( self, indices ):
+      '''Discard each of indices (unique, all of them members).  The
+      members left in the last len(indices) slots fill the holes left
+      elsewhere.'''
+      indices = np.asarray( indices, dtype=np.intc )
+      if len(indices) == 0:
+         return
+
+      slots = np.frombuffer( self._slots, dtype=np.intc )
+      where = np.frombuffer( self._where, dtype=np.intc )
+      tailStart = len(slots) - len(indices)
+      pos       = where[ indices ]
+      inTail    = pos >= tailStart
+      staying   = np.ones( len(indices), dtype=bool )   # <- which of the tail's members stay
+      staying[ pos[inTail] - tailStart ] = False
+      holes     = pos[ ~inTail ]
+      movers    = slots[ tailStart: ][ staying ]
+      slots[ holes ]  = movers
+      where[ movers ] = holes
+      where[ indices ] = -1
+      del slots, where   # <- release the views so _slots can shrink
+      del self._slots[ tailStart: ]
+
+   def exchange( self, members, others ):
+      '''Replace each of members (unique, all of them members) by the
+      corresponding one of others (unique, none of them members), which
+      takes its slot.'''
+      members = np.asarray( members, dtype=np.intc )
+      others  = np.asarray( others, dtype=np.intc )
+      slots = np.frombuffer( self._slots, dtype=np.intc )
+      where = np.frombuffer( self._where, dtype=np.intc )
+      pos   = where[ members ]
+      slots[ pos ]     = others
+      where[ members ] = -1
+      where[ others ]  = pos
+
+
+class ArrayWorld( World ):
+   '''A World whose board is held in two NumPy arrays rather than a
+   list-of-lists of Python objects:
+
+      _codes[row,col]  int8 type code of the occupant (0 = empty)
+      _ids[row,col]    int32 handle of the occupant in _objects (0 = none)
+
+   The public interface is the same as World's, including the free and
+   per-type position indexes.  In addition the whole board can be queried at
+   once (maskOfType(), emptyMask(), emptyPositions(), frontierOf()) as
+   vectorized operations.  Neighborhoods come from the
+   compact tables built by neighborIndexTables(); mooreTable() and
+   vonNeumannTable() expose them as (N,8) and (N,4) arrays for vectorized
+   neighbor gathers over the flattened board.
+
+   The vectorized queries which choose at random (growthSites(),
+   offspringSites()) draw from a NumPy generator seeded with seed, so the
+   world leaves the stream of the random module as World would.'''
+   EMPTY = 0
+   NEIGHBORHOODS = ( '_moore', '_vonNeumann' )
+
+   def __init__( self, numRows, numCols, seed=None ):
+      self._numRows = numRows
+      self._numCols = numCols
+
+      self._codes   = np.zeros( (numRows, numCols), dtype=np.int8 )
+      self._ids     = np.zeros( (numRows, numCols), dtype=np.int32 )
+      self._initNeighborhoods( )
+
+      self._objects      = [ None ]   # handle -> occupant; handle 0 is reserved for 'no object'
+      self._freeHandles  = [ ]        # handles released by remove() available for reuse
+      self._bulkHandles  = { }        # Map: handle reserved by registerBulkOccupant() -> its type code
+
+      self._typeCodes    = { }        # Map: class -> type code
+      self._codeTypes    = [ None ]   # Map: type code -> class
+      self._matchingCodes = { }       # Map: queried type -> frozenset of type codes of its subclasses
+
+      self._rng          = np.random.default_rng( seed )
+      self._initIndexes( )
+
+   # Specialization of World
+   def _initNeighborhoods( self ):
+      self._moore, self._vonNeumann = neighborIndexTables( self._numRows, self._numCols )
+
+   def _initIndexes( self ):
+      World._initIndexes( self )
+      self._free = BulkSlotSet( self._numRows * self._numCols, full=True )   # <- updated in bulk by placeBulk(), etc.
+
+   def setAt( self, r, c, val ):
+      handle = self._ids.item( r, c )
+      if handle in self._bulkHandles:
+         old = None
+         self._free.add( r * self._numCols + c )   # <- the bulk occupant's position is free until val takes it
+      else:
+         old = self._objects[ handle ]
+      self._release( r, c )
+      self._indexChange( r * self._numCols + c, old, val )
+
+      if val is None:
+         return
+
+      if self._freeHandles:
+         handle = self._freeHandles.pop( )
+         self._objects[ handle ] = val
+      else:
+         handle = len(self._objects)
+         self._objects.append( val )
+
+      self._codes[r, c] = self.typeCode( type(val) )
+      self._ids[r, c]   = handle
+
+   def getAt( self, r, c ):
+      return self._objects[ self._ids.item(r, c) ]
+
+   def remove( self, r, c, what ):
+      self.setAt( r, c, None )
+
+   def moveTo( self, oldR, oldC, newR, newC ):
+      handle = self._ids[oldR, oldC]
+      self._codes[newR, newC] = self._codes[oldR, oldC]
+      self._ids[newR, newC]   = handle
+      self._codes[oldR, oldC] = ArrayWorld.EMPTY
+      self._ids[oldR, oldC]   = 0
+      self._indexMove( oldR * self._numCols + oldC, newR * self._numCols + newC, self._objects[ handle ] )
+
+   def getPosNeighbor( self, row, col, direction ):
+      '''Return the contents of the neighboring position.'''
+      nRow,nCol = self.relativePos( row, col, direction )
+      return nRow, nCol, self.getAt( nRow, nCol )
+
+   def randPos( self ):
+      # Return a cell x, y at random
+      row = randint( 0, self._numRows - 1 )
+      col = randint( 0, self._numCols - 1 )
+      return ( row, col, self.getAt( row, col ) )
+
+   def relativePos( self, row, col, direction ):
+      nIdx = self._moore[ (row * self._numCols + col) * 8 + DIR_NUMBER[direction] ]
+      return divmod( nIdx, self._numCols )
+
+   def relativePosNeighbor( self, row, col, direction ):
+      nRow,nCol = self.relativePos( row, col, direction )
+      return nRow,nCol,self.getAt( nRow, nCol )
+
+   def neighborsOf( self, row, col ):
+      return self.neighborsOfIn( row, col, ALL_DIRECTIONS )
+
+   def cNeighborsOf( self, row, col ):
+      return self.neighborsOfIn( row, col, DIRECTIONS )
+
+   def neighborsOfIn( self, row, col, dirSet=DIRECTIONS ):
+      result = { }
+      for direction in dirSet:
+         nRow,nCol = self.relativePos( row, col, direction )
+         result[direction] = nRow, nCol, self.getAt( nRow, nCol )
+      return result
+
+   def neighborsOfType( self, row, col, aType ):
+      '''Return a list of the objects of type aType in the 8 neighboring
+      positions.'''
+      return self.neighborsOfTypeIn( row, col, aType, ALL_DIRECTIONS )
+
+   def cNeighborsOfType( self, r, c, aType ):
+      '''Return a list of the objects of type aType in the 4 neighboring
+      positions.'''
+      return self.neighborsOfTypeIn( r, c, aType, DIRECTIONS )
+
+   def neighborsOfTypeIn( self, row, col, aType, dirSet=DIRECTIONS ):
+      '''Return a list of the objects of type aType in the neighboring
+      positions named in dirSet.'''
+      codes  = self._codesMatching( aType )
+      result = [ ]
+      for direction in dirSet:
+         nRow,nCol = self.relativePos( row, col, direction )
+         if self._codes[nRow, nCol] in codes:
+            result.append( self.getAt( nRow, nCol ) )
+      return result
+
+   def emptyNeighbors( self, r, c ):
+      return self.emptyNeighborsIn( r, c, ALL_DIRECTIONS )
+
+   def emptyCNeighbors( self, row, col ):
+      return self.emptyNeighborsIn( row, col, DIRECTIONS )
+
+   def emptyNeighborsIn( self, row, col, dirSet=ALL_DIRECTIONS ):
+      result = [ ]
+      for direction in dirSet:
+         nRow,nCol = self.relativePos( row, col, direction )
+         if self._codes[nRow, nCol] == ArrayWorld.EMPTY:
+            result.append( (nRow,nCol) )
+      return result
+
+   def newPos( self, row, col, direction, distance ):
+      if 0 <= distance <= 2:
+         dRow,dCol = World.DELTAS[ direction ]
+         return (row + distance*dRow) % self._numRows, (col + distance*dCol) % self._numCols
+      else:
+         pass # error
+
+   # Whole-board queries
+   def typeCode( self, aType ):
+      '''Return the type code used on the board for instances of aType,
+      registering aType if it hasn't been seen before.'''
+      try:
+         return self._typeCodes[ aType ]
+      except KeyError:
+         code = len(self._codeTypes)
+         if code > np.iinfo( self._codes.dtype ).max:
+            raise Exception( 'Too many object types for this board.' )
+
+         self._typeCodes[ aType ] = code
+         self._codeTypes.append( aType )
+         self._matchingCodes.clear( )
+         return code
+
+   def maskOfType( self, aType ):
+      '''Return a boolean array (numRows x numCols) which is True wherever
+      the board holds an instance of aType (or a subclass).'''
+      return np.isin( self._codes, self.typeCodesOf(aType) )
+
+   def typeCodesOf( self, aType ):
+      '''Return an array of the type codes of aType and its subclasses.'''
+      return np.array( sorted(self._codesMatching(aType)), dtype=self._codes.dtype )
+
+   def emptyMask( self ):
+      return self._codes == ArrayWorld.EMPTY
+
+   def emptyPositions( self ):
+      '''Return (rows, cols) index arrays of all the empty positions.'''
+      return np.nonzero( self._codes == ArrayWorld.EMPTY )
+
+   def mooreTable( self ):
+      '''Return the (N,8) array of linear indices of each position's Moore
+      neighbors, columns ordered as DIR_N .. DIR_NW.'''
+      return np.frombuffer( self._moore, dtype=np.intc ).reshape( -1, 8 )
+
+   def vonNeumannTable( self ):
+      '''Return the (N,4) array of linear indices of each position's Von
+      Neumann neighbors, columns ordered as CDIR_N .. CDIR_W.'''
+      return np.frombuffer( self._vonNeumann, dtype=np.intc ).reshape( -1, 4 )
+
+   def occupiedCount( self ):
+      return int( np.count_nonzero(self._codes) )
+
+   def frontierOf( self, aType ):
+      '''Return (rows, cols, counts) arrays of the empty positions which have
+      an instance of aType among their 4 neighbors, and how many they have.'''
+      mask   = self.maskOfType( aType ).astype( np.int8 )
+      counts = ( np.roll(mask, 1, axis=0) + np.roll(mask, -1, axis=0) +
+                 np.roll(mask, 1, axis=1) + np.roll(mask, -1, axis=1) )
+      counts[ self._codes != ArrayWorld.EMPTY ] = 0
+      rows, cols = np.nonzero( counts )
+      return rows, cols, counts[ rows, cols ]
+
+   def growthSites( self, aType, probability, quota ):
+      '''Return a list of up to quota (row,col) frontier positions of aType
+      (see frontierOf()) chosen for growth.  Each neighbor of type aType
+      gives a position an independent chance, probability, to be chosen;
+      if more than quota are chosen, quota of them are kept at random.'''
+      rows, cols, counts = self.frontierOf( aType )
+      if (len(rows) == 0) or (quota <= 0):
+         return [ ]
+
+      # u / P(chosen) is < 1 for exactly the chosen positions, and uniform among them
+      chance = 1.0 - (1.0 - probability) ** counts
+      keys   = self._rng.random( len(rows) ) / chance
+      chosen = np.flatnonzero( keys < 1.0 )
+      if len(chosen) > quota:
+         chosen = chosen[ np.argpartition(keys[chosen], quota - 1)[:quota] ]
+
+      return list( zip(rows[chosen].tolist(), cols[chosen].tolist()) )
+
+   def offspringSites( self, parents, probability, quota ):
+      '''Return a list of up to quota (row,col) positions, each grown into by
+      one of parents (linear indices, in the order they are tried).  A parent
+      tries its empty Von Neumann neighbors in turn, each with the chance
+      probability, and grows into the first which succeeds, so it grows at
+      most once.  A position chosen by several parents goes to the first of
+      them; the others try again.'''
+      codes   = self._codes.reshape( -1 )
+      table   = self.vonNeumannTable( )
+      taken   = np.zeros( len(codes), dtype=bool )   # <- positions grown into so far
+      parents = np.asarray( parents, dtype=np.intp )
+      sites   = [ ]
+      while len(parents) and (quota > 0):
+         nbrs  = np.take( table, parents, axis=0 )
+         grows = (np.take( codes, nbrs ) == ArrayWorld.EMPTY) & ~taken[ nbrs ] & \
+                 (self._rng.random( nbrs.shape ) < probability)
+         growing = grows.any( axis=1 )
+         parents, nbrs, grows = parents[growing], nbrs[growing], grows[growing]
+         if len(parents) == 0:
+            break
+
+         spot  = nbrs[ np.arange(len(parents)), grows.argmax(axis=1) ]   # <- first neighbor which succeeded
+         first = np.sort( np.unique( spot, return_index=True )[1] )[ :quota ]
+         taken[ spot[first] ] = True
+         sites.append( spot[first] )
+         quota  -= len(first)
+         parents = np.delete( parents, first )
+
+      if not sites:
+         return [ ]
+
+      rows, cols = np.divmod( np.concatenate(sites), self._numCols )
+      return list( zip(rows.tolist(), cols.tolist()) )
+
+   def flatCodes( self ):
+      '''Return the type code array as a flat (N,) view indexed by linear
+      index (row * numCols + col).'''
+      return self._codes.reshape( -1 )
+
+   # Bulk occupants
+   def registerBulkOccupant( self, placeholder ):
+      '''Reserve a handle for occupants placed in bulk by placeBulk() and
+      return it.  getAt() answers placeholder at each of their positions.
+
+      Bulk occupants are held only in the arrays and the free index:  they
+      are not entered in the per-type indexes.'''
+      handle = len(self._objects)
+      self._objects.append( placeholder )
+      self._bulkHandles[ handle ] = self.typeCode( type(placeholder) )
+      return handle
+
+   def placeBulk( self, indices, handle ):
+      '''Occupy each of the empty linear indices with the bulk occupant
+      handle.'''
+      self._codes.reshape( -1 )[ indices ] = self._bulkHandles[ handle ]
+      self._ids.reshape( -1 )[ indices ]   = handle
+      self._free.discardAll( indices )
+
+   def clearBulk( self, indices ):
+      '''Empty each of the linear indices, which must hold bulk occupants.'''
+      self._codes.reshape( -1 )[ indices ] = ArrayWorld.EMPTY
+      self._ids.reshape( -1 )[ indices ]   = 0
+      self._free.addAll( indices )
+
+   def moveBulk( self, oldIndices, newIndices ):
+      '''Move the bulk occupants at oldIndices to the empty newIndices.'''
+      codes = self._codes.reshape( -1 )
+      ids   = self._ids.reshape( -1 )
+      codes[ newIndices ] = codes[ oldIndices ]
+      ids[ newIndices ]   = ids[ oldIndices ]
+      codes[ oldIndices ] = ArrayWorld.EMPTY
+      ids[ oldIndices ]   = 0
+      self._free.exchange( newIndices, oldIndices )
+
+   def _codesMatching( self, aType ):
+      try:
+         return self._matchingCodes[ aType ]
+      except KeyError:
+         codes = frozenset( code for code,cls in enumerate(self._codeTypes)
+                            if (cls is not None) and issubclass(cls, aType) )
+         self._matchingCodes[ aType ] = codes
+         return codes
+
+   def _release( self, r, c ):
+      handle = self._ids.item( r, c )
+      if (handle != 0) and (handle not in self._bulkHandles):
+         self._objects[ handle ] = None
+         self._freeHandles.append( handle )
+
+      self._codes[r, c] = ArrayWorld.EMPTY
+      self._ids[r, c]   = 0
@@ -0,0 +1,327 @@
+from SimpleCellSim import *
+from ArrayWorld import ArrayWorld
+from CellSim import CDIR_N, CDIR_E, CDIR_S, CDIR_W
+from PackedGenome import PackedGenome
+import numpy as np
+import Params
+
+
+def anyPerRow( mask ):
+   '''Return mask.any(axis=1) for a bool array of 4 or 8 columns (Von
+   Neumann or Moore neighborhoods), reading each row as a single int.'''
+   mask = np.ascontiguousarray( mask )
+   return mask.view( np.uint32 if mask.shape[1] == 4 else np.uint64 ).reshape( -1 ) != 0
+
+def firstClaims( positions, size ):
+   '''Return the ascending indices into positions (linear indices below
+   size) of the first occurrence of each distinct position.  Only the
+   contested positions are sorted.'''
+   contested = np.bincount( positions, minlength=size )[ positions ] > 1
+   if not contested.any( ):
+      return np.arange( len(positions) )
+
+   claims = np.flatnonzero( contested )
+   keep   = ~contested
+   keep[ claims[ np.unique( positions[claims], return_index=True )[1] ] ] = True
+   return np.flatnonzero( keep )
+
+
+class CellPopulation( Model ):
+   '''A batched alternative to a population of SimpleCell models.
+
+   Rather than one Model per cell, the state of every cell is held in
+   parallel NumPy arrays (energy, age, genome state, position, generation
+   and genes) and the whole population advances one tick per call to tick()
+   through vectorized die/eat/clone/move phases.  The rules are those of
+   SimpleCell.tick().  Where cells contend for the same plant cell or
+   birthplace, the cell earliest in the arrays wins, as it would have ticked
+   first, and the others choose again; of cells moving to the same position
+   only the first moves.  A cell too well fed to move which is refused a
+   clone by MAX_CELL_POPULATION moves instead, as a SimpleCell does.
+
+   Unlike SimpleCells, which tick one after another, the cells of a batch
+   all see the board as it was before any of them moved: a cell can't move
+   into a position vacated by another earlier in the same tick.  Daughters are treated as SimpleCell daughters are
+   under the simulation's update policy: with IMMEDIATE they tick after the
+   cells already present, with DEFERRED they first tick on the next tick.
+
+   Positions are linear indices (row * numCols + col) into an ArrayWorld
+   on which the cells are bulk occupants: getAt() answers this model for
+   each of their positions.  The population must be added to a simulation
+   with an EcologyContext before any cells are added to it.
+
+   The population works on views of the world's arrays, which pickling
+   can't preserve:  they're left out when it's pickled and taken again
+   from the world on the first tick after it's unpickled.'''
+   WORLD_VIEWS = ( '_codes', '_vonNeumann', '_moore' )
+   GENE_DIRECTION = { 'N':CDIR_N, 'E':CDIR_E, 'S':CDIR_S, 'W':CDIR_W }
+
+   def __init__( self, aWorld, capacity=1024, seed=None ):
+      Model.__init__( self )
+      self._world       = aWorld
+      self._numCols     = aWorld.size( )[1]
+      self._bindWorld( )
+      self._handle      = aWorld.registerBulkOccupant( self )
+      self._rng         = np.random.default_rng( seed )
+
+      # Gene code (index into Params.GENES) -> CDIR_xx, or -1 if the gene doesn't move
+      self._geneDirs    = np.array( [ CellPopulation.GENE_DIRECTION.get(gene, -1) for gene in Params.GENES ], dtype=np.int8 )
+      self._geneCodes   = { gene:code for code,gene in enumerate(Params.GENES) }
+
+      self._size        = 0
+      self._energy      = np.zeros( capacity, dtype=np.int64 )
+      self._age         = np.zeros( capacity, dtype=np.int32 )
+      self._state       = np.zeros( capacity, dtype=np.int16 )   # index of the next gene to express
+      self._pos         = np.zeros( capacity, dtype=np.intp )
+      self._generation  = np.zeros( capacity, dtype=np.int32 )
+      self._genes       = np.zeros( (capacity, Params.GENOME_LENGTH), dtype=np.int8 )
+
+   def __getstate__( self ):
+      state = dict( self.__dict__ )
+      for name in CellPopulation.WORLD_VIEWS:
+         state[ name ] = None
+      return state
+
+   # Specialization of Subscriber
+   def handleMessage( self, aMsg ):
+      pass
+
+   # Specialization of Model
+   def subscriptionTopics( self ):
+      return [ ]
+
+   def tick( self ):
+      if self._size == 0:
+         return
+
+      if self._codes is None:
+         self._bindWorld( )   # <- unpickled
+
+      self._die( )
+
+      # Daughters are ticked as SimpleCell daughters added to the Simulation
+      # mid-tick would be: after the cells already present, or not until the
+      # next tick.
+      immediate = self._sim.policy( ) == Simulation.IMMEDIATE
+      lo, hi = 0, self._size
+      while lo < hi:
+         births = self._step( lo, hi )
+         lo = hi
+         if births is not None:
+            self._append( *births )
+         hi = self._size if immediate else lo
+
+   # Extension
+   def size( self ):
+      return self._size
+
+   def totalEnergy( self ):
+      return int( self._energy[:self._size].sum() )
+
+   def positions( self ):
+      '''Return (rows, cols) arrays of the positions of the living cells.'''
+      return np.divmod( self._pos[:self._size], self._numCols )
+
+   def genomes( self ):
+      '''Return the genes of each living cell as a list of strings.'''
+      return [ ''.join( Params.GENES[code] for code in genes ) for genes in self._genes[:self._size].tolist() ]
+
+   def addCell( self, genes, energy, row, col, generation=0 ):
+      '''Add a cell at the empty position row,col.  genes is a sequence of
+      gene characters (see Params.GENES).'''
+      geneCodes = np.array( [ [ self._geneCodes[gene] for gene in genes ] ], dtype=np.int8 )
+      self._world.placeBulk( [ row * self._numCols + col ], self._handle )
+      self._append( np.array([energy]), np.array([row * self._numCols + col]), np.array([generation]), geneCodes )
+      self._sim.context( ).cellPopulation += 1
+      self._recordCensus( geneCodes, birth=True )
+
+   # Phases
+   def _die( self ):
+      n     = self._size
+      alive = self._energy[:n] > 0
+      if alive.all():
+         return
+
+      self._world.clearBulk( self._pos[:n][ ~alive ] )
+      self._recordCensus( self._genes[:n][ ~alive ], birth=False )
+      self._recordDeaths( self._genes[:n][ ~alive ], self._age[:n][ ~alive ] )
+      for arr in ( self._energy, self._age, self._state, self._pos, self._generation, self._genes ):
+         arr[ :np.count_nonzero(alive) ] = arr[:n][ alive ]
+
+      self._size = int( np.count_nonzero(alive) )
+      self._sim.context( ).cellPopulation -= n - self._size
+
+   def _step( self, lo, hi ):
+      '''Tick the living cells lo..hi-1.  Return their daughters, as arrays
+      (see _clone()) or None.'''
+      self._energy[ lo:hi ] -= Params.ENERGY_PER_MOVE
+      self._sim.context( ).freeEnergy( (hi - lo) * Params.ENERGY_PER_MOVE )
+
+      cells   = np.arange( lo, hi )
+      ate     = self._eat( cells )
+      cloners = self._cloners( cells[ ~ate ] )
+      births, refused = self._clone( cloners )
+      movers  = np.setdiff1d( cells[ ~ate ], cloners, assume_unique=True )
+      if len(refused):
+         movers = np.union1d( movers, refused )   # <- sorted, so earlier cells still win contended positions
+      self._move( movers )
+
+      self._age[ lo:hi ] += 1
+      return births
+
+   def _eat( self, cells ):
+      '''Each of cells with a plant cell among its Von Neumann neighbors eats
+      one of them chosen at random.  Return a mask over cells of those which
+      ate.'''
+      ate        = np.zeros( len(cells), dtype=bool )
+      plantCodes = self._world.typeCodesOf( PlantCell )
+      pending    = np.arange( len(cells) )
+      while len(pending):
+         nbrs    = np.take( self._vonNeumann, self._pos[ cells[pending] ], axis=0 )   # <- take() gathers rows much faster than indexing
+         isPlant = np.isin( np.take(self._codes, nbrs), plantCodes )
+         hungry  = anyPerRow( isPlant )
+         pending, nbrs, isPlant = pending[hungry], nbrs[hungry], isPlant[hungry]
+         if len(pending) == 0:
+            break
+
+         keys = self._rng.random( isPlant.shape )
+         keys[ ~isPlant ] = -1.0
+         food = nbrs[ np.arange(len(pending)), keys.argmax(axis=1) ]
+
+         # The first claimant of each plant cell eats it; the others choose again
+         food, first = np.unique( food, return_index=True )
+         eaters = pending[ first ]
+         gains  = [ self._world.getAt( *divmod(idx, self._numCols) ).feed( ) for idx in food.tolist() ]
+         self._energy[ cells[eaters] ] += gains
+         ate[ eaters ] = True
+         pending = pending[ ~ate[pending] ]
+
+      return ate
+
+   def _cloners( self, cells ):
+      '''Return those of cells which are well fed and mature enough to try
+      to clone.'''
+      return cells[ (self._energy[cells] >= Params.WELL_FED_LEVEL) & (self._age[cells] > Params.MATURITY) ]
+
+   def _clone( self, cells ):
+      '''Each of cells tries to clone into an empty Moore neighbor chosen at
+      random, for as long as the population is below MAX_CELL_POPULATION.
+      Return ( daughters, refused ).  Daughters are placed on the board, but
+      are returned as arrays (energy, pos, generation, genes) to be appended
+      by the caller, or None.  Cells which find no room do nothing more this
+      tick; refused is an array of the cells left once the population limit
+      is reached, which move instead.'''
+      mothers = [ ]
+      targets = [ ]
+      allowed = Params.MAX_CELL_POPULATION - self._sim.context( ).cellPopulation
+      pending = cells
+      while len(pending) and (allowed > 0):
+         nbrs  = np.take( self._moore, self._pos[ pending ], axis=0 )
+         empty = np.take( self._codes, nbrs ) == ArrayWorld.EMPTY
+         roomy = anyPerRow( empty )
+         pending, nbrs, empty = pending[roomy], nbrs[roomy], empty[roomy]
+         if len(pending) == 0:
+            break
+
+         keys = self._rng.random( empty.shape )
+         keys[ ~empty ] = -1.0
+         spot = nbrs[ np.arange(len(pending)), keys.argmax(axis=1) ]
+
+         # The first claimant of each position clones into it; the others choose again
+         first = firstClaims( spot, len(self._codes) )[ :allowed ]
+         self._world.placeBulk( spot[first], self._handle )
+         mothers.append( pending[first] )
+         targets.append( spot[first] )
+         allowed -= len(first)
+         pending = np.delete( pending, first )
+
+      refused = pending if allowed <= 0 else pending[ :0 ]
+      if not mothers:
+         return None, refused
+
+      mothers = np.concatenate( mothers )
+      targets = np.concatenate( targets )
+
+      daughterEnergy = self._energy[ mothers ] // 2
+      self._energy[ mothers ] -= daughterEnergy
+      self._age[ mothers ] = 0
+
+      daughterGenes = self._genes[ mothers ]
+      daughterGenes[ np.arange(len(mothers)), self._rng.integers(0, Params.GENOME_LENGTH, len(mothers)) ] = \
+            self._rng.integers( 0, len(Params.GENES), len(mothers) )
+
+      self._sim.context( ).cellPopulation += len(mothers)
+      self._recordCensus( daughterGenes, birth=True )
+      return ( daughterEnergy, targets, self._generation[ mothers ] + 1, daughterGenes ), refused
+
+   def _move( self, movers ):
+      '''Each of movers expresses its next gene, moving one position if the
+      gene names a direction and that position is empty.'''
+      state = self._state[ movers ]
+      dirs  = self._geneDirs[ np.take(self._genes, movers * Params.GENOME_LENGTH + state) ]
+      self._state[ movers ] = (state + 1) % Params.GENOME_LENGTH
+
+      going  = dirs >= 0
+      movers = movers[ going ]
+      dest   = np.take( self._vonNeumann, self._pos[movers] * 4 + dirs[going] )   # <- flat index of [ pos, dir ]
+
+      free   = np.take( self._codes, dest ) == ArrayWorld.EMPTY
+      movers, dest = movers[ free ], dest[ free ]
+      first  = firstClaims( dest, len(self._codes) )   # <- first claimant of each position moves
+      movers, dest = movers[ first ], dest[ first ]
+
+      self._world.moveBulk( self._pos[ movers ], dest )
+      self._pos[ movers ] = dest
+
+   def _bindWorld( self ):
+      self._codes       = self._world.flatCodes( )
+      self._vonNeumann  = self._world.vonNeumannTable( )
+      self._moore       = self._world.mooreTable( )
+
+   def _recordCensus( self, genes, birth ):
+      '''Record the births (or deaths) of cells with the given rows of gene
+      codes in the context's census, if it has one.'''
+      census = self._sim.context( ).census
+      if census is None:
+         return
+
+      record = census.recordBirth if birth else census.recordDeath
+      for codes in genes.tolist( ):
+         value = 1
+         for code in reversed( codes ):
+            value = (value << PackedGenome.BITS) | code
+         record( PackedGenome(value) )
+
+   def _recordDeaths( self, genes, ages ):
+      '''Record the deaths of cells with the given rows of gene codes and
+      ages in the context's death trackers.'''
+      trackers = self._sim.context( ).deathTrackers
+      if not trackers:
+         return
+
+      now = self._sim.simTime( )
+      for codes, age in zip( genes.tolist(), ages.tolist() ):
+         genome = [ Params.GENES[code] for code in codes ]
+         for tracker in trackers:
+            tracker.recordDeath( now, genome, age )
+
+   def _append( self, energy, pos, generation, genes ):
+      count = len(pos)
+      if self._size + count > len(self._pos):
+         self._reserve( 2 * (self._size + count) )
+
+      new = slice( self._size, self._size + count )
+      self._energy[ new ]     = energy
+      self._age[ new ]        = 0
+      self._state[ new ]      = 0
+      self._pos[ new ]        = pos
+      self._generation[ new ] = generation
+      self._genes[ new ]      = genes
+      self._size += count
+
+   def _reserve( self, capacity ):
+      for name in ( '_energy', '_age', '_state', '_pos', '_generation', '_genes' ):
+         old = getattr( self, name )
+         new = np.zeros( (capacity,) + old.shape[1:], dtype=old.dtype )
+         new[ :self._size ] = old[ :self._size ]
+         setattr( self, name, new )
@@ -1,11 +1,67 @@
 from ModelSim import *
 from random import randint, choice
+from array import array
+from bisect import bisect_right, insort
 
 
 ALL_DIRECTIONS = [ 'N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW' ]
 DIRECTIONS = [ 'N', 'E', 'S', 'W' ]
 
+# Direction enums: the column of each direction in the compact neighbor
+# index tables (see neighborIndexTables()).
+DIR_N, DIR_NE, DIR_E, DIR_SE, DIR_S, DIR_SW, DIR_W, DIR_NW = range( 8 )   # Moore
+CDIR_N, CDIR_E, CDIR_S, CDIR_W = range( 4 )                               # Von Neumann
+DIR_NUMBER = { direction:dirNum for dirNum,direction in enumerate(ALL_DIRECTIONS) }
+
+
+class SlotSet( object ):
+   '''A set of linear board indices (row * numCols + col) in range(capacity)
+   supporting O(1) add, discard, membership and uniform random choice.
+   Members are held densely in _slots; _where maps each index to its
+   position in _slots (-1 if absent) so discard swaps the last member into
+   the hole it leaves.'''
+   def __init__( self, capacity, full=False ):
+      if full:
+         self._slots = array( 'i', range(capacity) )
+         self._where = array( 'i', range(capacity) )
+      else:
+         self._slots = array( 'i' )
+         self._where = array( 'i', [ -1 ] ) * capacity
+
+   def __len__( self ):
+      return len(self._slots)
+
+   def __contains__( self, idx ):
+      return self._where[ idx ] >= 0
+
+   def __iter__( self ):
+      return iter(self._slots)
+
+   def add( self, idx ):
+      if self._where[ idx ] < 0:
+         self._where[ idx ] = len(self._slots)
+         self._slots.append( idx )
+
+   def discard( self, idx ):
+      pos = self._where[ idx ]
+      if pos >= 0:
+         last = self._slots.pop( )
+         if last != idx:
+            self._slots[ pos ] = last
+            self._where[ last ] = pos
+         self._where[ idx ] = -1
+
+   def randomSlot( self ):
+      '''Return a member chosen uniformly at random.  Raises IndexError if
+      the set is empty.'''
+      if not self._slots:
+         raise IndexError( 'SlotSet is empty.' )
+      return self._slots[ randint(0, len(self._slots) - 1) ]
+
 class World( object ):
+   '''The neighborhood tables are derived from the board size alone:  they
+   are left out when a World is pickled and rebuilt (_initNeighborhoods())
+   when it's unpickled.'''
    DELTAS = {
       'N' :  (-1,  0),
       'NE':  (-1, +1),
@@ -16,13 +72,28 @@ class World( object ):
       'W' :  ( 0, -1),
       'NW':  (-1, -1)
       }
+   NEIGHBORHOODS = ( '_neighborhood', '_cneighborhood' )   # attributes built by _initNeighborhoods()
    
    def __init__( self, numRows, numCols ):
       self._numRows = numRows
       self._numCols = numCols
       
       self._locations = [ [ None for col in range(numCols) ] for row in range(numRows) ]
-      
+      self._initIndexes( )
+      self._initNeighborhoods( )
+
+   def __getstate__( self ):
+      state = dict( self.__dict__ )
+      for name in type(self).NEIGHBORHOODS:
+         del state[ name ]
+      return state
+
+   def __setstate__( self, state ):
+      self.__dict__.update( state )
+      self._initNeighborhoods( )
+
+   def _initNeighborhoods( self ):
+      numRows, numCols = self._numRows, self._numCols
       self._neighborhood = [ ]
          # dict of precomputed coords for each of the 8 neighbors such that
          # self._neighborhood[x][y] returns the mapping:
@@ -64,22 +135,32 @@ class World( object ):
             columnVals.append( neighborMap )
          self._cneighborhood.append( columnVals )
 
+   def _initIndexes( self ):
+      self._free     = SlotSet( self._numRows * self._numCols, full=True )   # linear indices of the empty positions
+      self._byType   = { }   # Map: class -> SlotSet of the linear indices of its instances
+      self._matching = { }   # Map: queried type -> tuple of the SlotSets of it and its subclasses
+
    # Extension
    def size( self ):
       return ( self._numRows, self._numCols )
 
    def setAt( self, r, c, val ):
-      self._locations[r][c] = val
+      row = self._locations[r]
+      old = row[c]
+      row[c] = val
+      self._indexChange( r * self._numCols + c, old, val )
 
    def getAt( self, r, c ):
       return self._locations[r][c]
 
    def remove( self, r, c, what ):
-      self._locations[r][c] = None
+      self.setAt( r, c, None )
 
    def moveTo( self, oldR, oldC, newR, newC ):
-      self._locations[newR][newC] = self._locations[oldR][oldC]
+      obj = self._locations[oldR][oldC]
+      self._locations[newR][newC] = obj
       self._locations[oldR][oldC] = None
+      self._indexMove( oldR * self._numCols + oldC, newR * self._numCols + newC, obj )
       
    def getPosNeighbor( self, row, col, direction ):
       '''Return the contents of the neighboring position.'''
@@ -93,38 +174,80 @@ class World( object ):
       return ( row, col, self._locations[row][col] )
    
    def setAtRandomPos( self, anObj, maxAttempts=100 ):
-      attempts = 0
-      row, col, content = self.randPos( )
-      while (content is not None) and (attempts < maxAttempts):
-         row, col, content = self.randPos( )
-         attempts += 1
-      
-      if attempts == maxAttempts:
-         raise Exception( "Can't find a place to locate the new Entity." )
-      
-      self._locations[row][col] = anObj
+      '''Place anObj at an empty position chosen uniformly at random.
+      maxAttempts is retained for compatibility; placement succeeds in
+      constant time whenever any position is free.'''
+      row,col = self.findRandomFreePos( )
+      self.setAt( row, col, anObj )
       
       return row,col
 
    def findRandomFreePos( self, maxAttempts=100 ):
-      row, col, content = self.randPos( )
-      
-      for count in range(maxAttempts):
-         row, col, content = self.randPos( )
-         if content is not None:
-            return row,col
-      
-      raise Exception( "Can't find a place to locate the new Entity." )
+      '''Return the row,col of an empty position chosen uniformly at random.'''
+      try:
+         return divmod( self._free.randomSlot( ), self._numCols )
+      except IndexError:
+         raise Exception( "Can't find a place to locate the new Entity." )
+
+   def freeCount( self ):
+      '''Return the number of empty positions.'''
+      return len(self._free)
 
    def findRandomObjectOfType( self, anObjType, maxAttempts=100 ):
-      row, col, content = self.randPos( )
+      '''Return the row,col of an instance of anObjType chosen uniformly at
+      random from all those on the board.'''
+      count = self.countOfType( anObjType )
+      if count == 0:
+         raise Exception( "Can't find a place to locate the new Entity." )
+
+      pick = randint( 0, count - 1 )
+      for slots in self._slotsMatching( anObjType ):
+         if pick < len(slots):
+            return divmod( slots._slots[ pick ], self._numCols )
+         pick -= len(slots)
+
+   def countOfType( self, aType ):
+      '''Return the number of instances of aType on the board.'''
+      count = 0
+      for slots in self._slotsMatching( aType ):
+         count += len(slots)
+      return count
+
+   def objectsOfType( self, aType ):
+      '''Return a list of all the instances of aType on the board.'''
+      result = [ ]
+      for slots in self._slotsMatching( aType ):
+         for idx in slots:
+            result.append( self.getAt( *divmod(idx, self._numCols) ) )
+      return result
+
+   def objectsOfTypeWithin( self, row, col, radius, aType ):
+      '''Return a list of the instances of aType no more than radius
+      positions (in each of row and col, wrapping at the edges) from row,col.
+      Scans whichever is smaller: the square around row,col or the positions
+      registered for aType.'''
+      numRows, numCols = self._numRows, self._numCols
+      span   = 2 * radius + 1
+      result = [ ]
       
-      for count in range(maxAttempts):
-         row, col, content = self.randPos( )
-         if isinstance(content, anObjType):
-            return row, col
+      if span * span <= self.countOfType( aType ):
+         rows = { (row + dRow) % numRows for dRow in range(-radius, radius + 1) }
+         cols = { (col + dCol) % numCols for dCol in range(-radius, radius + 1) }
+         for nRow in rows:
+            for nCol in cols:
+               contents = self.getAt( nRow, nCol )
+               if isinstance( contents, aType ):
+                  result.append( contents )
+      else:
+         for slots in self._slotsMatching( aType ):
+            for idx in slots:
+               nRow,nCol = divmod( idx, numCols )
+               dRow = abs( nRow - row )
+               dCol = abs( nCol - col )
+               if (min(dRow, numRows - dRow) <= radius) and (min(dCol, numCols - dCol) <= radius):
+                  result.append( self.getAt( nRow, nCol ) )
       
-      raise Exception( "Can't find a place to locate the new Entity." )
+      return result
 
    def relativePos( self, row, col, direction ):
       return self._neighborhood[row][col][direction]
@@ -219,17 +342,252 @@ class World( object ):
 
    def newPos( self, row, col, direction, distance ):
       if 0 <= distance <= 2:
-         nRow,nCol = row,col
-         for ct in range(distance):
-            dRow,dCol = World.DELTAS[ direction ]
-            nRow,nCol = (row+dRow) % self._numRows, (col+dCol) % self._numCols
-         return nRow,nCol
+         dRow,dCol = World.DELTAS[ direction ]
+         return (row + distance*dRow) % self._numRows, (col + distance*dCol) % self._numCols
       else:
          pass # error
 
    def __iter__( self ):
       return WorldIter( self )
 
+   def _slotsMatching( self, aType ):
+      try:
+         return self._matching[ aType ]
+      except KeyError:
+         matching = tuple( slots for cls,slots in self._byType.items() if issubclass(cls, aType) )
+         self._matching[ aType ] = matching
+         return matching
+
+   def _indexChange( self, idx, old, new ):
+      '''Update the free and per-type indexes for position idx whose
+      contents have changed from old to new.'''
+      if old is not None:
+         self._byType[ type(old) ].discard( idx )
+         if new is None:
+            self._free.add( idx )
+      
+      if new is not None:
+         try:
+            self._byType[ type(new) ].add( idx )
+         except KeyError:
+            slots = SlotSet( self._numRows * self._numCols )
+            slots.add( idx )
+            self._byType[ type(new) ] = slots
+            self._matching.clear( )
+         
+         if old is None:
+            self._free.discard( idx )
+
+   def _indexMove( self, oldIdx, newIdx, obj ):
+      '''Update the free and per-type indexes for obj having moved from
+      position oldIdx to the empty position newIdx.'''
+      self._free.add( oldIdx )
+      self._free.discard( newIdx )
+      
+      slots = self._byType[ type(obj) ]
+      slots.discard( oldIdx )
+      slots.add( newIdx )
+
+
+def neighborIndexTables( numRows, numCols ):
+   '''Return the precomputed neighbor tables of a numRows x numCols board
+   as two flat array('i') of linear indices (row * numCols + col):
+      moore       shaped (N, 8) - moore[ idx*8 + DIR_xx ]
+      vonNeumann  shaped (N, 4) - vonNeumann[ idx*4 + CDIR_xx ]'''
+   size       = numRows * numCols
+   moore      = array( 'i', [ 0 ] ) * (size * 8)
+   vonNeumann = array( 'i', [ 0 ] ) * (size * 4)
+
+   for dirNum, direction in enumerate( ALL_DIRECTIONS ):
+      dRow,dCol = World.DELTAS[ direction ]
+      nCols  = [ (colNum + dCol) % numCols for colNum in range(numCols) ]
+      column = array( 'i' )
+      for rowNum in range(numRows):
+         base = ((rowNum + dRow) % numRows) * numCols
+         column.extend( [ base + nCol for nCol in nCols ] )
+
+      moore[ dirNum::8 ] = column
+      if direction in DIRECTIONS:
+         vonNeumann[ DIRECTIONS.index(direction)::4 ] = column
+
+   return moore, vonNeumann
+
+
+class CompactWorld( World ):
+   '''A World which holds its board as a flat list indexed by
+   row * numCols + col, and its neighborhoods as the compact tables built by
+   neighborIndexTables() rather than per-position dicts.  Construction time
+   and memory are a small fraction of World's on large boards.
+
+   The *Index methods are the fast path: they take and return linear
+   indices and avoid building (row,col) tuples.  The methods which return
+   positions take them from _positions, a shared (row,col) tuple for each
+   linear index, rather than divmod-ing each neighbor.'''
+   NEIGHBORHOODS = ( '_moore', '_vonNeumann', '_positions' )
+
+   def __init__( self, numRows, numCols ):
+      self._numRows = numRows
+      self._numCols = numCols
+
+      self._cells   = [ None ] * (numRows * numCols)
+      self._initIndexes( )
+      self._initNeighborhoods( )
+
+   # Specialization of World
+   def _initNeighborhoods( self ):
+      self._moore, self._vonNeumann = neighborIndexTables( self._numRows, self._numCols )
+      self._positions = [ (row, col) for row in range(self._numRows) for col in range(self._numCols) ]   # linear index -> (row,col)
+
+   def setAt( self, r, c, val ):
+      self.setAtIndex( r * self._numCols + c, val )
+
+   def getAt( self, r, c ):
+      return self._cells[ r * self._numCols + c ]
+
+   def remove( self, r, c, what ):
+      self.setAtIndex( r * self._numCols + c, None )
+
+   def moveTo( self, oldR, oldC, newR, newC ):
+      cells  = self._cells
+      oldIdx = oldR * self._numCols + oldC
+      newIdx = newR * self._numCols + newC
+      obj    = cells[ oldIdx ]
+      cells[ newIdx ] = obj
+      cells[ oldIdx ] = None
+      self._indexMove( oldIdx, newIdx, obj )
+
+   def getPosNeighbor( self, row, col, direction ):
+      '''Return the contents of the neighboring position.'''
+      return self.relativePosNeighbor( row, col, direction )
+
+   def randPos( self ):
+      # Return a cell x, y at random
+      row = randint( 0, self._numRows - 1 )
+      col = randint( 0, self._numCols - 1 )
+      return ( row, col, self._cells[ row * self._numCols + col ] )
+
+   def relativePos( self, row, col, direction ):
+      return self._positions[ self._moore[ (row * self._numCols + col) * 8 + DIR_NUMBER[direction] ] ]
+
+   def relativePosNeighbor( self, row, col, direction ):
+      nIdx = self._moore[ (row * self._numCols + col) * 8 + DIR_NUMBER[direction] ]
+      nRow,nCol = self._positions[ nIdx ]
+      return nRow,nCol,self._cells[nIdx]
+
+   def neighborsOf( self, row, col ):
+      return self.neighborsOfIn( row, col, ALL_DIRECTIONS )
+
+   def cNeighborsOf( self, row, col ):
+      return self.neighborsOfIn( row, col, DIRECTIONS )
+
+   def neighborsOfIn( self, row, col, dirSet=DIRECTIONS ):
+      result = { }
+      for direction in dirSet:
+         result[direction] = self.relativePosNeighbor( row, col, direction )
+      return result
+
+   def neighborsOfType( self, row, col, aType ):
+      '''Return a list of the objects of type aType in the 8 neighboring
+      positions.'''
+      return self._objectsOfTypeAt( self.neighborIndices(row * self._numCols + col), aType )
+
+   def cNeighborsOfType( self, r, c, aType ):
+      '''Return a list of the objects of type aType in the 4 neighboring
+      positions.'''
+      return self._objectsOfTypeAt( self.cNeighborIndices(r * self._numCols + c), aType )
+
+   def neighborsOfTypeIn( self, row, col, aType, dirSet=DIRECTIONS ):
+      '''Return a list of the objects of type aType in the neighboring
+      positions named in dirSet.'''
+      base = (row * self._numCols + col) * 8
+      return self._objectsOfTypeAt( [ self._moore[ base + DIR_NUMBER[direction] ] for direction in dirSet ], aType )
+
+   def emptyNeighbors( self, r, c ):
+      cells     = self._cells
+      positions = self._positions
+      base      = (r * self._numCols + c) * 8
+      result    = [ ]
+      for nIdx in self._moore[ base:base + 8 ]:   # <- a plain loop; a comprehension costs more than World's dict walk
+         if cells[ nIdx ] is None:
+            result.append( positions[nIdx] )
+      return result
+
+   def emptyCNeighbors( self, row, col ):
+      cells     = self._cells
+      positions = self._positions
+      base      = (row * self._numCols + col) * 4
+      result    = [ ]
+      for nIdx in self._vonNeumann[ base:base + 4 ]:
+         if cells[ nIdx ] is None:
+            result.append( positions[nIdx] )
+      return result
+
+   def emptyNeighborsIn( self, row, col, dirSet=ALL_DIRECTIONS ):
+      result = [ ]
+      for direction in dirSet:
+         nRow,nCol,content = self.relativePosNeighbor( row, col, direction )
+         if content is None:
+            result.append( (nRow,nCol) )
+      return result
+
+   # Extension: linear index fast path
+   def index( self, row, col ):
+      return row * self._numCols + col
+
+   def position( self, idx ):
+      return self._positions[ idx ]
+
+   def getAtIndex( self, idx ):
+      return self._cells[ idx ]
+
+   def setAtIndex( self, idx, val ):
+      old = self._cells[ idx ]
+      self._cells[ idx ] = val
+      self._indexChange( idx, old, val )
+
+   def neighborIndex( self, idx, dirNum ):
+      '''dirNum is one of DIR_N .. DIR_NW.'''
+      return self._moore[ idx * 8 + dirNum ]
+
+   def cNeighborIndex( self, idx, cDirNum ):
+      '''cDirNum is one of CDIR_N .. CDIR_W.'''
+      return self._vonNeumann[ idx * 4 + cDirNum ]
+
+   def neighborIndices( self, idx ):
+      base = idx * 8
+      return self._moore[ base:base + 8 ]
+
+   def cNeighborIndices( self, idx ):
+      base = idx * 4
+      return self._vonNeumann[ base:base + 4 ]
+
+   def emptyNeighborIndices( self, idx ):
+      cells  = self._cells
+      base   = idx * 8
+      result = [ ]
+      for nIdx in self._moore[ base:base + 8 ]:
+         if cells[ nIdx ] is None:
+            result.append( nIdx )
+      return result
+
+   def emptyCNeighborIndices( self, idx ):
+      cells  = self._cells
+      base   = idx * 4
+      result = [ ]
+      for nIdx in self._vonNeumann[ base:base + 4 ]:
+         if cells[ nIdx ] is None:
+            result.append( nIdx )
+      return result
+
+   def _objectsOfTypeAt( self, indices, aType ):
+      cells  = self._cells
+      result = [ ]
+      for nIdx in indices:
+         contents = cells[ nIdx ]
+         if isinstance( contents, aType ):
+            result.append( contents )
+      return result
+
 
 class WorldIter( object ):
    def __init__( self, aWorld ):
@@ -280,35 +638,66 @@ class WorldObject( Model ):
 
 
 class Monitor( Model ):
-   def __init__( self, aWorld ):
+   '''Prints the messages it's subscribed to and, once per tick as the
+   simulation's EventLog is flushed, the events recorded during the tick.
+   Given countTypes, it also prints the number of each on the world every
+   tick.'''
+   def __init__( self, aWorld, countTypes=( ) ):
       Model.__init__( self, 'Monitor' )
       self._world = aWorld
+      self._countTypes = tuple( countTypes )
       self._msgs = [ ]
 
    # Specialization of Subscriber
    def handleMessage( self, aMsg ):
       print( aMsg )
 
+   # Consumer of the EventLog
+   def handleEvents( self, batch ):
+      events   = self._sim.events( )
+      interned = [ field in batch.interned for field in batch.fields ]
+      for record in batch:
+         values = [ events.value(val) if isCode else val for isCode,val in zip(interned, record) ]
+         result = '[{0:05}] {1:10}: sender=\'{2}\''.format( values[0], batch.topic, values[1] )
+         for field,val in zip( batch.fields[2:], values[2:] ):
+            result += '; {0}={1}'.format( field, val )
+         print( result )
+
    # Specialization of Model
    def subscriptionTopics( self ):
       return [ '*' ]
 
+   def _addedToSimulation( self, aSimulation ):
+      Model._addedToSimulation( self, aSimulation )
+      aSimulation.events( ).subscribe( self, '*' )
+
+   def _droppedFromSimulation( self, aSimulation ):
+      aSimulation.events( ).unsubscribe( self, '*' )
+
+   def tickPeriod( self ):
+      return 1 if self._countTypes else None   # <- otherwise only handles messages and events; never ticked
+
    def tick( self ):
-      pass
+      result = '[{0:05}] {1:10}:'.format( self._sim.simTime(), 'count' )
+      for aType in self._countTypes:
+         result += ' {0}={1}'.format( aType.__name__, self._world.countOfType(aType) )
+      print( result )
    
 
 class SpeciesGenome( object ):
-   NEXT_GENOME_ID = 0
-
+   '''Members alive at a past time are counted from the sorted lists of
+   the members' birth and death times:  those born by then, less those
+   who had died by then.'''
    def __init__( self, parentSpeciesId=None ):
-      self._speciesId        = SpeciesGenome.NEXT_GENOME_ID
+      self._speciesId        = None               # assigned by the SpeciesTree recording the genome
       self._parentSpeciesId  = parentSpeciesId
+      self._tree             = None               # the SpeciesTree recording the genome
       self._birthTime        = None               # simTime first individual is born
       self._deathTime        = None               # simTime last individual dies
-      self._living           = [ ]                # currently living individuals
+      self._living           = set( )             # idents of the currently living individuals
       self._memberHistory    = { }                # entityID mapped to [ birth time, death time ]
-      
-      SpeciesGenome.NEXT_GENOME_ID += 1
+      self._births           = [ ]                # sorted birth times of the members
+      self._deaths           = [ ]                # sorted death times of the dead members
    
    # Extension
    def ident( self ):
@@ -321,30 +710,29 @@ class SpeciesGenome( object ):
       if aSimTime is None:
          return len(self._living)
       else:
-         count = 0
-         for entId,dates in self._memberHistory.items():
-            if dates[1] is None:
-               if dates[0] <= aSimTime:
-                  count += 1
-            else:
-               if dates[0] <= aSimTime < dates[1]:
-                  count += 1
-         return count
+         return aliveAt( self._births, self._deaths, aSimTime )
    
    def totalMembers( self ):
       return len( self._memberHistory )
 
    def recordBirth( self, child ):
-      self._living.append( child.ident() )
-      self._memberHistory[ child.ident() ] = [ child.birthTime(), None ]
+      birthTime = child.birthTime( )
+      self._living.add( child.ident() )
+      self._memberHistory[ child.ident() ] = [ birthTime, None ]
+      recordTime( self._births, birthTime )
       if self._birthTime is None:
-         self._birthTime = child.birthTime( )
+         self._birthTime = birthTime
+      if self._tree is not None:
+         self._tree._recordBirth( birthTime )
 
    def recordDeath( self, entity ):
       self._deathTime = entity._sim.simTime( )
       
       self._living.remove( entity.ident() )
       self._memberHistory[ entity.ident() ][ 1 ] = self._deathTime
+      recordTime( self._deaths, self._deathTime )
+      if self._tree is not None:
+         self._tree._recordDeath( self._deathTime )
 
    # Interface
    def genes( self ):
@@ -355,13 +743,25 @@ class SpeciesGenome( object ):
 
 
 class SpeciesTree( object ):
+   '''Keeps a count of the living members of all its species, and sorted
+   birth and death times of them all (see SpeciesGenome), so neither
+   counting the living now or at a past time visits every species.'''
    def __init__( self ):
-      self._species = { }                # speciesID to SpeciesGenome
+      self._species       = { }          # speciesID to SpeciesGenome
+      self._nextSpeciesId = 0
+      self._livingCount   = 0            # living members of all species
+      self._births        = [ ]          # sorted birth times of the members of all species
+      self._deaths        = [ ]          # sorted death times of the dead members of all species
    
    # Extension
    def recordNewSpecies( self, genome ):
+      if genome._speciesId is None:
+         genome._speciesId = self._nextSpeciesId
+         self._nextSpeciesId += 1
+      
       childSpeciesId = genome.ident()
       self._species[ childSpeciesId ] = genome
+      genome._tree = self
 
    def deriveNewSpecies( self, parentGenome  ):
       parentSpeciesId = parentGenome.ident()
@@ -376,17 +776,45 @@ class SpeciesTree( object ):
       return self._species[ speciesId ]
 
    def entitiesAliveAt( self, aSimTime=None ):
-      count = 0
-      for ident,info in self._species.items():
-         count += info.membersAliveAt( aSimTime )
-      return count
+      if aSimTime is None:
+         return self._livingCount
+      else:
+         return aliveAt( self._births, self._deaths, aSimTime )
+
+   def _recordBirth( self, birthTime ):
+      self._livingCount += 1
+      recordTime( self._births, birthTime )
+
+   def _recordDeath( self, deathTime ):
+      self._livingCount -= 1
+      recordTime( self._deaths, deathTime )
+
+
+def recordTime( times, aSimTime ):
+   '''Add aSimTime to the sorted list times.  Times are recorded in order as
+   the simulation runs, so this is almost always an append.'''
+   if times and (aSimTime < times[-1]):
+      insort( times, aSimTime )
+   else:
+      times.append( aSimTime )
+
+def aliveAt( births, deaths, aSimTime ):
+   '''Return the number alive at aSimTime (born at or before it and not
+   dead at or before it) given the sorted lists of birth and death times.'''
+   return bisect_right( births, aSimTime ) - bisect_right( deaths, aSimTime )
+
+
+class CellSimContext( SimContext ):
+   '''SimContext of a simulation of Cells.'''
+   def __init__( self ):
+      SimContext.__init__( self )
+      self.cellPopulation = 0      # Number of living cells
+      self.census         = None   # Census the cells record their births and deaths in, if any
+      self.deathTrackers  = [ ]    # AgeAtDeathTrackers (see StatsLog) the cells record their deaths in
 
 
 class Cell( WorldObject ):
-   POPULATION = 0
-   R_tracker = { 0:[0,0,0], 1:[0,0,0], 2:[0,0,0], 3:[0,0,0], 4:[0,0,0], 5:[0,0,0], 6:[0,0,0], 7:[0,0,0], 8:[0,0,0] }   
-   N_tracker = { 0:[0,0,0], 1:[0,0,0], 2:[0,0,0], 3:[0,0,0], 4:[0,0,0], 5:[0,0,0], 6:[0,0,0], 7:[0,0,0], 8:[0,0,0] }   
-   
+   '''A Cell must be added to a Simulation whose context is a CellSimContext.'''
    def __init__( self, aWorld, generation=0, ident=None, energy=0, row=None, col=None ):
       self._birthTime       = 0
       self._age             = 0
@@ -394,8 +822,6 @@ class Cell( WorldObject ):
       self._store           = energy
       self._lastMove        = '_'
       WorldObject.__init__( self, aWorld, row, col, ident )
-      
-      Cell.POPULATION += 1
 
    # Specialization of Subscriber   
    def handleMessage( self, aMsg ):
@@ -408,6 +834,10 @@ class Cell( WorldObject ):
    def _addedToSimulation( self, aSimulation ):
       WorldObject._addedToSimulation( self, aSimulation )
       self._birthTime = self._sim.simTime( )
+      context = self._sim.context( )
+      context.cellPopulation += 1
+      if (context.census is not None) and (self.genome() is not None):
+         context.census.recordBirth( self.genome() )
 
    def tick( self ):
       if self._store <= 0:
@@ -426,6 +856,12 @@ class Cell( WorldObject ):
 
    def storedEnergy( self ):
       return self._store
+
+   def genome( self ):
+      '''Return the cell's genome, as recorded by a Census, or None for a
+      cell which has none to record; such cells are left out of the census
+      and the age at death tallies.'''
+      return None
    
    def _behavior_clone( self ):
       # Determine where to place the daughter cell
@@ -449,35 +885,19 @@ class Cell( WorldObject ):
 
    def _behavior_die( self, reason=None ):
       # Adjust the population
-      Cell.POPULATION -= 1
+      context = self._sim.context( )
+      context.cellPopulation -= 1
+      if (context.census is not None) and (self.genome() is not None):
+         context.census.recordDeath( self.genome() )
+
+      # Tally the age at death by gene count
+      if context.deathTrackers and (self.genome() is not None):
+         for tracker in context.deathTrackers:
+            tracker.recordDeath( self._sim.simTime(), self.genome(), self._age )
       
       # Remove the entity model from the simulation, and free the obj
       self._world.remove( self._r, self._c, self )
       self._sim.drop(self)
-      
-      # Perform analysis:
-      # For n occurrences of a given gene in a cell's genetic code, compute:
-      #    - tally of such cells died so far
-      #    - Total of age of death for all such cells
-      #    - Average age of death of all such cells
-      
-      #count = self._genes.count('R')
-      #num, totAge, avgAge = Cell.R_tracker[ count ]
-      #num += 1
-      #totAge += self._age
-      #avgAge = totAge / num
-      #Cell.R_tracker[ count ] = [ num, totAge, avgAge ]
-      #print( Cell.R_tracker )
-
-      #count = self._genes.count('N')
-      #num, totAge, avgAge = Cell.N_tracker[ count ]
-      #num += 1
-      #totAge += self._age
-      #avgAge = totAge / num
-      #Cell.N_tracker[ count ] = [ num, totAge, avgAge ]
-      #print( Cell.N_tracker )
-      #if self._age >= 40:
-         #print( '   ', self._age, ':', self._genes )
 
    def _behavior_move( self, direction ):
       # Determine the new Coords and return if already occupied
@@ -527,19 +947,107 @@ class Cell( WorldObject ):
 
 if __name__ == '__main__':
    import timeit
-   
+
+   # Self-check: after random placements, removals and moves (and, on an
+   # ArrayWorld, bulk placements, clearings and moves) the free and
+   # per-type indexes agree with a scan of the board, and every kind of
+   # world gives the same newPos().
+   class Thing( object ):
+      pass
+
+   class Bulk( object ):
+      pass
+
+   class SubThing( Thing ):
+      pass
+
+   class Other( object ):
+      pass
+
+   def checkIndexes( aWorld ):
+      numRows, numCols = aWorld.size( )
+      contents = [ aWorld.getAt( *divmod(idx, numCols) ) for idx in range(numRows * numCols) ]
+      assert aWorld.freeCount( ) == contents.count( None )
+      assert sorted( aWorld._free ) == [ idx for idx,obj in enumerate(contents) if obj is None ]
+      assert all( aWorld._free._where[ idx ] == pos for pos,idx in enumerate(aWorld._free._slots) )
+      if aWorld.freeCount( ) > 0:
+         assert aWorld.getAt( *aWorld.findRandomFreePos() ) is None
+      for aType in ( Thing, SubThing, Other ):
+         instances = [ obj for obj in contents if isinstance(obj, aType) ]
+         assert aWorld.countOfType( aType ) == len(instances)
+         assert sorted( map(id, aWorld.objectsOfType(aType)) ) == sorted( map(id, instances) )
+         if instances:
+            assert isinstance( aWorld.getAt( *aWorld.findRandomObjectOfType(aType) ), aType )
+         else:
+            try:
+               aWorld.findRandomObjectOfType( aType )
+               assert False, 'findRandomObjectOfType() found a missing type'
+            except Exception as ex:
+               assert "Can't find" in str(ex)
+
+   worldClasses = [ World, CompactWorld ]
+   try:
+      from ArrayWorld import ArrayWorld
+      worldClasses.append( ArrayWorld )
+   except ImportError:
+      pass
+
+   for worldClass in worldClasses:
+      w = worldClass( 12, 10 )
+      bulk = w.registerBulkOccupant( Bulk() ) if hasattr( w, 'registerBulkOccupant' ) else None
+      checkIndexes( w )
+      for step in range( 2000 ):
+         row, col, content = w.randPos( )
+         choice = randint( 0, 3 )
+         if (bulk is not None) and (step % 10 == 0):
+            empty  = [ idx for idx in range(120) if w.getAt( *divmod(idx, 10) ) is None ]
+            filled = [ idx for idx in range(120) if isinstance( w.getAt(*divmod(idx, 10)), Bulk ) ]
+            if choice == 0:
+               w.placeBulk( empty[ :randint(0, 5) ], bulk )
+            elif choice == 1:
+               w.clearBulk( filled[ :randint(0, 3) ] )
+            else:
+               numMoving = min( randint(0, 4), len(filled), len(empty) )
+               w.moveBulk( filled[ :numMoving ], empty[ len(empty) - numMoving: ] )
+         elif isinstance( content, Bulk ):
+            w.setAt( row, col, Thing() if choice == 0 else None )
+         elif content is None:
+            if choice == 0:
+               w.setAt( row, col, Thing() )
+            elif choice == 1:
+               w.setAt( row, col, SubThing() )
+            elif choice == 2:
+               w.setAt( row, col, Other() )
+         elif choice == 0:
+            w.remove( row, col, content )
+         elif w.freeCount( ) > 0:
+            w.moveTo( row, col, *w.findRandomFreePos() )
+         if step % 100 == 0:
+            checkIndexes( w )
+      checkIndexes( w )
+      print( worldClass.__name__, 'indexes ok' )
+
+   worlds = [ worldClass( 7, 9 ) for worldClass in worldClasses ]
+   for row in range( 7 ):
+      for col in range( 9 ):
+         for direction in ALL_DIRECTIONS:
+            for distance in range( 3 ):
+               positions = { w.newPos( row, col, direction, distance ) for w in worlds }
+               dRow,dCol = World.DELTAS[ direction ]
+               assert positions == { ((row + distance*dRow) % 7, (col + distance*dCol) % 9) }, positions
+   print( 'newPos ok' )
+
    w = World( 60, 60 )
-   
-   def testOld( ):
-      for ct in range( 100 ):
-         x, y, c = w.randPos( )
-         w.allEmptyNeighbors2( x, y )
-   
-   def testNew( ):
-      for ct in range( 100 ):
-         x, y, c = w.randPos( )
+   cw = CompactWorld( 60, 60 )
+   testPositions = [ w.randPos()[:2] for ct in range( 100 ) ]   # <- the same cells for both, so only emptyNeighbors is timed
+
+   def testWorld( ):
+      for x, y in testPositions:
          w.emptyNeighbors( x, y )
 
-   print( 'New', timeit.timeit( 'testNew( )', setup='from __main__ import testNew', number=1000 ) )
-   print( 'Old', timeit.timeit( 'testOld( )', setup='from __main__ import testOld', number=1000 ) )
-   
+   def testCompact( ):
+      for x, y in testPositions:
+         cw.emptyNeighbors( x, y )
+
+   print( 'World  ', timeit.timeit( 'testWorld( )', setup='from __main__ import testWorld', number=1000 ) )
+   print( 'Compact', timeit.timeit( 'testCompact( )', setup='from __main__ import testCompact', number=1000 ) )
@@ -0,0 +1,123 @@
+from ModelSim import Model
+from heapq import nlargest
+import json
+import Params
+
+
+class Census( Model ):
+   '''Live counts of the cells of a simulation by genotype (PackedGenome)
+   and, for each of Params.GENES, by the number of copies of the gene in
+   a genome.
+
+   The census is kept by the cells rather than by counting them:  once
+   added to a simulation whose context is a CellSimContext, the census is
+   the context's census, and each cell added to or dying in the simulation
+   records its birth or death there.  Each costs a dict update or two,
+   whatever the population, so the census must be added before any cells.
+   Cells without a genome (Cell.genome() is None) aren't counted.
+
+   Every period ticks the census takes a snapshot, a tuple:
+
+      ( time, population, genotypes, top, geneCounts )
+
+   where genotypes is the number of distinct genotypes living, top the
+   topN most common as ( (genome string, count), ... ) and geneCounts a
+   dict: gene -> tuple whose element n is the number of living cells with
+   n copies of the gene.  Snapshots are kept in series() and passed to
+   sink, if given, as they're taken.'''
+   def __init__( self, period=100, topN=10, sink=None ):
+      Model.__init__( self, 'Census' )
+      self._period     = period
+      self._topN       = topN
+      self._sink       = sink
+      self._population = 0
+      self._genotypes  = { }    # Map: PackedGenome -> number of living cells with it
+      self._geneCounts = { gene:[ 0 ] * (Params.GENOME_LENGTH + 1) for gene in Params.GENES }   # see geneCounts()
+      self._profiles   = { }    # Map: PackedGenome -> tuple of its number of copies of each gene (in Params.GENES order)
+      self._series     = [ ]
+
+   # Specialization of Subscriber
+   def handleMessage( self, aMsg ):
+      pass
+
+   # Specialization of Model
+   def subscriptionTopics( self ):
+      return [ ]
+
+   def _addedToSimulation( self, aSimulation ):
+      Model._addedToSimulation( self, aSimulation )
+      aSimulation.context( ).census = self
+
+   def _droppedFromSimulation( self, aSimulation ):
+      if aSimulation.context( ).census is self:
+         aSimulation.context( ).census = None
+
+   def tickPeriod( self ):
+      return self._period
+
+   def tick( self ):
+      snapshot = self.snapshot( )
+      self._series.append( snapshot )
+      if self._sink is not None:
+         self._sink( snapshot )
+
+   # Extension
+   def recordBirth( self, genome, count=1 ):
+      '''Record count births of cells with genome (a PackedGenome).'''
+      self._population += count
+      self._genotypes[ genome ] = self._genotypes.get( genome, 0 ) + count
+      self._tally( genome, count )
+
+   def recordDeath( self, genome, count=1 ):
+      '''Record count deaths of cells with genome.'''
+      self._population -= count
+      living = self._genotypes[ genome ] - count
+      if living:
+         self._genotypes[ genome ] = living
+      else:
+         del self._genotypes[ genome ]
+      self._tally( genome, -count )
+
+   def population( self ):
+      return self._population
+
+   def genotypeCount( self, genome ):
+      return self._genotypes.get( genome, 0 )
+
+   def geneCounts( self, gene ):
+      '''Return a list whose element n is the number of living cells with n
+      copies of gene.'''
+      return list( self._geneCounts[ gene ] )
+
+   def mostCommon( self, n ):
+      '''Return a list of the n most common living genotypes as (genome,
+      count), most common first.'''
+      return nlargest( n, self._genotypes.items(), key=lambda item: item[1] )
+
+   def snapshot( self ):
+      top = tuple( (str(genome), count) for genome,count in self.mostCommon(self._topN) )
+      geneCounts = { gene:tuple(counts) for gene,counts in self._geneCounts.items() }
+      return ( self._sim.simTime(), self._population, len(self._genotypes), top, geneCounts )
+
+   def series( self ):
+      return self._series
+
+   def writeSeries( self, outFile ):
+      '''Write the snapshots taken so far to outFile, one JSON object per
+      line.'''
+      for time, population, genotypes, top, geneCounts in self._series:
+         json.dump( { 'time':time, 'population':population, 'genotypes':genotypes,
+                      'top':top, 'geneCounts':geneCounts }, outFile )
+         outFile.write( '\n' )
+
+   def _tally( self, genome, count ):
+      try:
+         profile = self._profiles[ genome ]
+      except KeyError:
+         genes   = str( genome )
+         profile = tuple( genes.count(gene) for gene in Params.GENES )
+         self._profiles[ genome ] = profile
+
+      for gene,copies in zip( Params.GENES, profile ):
+         self._geneCounts[ gene ][ copies ] += count
+
@@ -0,0 +1,216 @@
+'''Checkpoints of a running simulation.
+
+A checkpoint holds the whole state of a Simulation between ticks: its
+models (and through them the world, the plants, the cells with their
+genomes and energies), its context (the cell population, available energy,
+census, etc.), queued messages and events, together with the state of the
+random module and the values of Params.  NumPy generators (ArrayWorld,
+CellPopulation) are held by the models and saved with them.  Derived tables,
+such as a World's neighborhoods, are rebuilt on restore rather than saved.
+
+The state is pickled and compressed into a file of MAGIC followed by the
+zlib data, written to a temporary file which then replaces the checkpoint,
+so an interrupted save never leaves a broken checkpoint behind.
+
+   saveCheckpoint( filename, aSim )          between ticks
+   aSim, extras = loadCheckpoint( filename )
+
+A Checkpointer added to a simulation saves it every period ticks.  On POSIX
+it forks and the child process writes the checkpoint, so the tick loop is
+held up only for the fork; elsewhere the checkpoint is written in line.'''
+from ModelSim import Model
+import Params
+
+import os
+import pickle
+import random
+import zlib
+
+
+MAGIC = b'EVCHKPT1'
+
+
+def paramsState( ):
+   '''Return a dict of the current values of Params.'''
+   return { name:value for name,value in vars(Params).items() if name.isupper() }
+
+def saveCheckpoint( filename, aSim, level=1, **extras ):
+   '''Write a checkpoint of aSim, which must be between ticks (see
+   Simulation.callBetweenTicks()), to filename.  extras are any other
+   picklable objects to save with it.  level is the zlib compression
+   level.'''
+   if aSim._ticking:
+      raise Exception( 'A simulation can only be checkpointed between ticks.' )
+
+   state = {
+      'sim':    aSim,
+      'random': random.getstate( ),
+      'params': paramsState( ),
+      'extras': extras
+      }
+   data = zlib.compress( pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), level )
+
+   tmpFilename = '{0}.{1}.tmp'.format( filename, os.getpid() )
+   with open( tmpFilename, 'wb' ) as checkpointFile:
+      checkpointFile.write( MAGIC )
+      checkpointFile.write( data )
+   os.replace( tmpFilename, filename )
+
+def loadCheckpoint( filename ):
+   '''Restore the random module and Params as they were when the
+   checkpoint was saved, and return ( the simulation, a dict of the
+   extras ).'''
+   with open( filename, 'rb' ) as checkpointFile:
+      if checkpointFile.read( len(MAGIC) ) != MAGIC:
+         raise Exception( '{0} is not a checkpoint.'.format(filename) )
+      data = checkpointFile.read( )
+
+   state = pickle.loads( zlib.decompress(data) )
+   for name,value in state[ 'params' ].items( ):
+      setattr( Params, name, value )
+   random.setstate( state[ 'random' ] )
+   return state[ 'sim' ], state[ 'extras' ]
+
+
+class Checkpointer( Model ):
+   '''Saves the simulation it's in to filename every period ticks, at the
+   end of the tick.  filename may hold '{time}', replaced by the sim time
+   of the checkpoint, to keep each checkpoint rather than the latest.
+   extras (a dict, which may be added to later) is saved with each
+   checkpoint.
+
+   With background (the default, and POSIX only) a child process writes
+   each checkpoint.  If the previous one is still being written when the
+   next is due, the next is skipped and counted in skipped; children which
+   fail are counted in failures.  wait() waits for the last to finish.'''
+   def __init__( self, filename, period=1000, background=True, level=1, extras=None ):
+      Model.__init__( self, 'Checkpointer' )
+      self._filename   = filename
+      self._period     = period
+      self._background = background and hasattr( os, 'fork' )
+      self._level      = level
+      self.extras      = extras if extras is not None else { }
+      self._child      = None   # pid of the process writing the last checkpoint
+      self.saved       = 0      # checkpoints started
+      self.skipped     = 0      # checkpoints skipped while the last was being written
+      self.failures    = 0      # background checkpoints which failed
+
+   def __getstate__( self ):
+      state = dict( self.__dict__ )
+      state[ '_child' ] = None   # <- not a child of the restored process
+      return state
+
+   # Specialization of Subscriber
+   def handleMessage( self, aMsg ):
+      pass
+
+   # Specialization of Model
+   def subscriptionTopics( self ):
+      return [ ]
+
+   def _addedToSimulation( self, aSimulation ):
+      Model._addedToSimulation( self, aSimulation )
+      self._firstTime = aSimulation.simTime( ) + self._period
+      aSimulation.callBetweenTicks( self._sleepUntilFirst )   # <- once added during a tick under DEFERRED, it's scheduled at the end of the tick
+
+   def tickPeriod( self ):
+      return self._period
+
+   def tick( self ):
+      self._sim.callBetweenTicks( self.checkpoint )
+
+   # Extension
+   def checkpoint( self ):
+      '''Save the simulation now; it must be between ticks.'''
+      filename = self._filename.format( time=self._sim.simTime() )
+      if not self._background:
+         saveCheckpoint( filename, self._sim, self._level, **self.extras )
+         self.saved += 1
+         return
+
+      if self._reap( block=False ) is not None:
+         self.skipped += 1
+         return
+
+      randomState = random.getstate( )
+      pid = os.fork( )
+      if pid == 0:
+         status = 1
+         try:
+            random.setstate( randomState )   # <- random reseeds itself in a forked child
+            saveCheckpoint( filename, self._sim, self._level, **self.extras )
+            status = 0
+         finally:
+            os._exit( status )   # <- skip the parent's exit handlers and buffers
+
+      self._child = pid
+      self.saved += 1
+
+   def wait( self ):
+      '''Wait for the checkpoint being written, if any, to be finished.'''
+      self._reap( block=True )
+
+   def _sleepUntilFirst( self ):
+      '''Sleep until the tick which ends at the time of the first
+      checkpoint, simTime() + period when added.'''
+      self.sleepUntil( self._firstTime - 1 )
+
+   def _reap( self, block ):
+      '''Collect the child writing the last checkpoint if it has finished (or
+      once it has, if block).  Return its pid if it's still running.'''
+      if self._child is None:
+         return None
+
+      pid, status = os.waitpid( self._child, 0 if block else os.WNOHANG )
+      if pid == 0:
+         return self._child
+
+      if os.waitstatus_to_exitcode( status ) != 0:
+         self.failures += 1
+      self._child = None
+      return None
+
+
+if __name__ == '__main__':
+   # Self-check: a HeadlessSim run checkpointed every period ticks (in the
+   # background where it can fork) ends as a run resumed from any of its
+   # checkpoints does, for either engine.  The checkpoints are written at
+   # exactly the multiples of period.
+   from HeadlessSim import Checkpointer, runHeadless, resumeHeadless   # <- the Checkpoint module's class, not __main__'s, so checkpoints unpickle as they would elsewhere
+   import tempfile
+   import timeit
+
+   FIGURES = ( 'cellPopulation', 'plantPopulation', 'cellEnergy', 'availableEnergy' )
+   ticks, period = 300, 100
+   with tempfile.TemporaryDirectory( ) as tmpDir:
+      for engine in ( 'objects', 'population' ):
+         savedParams = paramsState( )
+         filename = os.path.join( tmpDir, engine + '-{time}.ckpt' )
+         checkpointer = Checkpointer( filename, period=period )
+         straight = runHeadless( ticks, seed=1, engine=engine, checkpointer=checkpointer )
+         assert (checkpointer.saved, checkpointer.skipped, checkpointer.failures) == ( ticks // period, 0, 0 )
+         assert sorted( os.listdir(tmpDir) ) == sorted( '{0}-{1}.ckpt'.format(engine, time) for time in range(period, ticks + 1, period) ), os.listdir( tmpDir )
+
+         for time in range( period, ticks, period ):
+            sim, resumed = resumeHeadless( ticks - time, filename.format(time=time) )
+            assert sim.simTime( ) == ticks
+            assert [ resumed[name] for name in FIGURES ] == [ straight[name] for name in FIGURES ], (engine, time, resumed, straight)
+
+         for name,value in savedParams.items( ):
+            setattr( Params, name, value )
+         for name in os.listdir( tmpDir ):
+            os.remove( os.path.join(tmpDir, name) )
+         print( engine, 'checkpoints ok' )
+
+      checkpointFilename = os.path.join( tmpDir, 'timing.ckpt' )
+      def save( ):
+         saveCheckpoint( checkpointFilename, sim )
+
+      def load( ):
+         loadCheckpoint( checkpointFilename )
+
+      checkpointer = Checkpointer( checkpointFilename, period=ticks, background=False )
+      runHeadless( ticks, seed=1, checkpointer=checkpointer )
+      sim, extras = loadCheckpoint( checkpointFilename )
+      print( 'save', timeit.timeit( 'save()', setup='from __main__ import save', number=10 ) / 10 )
+      print( 'load', timeit.timeit( 'load()', setup='from __main__ import load', number=10 ) / 10 )
@@ -0,0 +1,197 @@
+'''A columnar log of simulation events.
+
+Each topic has fixed-width records of signed 64-bit ints: the tick, the
+sender and the topic's own fields.  The records are packed into a ring
+buffer allocated when the topic is defined, so recording an event builds
+no objects.  Senders, and any other value which isn't an int, are stored as
+codes interned by the log (see code() and value()); a topic names its
+fields which hold codes, so consumers can decode them.  A value which won't
+be recorded again, such as the ident of a dead entity, is released and
+its code reused once the records holding it have been flushed.
+
+Consumers subscribe to topics (or to '*', every topic) and are handed each
+topic's new records once per flush(), as an EventBatch, which is only
+valid during the call.  If
+more records are recorded between flushes than a ring holds, the oldest
+are overwritten and counted as lost.'''
+from array import array
+import struct
+
+
+class EventBatch( object ):
+   '''The records of one topic recorded since the last flush.'''
+   def __init__( self, topicLog, chunks ):
+      self.topic   = topicLog.topic
+      self.fields  = topicLog.fields
+      self.interned = topicLog.interned
+      self._struct = topicLog._struct
+      self._chunks = chunks   # list of memoryviews of the packed records (two if the ring wrapped)
+
+   def __len__( self ):
+      return sum( len(chunk) for chunk in self._chunks ) // self._struct.size
+
+   def __iter__( self ):
+      '''Yield each record as a tuple.'''
+      for chunk in self._chunks:
+         yield from self._struct.iter_unpack( chunk )
+
+   def column( self, field ):
+      '''Return an array of the values of the named field.'''
+      width  = len(self.fields)
+      offset = self.fields.index( field )
+      result = array( 'q' )
+      for chunk in self._chunks:
+         result.extend( chunk.cast('q')[ offset::width ] )
+      return result
+
+
+class TopicLog( object ):
+   def __init__( self, topic, fields, capacity, interned=( ) ):
+      self.topic     = topic
+      self.fields    = ( 'tick', 'sender' ) + tuple(fields)
+      self.interned  = ( 'sender', ) + tuple(interned)   # the fields holding codes interned by the log
+      self._struct   = struct.Struct( '={0}q'.format(len(self.fields)) )
+      self._capacity = capacity
+      self._buffer   = bytearray( capacity * self._struct.size )
+      self._next     = 0   # number of records ever recorded
+      self._read     = 0   # number of records ever flushed (or lost)
+      self._lost     = 0   # number of records overwritten before being flushed
+
+   def append( self, *values ):
+      '''Record an event of tick, sender code and field values.'''
+      self._struct.pack_into( self._buffer, (self._next % self._capacity) * self._struct.size, *values )
+      self._next += 1
+
+   def count( self ):
+      '''Return the number of records waiting to be flushed.'''
+      return min( self._next - self._read, self._capacity )
+
+   def lost( self ):
+      return self._lost + max( self._next - self._read - self._capacity, 0 )
+
+   def _takeBatch( self ):
+      unread = self._next - self._read
+      if unread > self._capacity:
+         self._lost += unread - self._capacity
+         unread = self._capacity
+
+      size  = self._struct.size
+      view  = memoryview( self._buffer )
+      first = (self._next - unread) % self._capacity
+      if first + unread <= self._capacity:
+         chunks = [ view[ first * size:(first + unread) * size ] ]
+      else:
+         chunks = [ view[ first * size: ], view[ :(first + unread - self._capacity) * size ] ]
+
+      self._read = self._next
+      return EventBatch( self, chunks )
+
+
+class EventLog( object ):
+   DEFAULT_CAPACITY = 4096   # records per topic ring
+
+   def __init__( self, capacity=DEFAULT_CAPACITY ):
+      self._capacity    = capacity
+      self._topics      = { }   # Map: topic -> TopicLog
+      self._consumers   = { }   # Map: topic -> list of consumers
+      self._codes       = { }   # Map: interned value -> code
+      self._values      = [ ]   # Map: code -> interned value (None once freed)
+      self._released    = [ ]   # list of the codes to free at the next flush
+      self._free        = [ ]   # list of the freed codes, for reuse
+
+   def defineTopic( self, topic, *fields, interned=( ) ):
+      '''Define topic as having records of the named int fields (after
+      'tick' and 'sender') and return its TopicLog.  interned names those
+      of the fields which hold codes (see code()), as sender does.
+      Defining a topic again with the same fields just returns it.'''
+      for field in interned:
+         if field not in fields:
+            raise Exception( 'Interned field {0} is not a field of topic {1}.'.format(field, topic) )
+
+      try:
+         topicLog = self._topics[ topic ]
+      except KeyError:
+         topicLog = TopicLog( topic, fields, self._capacity, interned )
+         self._topics[ topic ] = topicLog
+         return topicLog
+
+      if (topicLog.fields[2:] != fields) or (topicLog.interned[1:] != tuple(interned)):
+         raise Exception( 'Topic {0} is already defined with fields {1}, interned {2}.'.format(topic, topicLog.fields[2:], topicLog.interned[1:]) )
+      return topicLog
+
+   def topic( self, topic ):
+      '''Return the TopicLog of topic.'''
+      return self._topics[ topic ]
+
+   def hasTopic( self, topic ):
+      return topic in self._topics
+
+   def record( self, topic, tick, sender, *values ):
+      '''Record an event of topic, interning the sender.'''
+      self._topics[ topic ].append( tick, self.code(sender), *values )
+
+   def code( self, aValue ):
+      '''Return the int code interned for aValue (which must be hashable).'''
+      try:
+         return self._codes[ aValue ]
+      except KeyError:
+         pass
+
+      if self._free:
+         code = self._free.pop( )
+         self._values[ code ] = aValue
+      else:
+         code = len(self._values)
+         self._values.append( aValue )
+      self._codes[ aValue ] = code
+      return code
+
+   def release( self, aValue ):
+      '''Free the code of aValue after the next flush, once the records
+      holding it have been handed on; code() may then reuse it.'''
+      code = self._codes.pop( aValue, None )
+      if code is not None:
+         self._released.append( code )
+
+   def value( self, code ):
+      '''Return the value interned as code.'''
+      return self._values[ code ]
+
+   def subscribe( self, aConsumer, *topics ):
+      '''Have aConsumer.handleEvents( batch ) called with the new records of
+      each of topics at every flush.  The topic '*' is every topic.'''
+      for topic in topics:
+         self._consumers.setdefault( topic, [ ] ).append( aConsumer )
+
+   def unsubscribe( self, aConsumer, *topics ):
+      for topic in topics:
+         consumers = self._consumers.get( topic, [ ] )
+         if aConsumer in consumers:
+            consumers.remove( aConsumer )
+
+   def flush( self ):
+      '''Hand each topic's records recorded since the last flush to its
+      consumers, then free the codes released since the last flush.'''
+      everyTopic = self._consumers.get( '*', [ ] )
+      for topic,topicLog in self._topics.items( ):
+         if topicLog._next == topicLog._read:
+            continue
+
+         batch = topicLog._takeBatch( )
+         for consumer in self._consumers.get( topic, [ ] ) + everyTopic:
+            consumer.handleEvents( batch )
+
+      self._freeReleased( )
+
+   def clear( self ):
+      '''Discard the records not yet flushed.'''
+      for topicLog in self._topics.values( ):
+         topicLog._read = topicLog._next
+      self._freeReleased( )
+
+   def _freeReleased( self ):
+      for code in self._released:
+         self._values[ code ] = None
+      self._free.extend( self._released )
+      self._released = [ ]
+
@@ -157,8 +157,7 @@ class WorldViewDriver( World ):
       self._view = view
 
    def setAt( self, row, col, val ):
-      self._locations[row][col] = val
-      #World.setAt( self, row, col, val )
+      World.setAt( self, row, col, val )
       
       if isinstance( val, PlantCell ):
          self._view.add( 'plant', row, col )
@@ -174,8 +173,7 @@ class WorldViewDriver( World ):
       self.setAt( row, col, None )
 
    def moveTo( self, oldRow, oldCol, newRow, newCol ):
-      self._locations[newRow][newCol] = self._locations[oldRow][oldCol]
-      self._locations[oldRow][oldCol] = None
+      World.moveTo( self, oldRow, oldCol, newRow, newCol )
       self._view.moveTo( oldRow, oldCol, newRow, newCol )
    
 
@@ -219,29 +217,13 @@ class EvolutionSimGUI( tk.Frame ):
       self._paramsView.commit( )
       
       # Construct the objects
-      self._sim = Simulation( )
+      self._sim = Simulation( EcologyContext(), Params.UPDATE_POLICY )
       
       self._world = WorldViewDriver( self._worldView, Params.ROWS, Params.COLUMNS )
       self._worldView.reset( )
       
-      # Create Eve
-      Cell.POPULATION = 0
-      eveRow = Params.ROWS // 2
-      eveCol = Params.COLUMNS // 2
-      eve = SimpleCell( self._world, [ c for c in Params.EVE_GENOME] , energy=Params.ENERGY_PER_PLANT_CELL, row=eveRow, col=eveCol )
-      #subChrom = [ EatRandom_BehaviorChromosome( PlantCell ), Clone_BehaviorChromosome( ), Move_BehaviorChromosome( [ c for c in Params.EVE_GENOME] ) ]
-      #masterChrom = CoordinatingChromosome( *subChrom )
-      #eve = CrCell( masterChrom, self._world, energy=Params.ENERGY_PER_PLANT_CELL, row=eveRow, col=eveCol )
-      self._sim.add( eve )
-      
-      # Create food
-      Plant.AVAILABLE_ENERGY = (Params.MAX_PLANT_POPULATION * Params.ENERGY_PER_PLANT_CELL) - (2 * Params.ENERGY_PER_PLANT_CELL)
-      if Params.PLANT_SPECIES == 'Geometric':
-         self._plant = Plant_A( self._world, Params.MAX_PLANT_POPULATION, Params.ENERGY_PER_PLANT_CELL, Params.RAND_GROWTH_FACTOR )
-      elif Params.PLANT_SPECIES == 'Sinuous':
-         self._plant = Plant_D( self._world, Params.MAX_PLANT_POPULATION, Params.ENERGY_PER_PLANT_CELL, Params.RAND_GROWTH_FACTOR )
-      self._plant.startPlant( eveRow + 1, eveRow )
-      self._sim.add( self._plant )
+      # Create Eve and her food
+      self._plant = buildEcology( self._sim, self._world )
       
       self._running = False
    
@@ -263,6 +245,7 @@ class EvolutionSimGUI( tk.Frame ):
 
    def updateAllInfoViews( self ):
       simTime = self._sim.simTime( )
+      context = self._sim.context( )
       
       # Sim Info
       plantPop = self._plant.size()
@@ -274,23 +257,16 @@ class EvolutionSimGUI( tk.Frame ):
          #except:
             #pass   # <-- model is not a Cell
       
-      cellEgy = ((Params.MAX_PLANT_POPULATION - plantPop) * Params.ENERGY_PER_PLANT_CELL) - Plant.AVAILABLE_ENERGY
-      self._simInfoView.updateInfo( simTime, plantPop, Cell.POPULATION, cellEgy, Plant.AVAILABLE_ENERGY )#availEgy )
+      cellEgy = ((Params.MAX_PLANT_POPULATION - plantPop) * Params.ENERGY_PER_PLANT_CELL) - context.availableEnergy
+      self._simInfoView.updateInfo( simTime, plantPop, context.cellPopulation, cellEgy, context.availableEnergy )#availEgy )
       
       # Simulation Control
       self._simControl.updateInfo( simTime )
       
-      self._running = (Cell.POPULATION > 0) and (self._running)
+      self._running = (context.cellPopulation > 0) and (self._running)
 
    def _tickSimulation( self ):
       self._sim.tickAllModelsOnce_NoMessaging( )
-      
-      #simTime = self._sim.simTime()
-      #print( simTime )
-      #if (self._sim.size() == 1) or (simTime == 100000):
-         #print( 'R', Cell.R_tracker )
-         #print( 'N', Cell.N_tracker )
-         #quit( )
       self.updateAllInfoViews()
       
       if self._running:
@@ -319,7 +295,7 @@ class SimpleCellWorldViewProfiler( World ):
       self._view.grid( )
    
    def setAt( self, row, col, val ):
-      self._locations[row][col] = val
+      World.setAt( self, row, col, val )
       
       if isinstance( val, PlantCell ):
          self._view.add( 'plant', row, col )
@@ -335,8 +311,7 @@ class SimpleCellWorldViewProfiler( World ):
       self.setAt( row, col, None )
 
    def moveTo( self, oldRow, oldCol, newRow, newCol ):
-      self._locations[newRow][newCol] = self._locations[oldRow][oldCol]
-      self._locations[oldRow][oldCol] = None
+      World.moveTo( self, oldRow, oldCol, newRow, newCol )
       self._view.moveTo( oldRow, oldCol, newRow, newCol )
 
 def profileSim( showView=True ):
@@ -350,7 +325,7 @@ def profileSim( showView=True ):
    
    top = tk.Tk( )
    
-   sim = Simulation( )
+   sim = Simulation( EcologyContext() )
    
    # Create the View
    if showView:
@@ -368,10 +343,10 @@ def profileSim( showView=True ):
    sim.add( eve )
    
    # Create food
-   Plant.AVAILABLE_ENERGY = (Params.MAX_PLANT_POPULATION * Params.ENERGY_PER_PLANT_CELL) - (2 * Params.ENERGY_PER_PLANT_CELL)
+   sim.context( ).availableEnergy = (Params.MAX_PLANT_POPULATION * Params.ENERGY_PER_PLANT_CELL) - (2 * Params.ENERGY_PER_PLANT_CELL)
    thePlant = Plant_C( world, Params.MAX_PLANT_POPULATION, Params.ENERGY_PER_PLANT_CELL, Params.RAND_GROWTH_FACTOR )
-   thePlant.startPlant( eveRow, eveCol + 1 )
    sim.add( thePlant )
+   thePlant.startPlant( eveRow, eveCol + 1 )
 
    count = 1
    def tickSim( ):
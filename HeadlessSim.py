@@ -0,0 +1,221 @@
+'''Run the SimpleCell ecology without a GUI.
+
+   python HeadlessSim.py [-p PARAMSFILE] [--set NAME=VALUE ...] [-t TICKS]
+                         [-s SEED] [--engine objects|population]
+                         [--world World|CompactWorld|ArrayWorld] [-o OUTFILE]
+                         [--census CENSUSFILE] [--census-period TICKS]
+                         [--age-stats GENE STATSFILE ...]
+                         [--checkpoint CKPTFILE] [--checkpoint-period TICKS]
+                         [--resume CKPTFILE]
+
+A params file holds assignments in the form of those in Params.py; they and
+any --set values override the defaults in Params.  The simulation runs
+flat-out for TICKS ticks, or until the cells die out, and a summary is
+printed (and written to OUTFILE as JSON if given).  With --census a Census
+of the cells' genotypes is kept and its snapshots are written to CENSUSFILE
+as JSON lines.  Each --age-stats logs the ages at death of the cells by
+the number of copies of GENE in their genomes to STATSFILE (see StatsLog).
+
+With --checkpoint the run is saved to CKPTFILE (which may hold '{time}')
+every TICKS ticks by a background Checkpointer.  --resume carries on from a
+checkpoint for TICKS more ticks, with the Params, census, stats files and
+checkpointing of the run that saved it; --census then names the file for
+its census.'''
+from SimpleCellSim import *
+from Census import Census
+from StatsLog import AgeAtDeathTracker, StatsWriter
+from Checkpoint import Checkpointer, loadCheckpoint
+import Params
+
+import argparse
+import ast
+import json
+import random
+import sys
+import time
+
+
+ENGINES = ( 'objects', 'population' )
+WORLDS  = ( 'World', 'CompactWorld', 'ArrayWorld' )
+
+
+def readParams( filename ):
+   '''Return a dict of the Params assigned in the file.'''
+   settings = { }
+   with open( filename ) as paramsFile:
+      exec( paramsFile.read(), { }, settings )
+
+   return { name:value for name,value in settings.items() if name.isupper() }
+
+def loadParams( filename ):
+   '''Set the Params named in the file to the values assigned to them.'''
+   setParams( readParams(filename) )
+
+def setParams( settings ):
+   '''Set each Param named in settings (a dict of name:value).'''
+   for name,value in settings.items( ):
+      if not hasattr( Params, name ):
+         raise Exception( 'Unknown parameter: {0}'.format(name) )
+      setattr( Params, name, value )
+
+def parseSetting( setting ):
+   '''Parse a NAME=VALUE command line setting.  VALUE is read as a Python
+   literal if it is one, otherwise as a string.'''
+   name,sep,value = setting.partition( '=' )
+   if not sep:
+      raise argparse.ArgumentTypeError( 'expected NAME=VALUE, got {0!r}'.format(setting) )
+
+   try:
+      value = ast.literal_eval( value )
+   except (ValueError, SyntaxError):
+      pass
+
+   return name.strip(), value
+
+def runHeadless( ticks, seed=None, engine='objects', worldType=None, census=None, deathTrackers=( ), checkpointer=None ):
+   '''Run the ecology set out in Params for up to ticks ticks and return a
+   dict of summary statistics.  The population engine runs the cells as
+   a CellPopulation, which requires (and defaults to) an ArrayWorld.  If
+   census (a Census) is given it's added to the simulation before the
+   cells, as are deathTrackers (AgeAtDeathTrackers) to its context.  A
+   checkpointer (a Checkpointer) is added once the ecology is built, and
+   saves what resumeHeadless() needs with its checkpoints.'''
+   if engine not in ENGINES:
+      raise Exception( 'Unknown engine: {0}'.format(engine) )
+
+   random.seed( seed )
+   seeds = random.Random( seed )   # <- seeds of the NumPy generators, drawn apart from the random stream the cells and plants use
+
+   if worldType is None:
+      worldType = 'ArrayWorld' if engine == 'population' else 'World'
+   if worldType == 'ArrayWorld':
+      from ArrayWorld import ArrayWorld as worldClass
+   elif worldType == 'CompactWorld':
+      worldClass = CompactWorld
+   elif worldType == 'World':
+      worldClass = World
+   else:
+      raise Exception( 'Unknown world: {0}'.format(worldType) )
+
+   sim   = Simulation( EcologyContext(), Params.UPDATE_POLICY )
+   context = sim.context( )
+   context.deathTrackers.extend( deathTrackers )
+   if census is not None:
+      sim.add( census )
+   if worldType == 'ArrayWorld':
+      world = worldClass( Params.ROWS, Params.COLUMNS, seed=seeds.getrandbits(64) )
+   else:
+      world = worldClass( Params.ROWS, Params.COLUMNS )
+   if engine == 'population':
+      from CellPopulation import CellPopulation
+      population = CellPopulation( world, seed=seeds.getrandbits(64) )
+      sim.add( population )
+   else:
+      population = None
+   plant = buildEcology( sim, world, population )
+   if checkpointer is not None:
+      checkpointer.extras.update( plant=plant, seed=seed, engine=engine, world=worldType )
+      sim.add( checkpointer )
+
+   return runSimulation( sim, plant, ticks, seed, engine, worldType )
+
+def resumeHeadless( ticks, filename ):
+   '''Carry on the run saved in the checkpoint filename by runHeadless()'s
+   checkpointer for up to ticks ticks.  Return ( the simulation, a dict of
+   summary statistics of the ticks run since ).'''
+   sim, extras = loadCheckpoint( filename )
+   return sim, runSimulation( sim, extras['plant'], ticks, extras['seed'], extras['engine'], extras['world'] )
+
+def runSimulation( sim, plant, ticks, seed, engine, worldType ):
+   '''Run the ecology in sim for up to ticks ticks and return a dict of
+   summary statistics.'''
+   context  = sim.context( )
+   popTotal = 0
+   popMax   = context.cellPopulation
+   start = time.perf_counter( )
+   for tickNum in range( ticks ):
+      if context.cellPopulation == 0:
+         break
+
+      sim.tickAllModelsOnce_NoMessaging( )
+      popTotal += context.cellPopulation
+      popMax    = max( popMax, context.cellPopulation )
+   else:
+      tickNum = ticks
+   elapsed = time.perf_counter( ) - start
+
+   for model in sim:
+      if isinstance( model, Checkpointer ):
+         model.wait( )
+
+   cellEgy = ((Params.MAX_PLANT_POPULATION - plant.size()) * Params.ENERGY_PER_PLANT_CELL) - context.availableEnergy
+   return {
+      'engine':           engine,
+      'world':            worldType,
+      'seed':             seed,
+      'ticks':            tickNum,
+      'extinct':          context.cellPopulation == 0,
+      'cellPopulation':   context.cellPopulation,
+      'meanCellPopulation': (popTotal / tickNum) if tickNum else 0.0,
+      'maxCellPopulation':  popMax,
+      'plantPopulation':  plant.size( ),
+      'cellEnergy':       cellEgy,
+      'availableEnergy':  context.availableEnergy,
+      'seconds':          elapsed,
+      'ticksPerSecond':   (tickNum / elapsed) if elapsed else 0.0
+      }
+
+def main( argv=None ):
+   parser = argparse.ArgumentParser( description='Run the SimpleCell ecology without a GUI.' )
+   parser.add_argument( '-p', '--params', help='file of Params assignments' )
+   parser.add_argument( '--set', action='append', default=[ ], type=parseSetting, metavar='NAME=VALUE', help='set a Param (repeatable)' )
+   parser.add_argument( '-t', '--ticks', type=int, default=1000, help='number of ticks to run (default 1000)' )
+   parser.add_argument( '-s', '--seed', type=int, default=None, help='random seed' )
+   parser.add_argument( '--engine', choices=ENGINES, default='objects', help='run cells as SimpleCell objects or as a CellPopulation' )
+   parser.add_argument( '--world', choices=WORLDS, default=None, help='board implementation' )
+   parser.add_argument( '-o', '--output', help='also write the summary to this file as JSON' )
+   parser.add_argument( '--census', help='keep a genotype census and write its snapshots to this file as JSON lines' )
+   parser.add_argument( '--census-period', type=int, default=100, metavar='TICKS', help='ticks between census snapshots (default 100)' )
+   parser.add_argument( '--checkpoint', metavar='CKPTFILE', help="save the run to this file (which may hold '{time}') every --checkpoint-period ticks" )
+   parser.add_argument( '--checkpoint-period', type=int, default=1000, metavar='TICKS', help='ticks between checkpoints (default 1000)' )
+   parser.add_argument( '--resume', metavar='CKPTFILE', help='carry on the run saved in this checkpoint (--census then writes its census)' )
+   parser.add_argument( '--age-stats', action='append', default=[ ], nargs=2, metavar=('GENE', 'STATSFILE'), help='log ages at death by copies of GENE to STATSFILE (repeatable)' )
+   args = parser.parse_args( argv )
+   if args.resume and (args.age_stats or args.checkpoint):
+      parser.error( '--resume carries on the stats files and checkpointing of the saved run' )
+
+   if args.resume:
+      sim, summary = resumeHeadless( args.ticks, args.resume )
+      census  = sim.context( ).census if args.census else None
+      writers = [ tracker.writer() for tracker in sim.context().deathTrackers if tracker.writer() is not None ]
+      for writer in writers:
+         writer.close( )
+   else:
+      if args.params:
+         loadParams( args.params )
+      setParams( dict(args.set) )
+
+      census   = Census( args.census_period ) if args.census else None
+      writers  = [ StatsWriter( filename ) for gene,filename in args.age_stats ]
+      trackers = [ AgeAtDeathTracker( gene, writer ) for (gene,filename),writer in zip(args.age_stats, writers) ]
+      checkpointer = Checkpointer( args.checkpoint, args.checkpoint_period ) if args.checkpoint else None
+      try:
+         summary = runHeadless( args.ticks, args.seed, args.engine, args.world, census, trackers, checkpointer )
+      finally:
+         for writer in writers:
+            writer.close( )
+
+   for name,value in summary.items( ):
+      print( '{0:20} {1}'.format(name, value) )
+
+   if args.output:
+      with open( args.output, 'w' ) as outFile:
+         json.dump( summary, outFile, indent=2 )
+
+   if census is not None:
+      with open( args.census, 'w' ) as censusFile:
+         census.writeSeries( censusFile )
+
+
+if __name__ == '__main__':
+   sys.exit( main() )
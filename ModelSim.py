@@ -1,15 +1,28 @@
 from pubSubscr import *
+from EventLog import EventLog
+
+class SimContext( object ):
+   '''State shared by the models of one Simulation, which would otherwise
+   be module or class globals.  Models reach it through their simulation
+   (self._sim.context()), so any number of simulations may exist at once.
+   Kinds of simulation with state of their own subclass it.'''
+   def __init__( self ):
+      self.nextIdent = 0      # The ident to assign to the next model added without one
+
+   def newIdent( self ):
+      ident = self.nextIdent
+      self.nextIdent += 1
+      return ident
 
-class Model( Subscriber ):
-   NEXT_IDENT = 0
 
+class Model( Subscriber ):
    def __init__( self, ident=None ):
       self._sim     = None    # The simulation this inst is a part of (assigned in _addedToSimulation())
-      self._ident   = ident   # The ID of this inst
-
-      if ident is None:
-         self._ident = Model.NEXT_IDENT
-         Model.NEXT_IDENT += 1
+      self._ident   = ident   # The ID of this inst (if None, assigned when added to a Simulation)
+      self._simSlot = None    # Index of this inst in its simulation's model list
+      self._tickSlot = None   # Index of this inst in its simulation's tick list (None if not on it)
+      self._wakeTime = None   # Sim time this inst is next due in the timing wheel (None if not in it)
+      self._wakeTopics = ( )  # Topics whose posting wakes this inst (see sleepUntilPosted())
 
    # Specialization of Subscriber
    def handleMessage( self, aMsg ):
@@ -34,81 +47,415 @@ class Model( Subscriber ):
 
    def postMessage( self, topic, **payload ):
       '''Convenience for posting messages.'''
-      self._sim.postMessage( Message(topic, self, self._sim.simTime(), **payload) )
+      self._sim.post( topic, self, self._sim.simTime(), **payload )
+
+   def sleepUntil( self, simTime ):
+      '''Don't tick again until simTime.'''
+      self._sim.sleepUntil( self, simTime )
+
+   def sleepFor( self, numTicks ):
+      '''Don't tick again until numTicks after the current sim time.'''
+      self._sim.sleepUntil( self, self._sim.simTime() + numTicks )
+
+   def sleepUntilWoken( self ):
+      '''Don't tick again until passed to wake().'''
+      self._sim.sleepUntilWoken( self )
+
+   def sleepUntilPosted( self, *topics ):
+      '''Don't tick again until a message is posted to one of topics (or
+      until passed to wake()).'''
+      self._sim.sleepUntilPosted( self, *topics )
+
+   def wake( self ):
+      self._sim.wake( self )
 
    # Interface called by Simulation Instance
+   def tickPeriod( self ):
+      '''Return the number of ticks between calls to tick(), or None to be
+      ticked only when woken.  Asked when the model is added and each time
+      it's due; a model with a period of 1 stays on the tick list until it
+      sleeps.'''
+      return 1
+
    def tick( self ):
       '''Perform your primary processing.'''
       raise NotImplementedError( )
 
 
+def _tombstone( *args ):
+   '''Tick function left in the slot of a dropped model.'''
+   pass
+
+
 class Simulation( PostOffice ):
-   def __init__( self ):
+   '''Models are held in insertion order in a list, each model knowing its
+   slot.  Dropping a model leaves a tombstone (None) in its slot so the
+   list is never searched or shifted; the tombstones are compacted out
+   once, at the end of a tick.
+
+   Only awake models with a tick period of 1 are on the tick list (the
+   models and their tick methods in parallel lists, with tombstones of
+   their own) which is run every tick.  Every other model waits in a timing
+   wheel, a dict of sim time -> the models due to tick then, so a sleeping
+   or slow model costs nothing on the ticks it sits out.  At the start of
+   each tick the models due are taken from the wheel: those with a period
+   of 1 rejoin the tick list, the rest tick at once and, unless they went
+   back to sleep, are scheduled again a period later.  Entries in the wheel
+   are never removed; an entry is stale unless the model is still in the
+   simulation and still due at that time.
+
+   The update policy decides when models added during a tick join the tick
+   list:
+      IMMEDIATE  at once; they tick later in the same tick, after every
+                 model already present (in the order they were added)
+      DEFERRED   at the end of the tick; they first tick on the next one,
+                 and the tick list doesn't change while it's iterated
+   Either way a model is told it was added (_addedToSimulation()) or
+   dropped (_droppedFromSimulation()) at once, and a dropped model doesn't
+   tick again, even later in the same tick.'''
+   IMMEDIATE = 'immediate'
+   DEFERRED  = 'deferred'
+
+   def __init__( self, context=None, policy=IMMEDIATE ):
       PostOffice.__init__( self )
-      self._models = [ ]   # list of Model instances currently in the simulation.
-      self._tickFn = [ ]   # list of the tick methods of the models
-      self._time   = 0     # current simulation time
+      if policy not in ( Simulation.IMMEDIATE, Simulation.DEFERRED ):
+         raise Exception( 'Unknown update policy: {0}'.format(policy) )
+
+      self._models  = [ ]   # list of Model instances in the simulation (None in a dropped model's slot)
+      self._pending = [ ]   # list of the models added during this tick under DEFERRED (None if since dropped)
+      self._dropped = 0     # number of tombstones in _models and _pending
+      self._tickers = [ ]   # list of the models on the tick list (None in a departed model's slot)
+      self._tickFn  = [ ]   # list of their tick methods (_tombstone in a departed model's slot)
+      self._tickDropped = 0 # number of tombstones in the tick list
+      self._wheel   = { }   # Map: sim time -> list of the models due to tick then
+      self._wakeOnPost = { } # Map: topic -> list of the models sleeping until it's posted
+      self._time    = 0     # current simulation time
+      self._policy  = policy
+      self._ticking = False
+      self._context = context if context is not None else SimContext( )
+      self._events  = EventLog( )
+      self._betweenTicks = [ ] # functions to call once the current tick has ended
+
+   # Specialization of PostOffice
+   def postMessage( self, aMsg ):
+      PostOffice.postMessage( self, aMsg )
+      sleepers = self._wakeOnPost.pop( aMsg.topic, None )
+      if sleepers:
+         for model in sleepers:
+            if (model._simSlot is not None) and (aMsg.topic in model._wakeTopics):
+               self.wake( model )
 
    # Extension
+   def context( self ):
+      '''Return the SimContext holding the state shared by the models.'''
+      return self._context
+
+   def policy( self ):
+      '''Return the update policy (IMMEDIATE or DEFERRED).'''
+      return self._policy
+
+   def events( self ):
+      '''Return the EventLog of the simulation, flushed at the end of
+      every tick.'''
+      return self._events
+
    def add( self, aModel ):
       '''Add a model to the simulation.  Subscribe it to all topics
-      returned it's subscriptionTopics() method.'''
-      self._models.append( aModel )
-      self._tickFn.append( aModel.tick )
+      returned it's subscriptionTopics() method.  A model without an ident
+      is assigned the next one from the context.'''
+      if aModel._ident is None:
+         aModel._ident = self._context.newIdent( )
+      aModel._simSlot = len(self._models) + len(self._pending)
+      if self._ticking and (self._policy == Simulation.DEFERRED):
+         self._pending.append( aModel )
+      else:
+         self._models.append( aModel )
+         self._enlist( aModel )
       #self.subscribeTo( aModel, *aModel.subscriptionTopics() )
       #self.postMessage( Message('join', aModel, self._time) )
       aModel._addedToSimulation( self )
 
    def drop( self, aModel ):
       '''Remove a model from the simulation.  Unsubscribe it from all topics.'''
+      slot = aModel._simSlot
+      numModels = len(self._models)
+      if (slot is None) or (aModel is not (self._models[ slot ] if slot < numModels else self._pending[ slot - numModels ])):
+         raise ValueError( 'Model is not in this simulation.' )
+
       aModel._droppedFromSimulation( self )
       #self.postMessage( Message('drop', aModel, self._time) )
       #self.unsubscribeFromAll( aModel )
-      self._tickFn.remove( aModel.tick )
-      self._models.remove( aModel )
+      if slot < numModels:
+         self._models[ slot ] = None
+      else:
+         self._pending[ slot - numModels ] = None
+      self._dropped += 1
+      self._leaveTickList( aModel )
+      aModel._simSlot  = None
+      aModel._wakeTime = None
 
    def reset( self ):
-      self._models = [ ]
-      self._tickFn = [ ]
-      self._time   = 0
+      for model in self:
+         model._simSlot  = None
+         model._tickSlot = None
+         model._wakeTime = None
+      self._models  = [ ]
+      self._pending = [ ]
+      self._dropped = 0
+      self._tickers = [ ]
+      self._tickFn  = [ ]
+      self._tickDropped = 0
+      self._wheel   = { }
+      self._wakeOnPost = { }
+      self._time    = 0
+      self._events.clear( )
+      self._betweenTicks = [ ]
 
    def size( self ):
       '''Return the number of Models in the simulation.'''
-      return len(self._models)
+      return len(self._models) + len(self._pending) - self._dropped
 
    def simTime( self ):
       '''Return the current simulation time (tick number).'''
       return self._time
 
+   def nextTickTime( self ):
+      '''Return the sim time of the next tick to start: the current time
+      between ticks, the next time during one.'''
+      return self._time + 1 if self._ticking else self._time
+
    def __iter__( self ):
-      return iter(self._models)
+      return ( model for model in self._models + self._pending if model is not None )
+
+   def callBetweenTicks( self, aFunction ):
+      '''Have aFunction() called once the current tick has ended, when the
+      simulation is in a consistent state (e.g. to be saved), or at once
+      between ticks.'''
+      if self._ticking:
+         self._betweenTicks.append( aFunction )
+      else:
+         aFunction( )
+
+   # Scheduling
+   def sleepUntil( self, aModel, simTime ):
+      '''Take aModel off the tick list until simTime (at the earliest the
+      next tick to start).'''
+      self._leaveTickList( aModel )
+      self._schedule( aModel, max(simTime, self.nextTickTime()) )
+
+   def sleepUntilWoken( self, aModel ):
+      '''Take aModel off the tick list and out of the timing wheel until it
+      is passed to wake().'''
+      self._leaveTickList( aModel )
+      aModel._wakeTime = None
+
+   def sleepUntilPosted( self, aModel, *topics ):
+      '''As sleepUntilWoken(), but aModel is also woken by the next message
+      posted to any of topics.'''
+      self.sleepUntilWoken( aModel )
+      aModel._wakeTopics = topics
+      for topic in topics:
+         self._wakeOnPost.setdefault( topic, [ ] ).append( aModel )
+
+   def wake( self, aModel ):
+      '''Have a sleeping model tick on the next tick to start, and carry on
+      as its tick period says from there.'''
+      aModel._wakeTopics = ( )
+      if (aModel._tickSlot is not None) or (aModel._simSlot is None):
+         return
+
+      due = self.nextTickTime( )
+      if aModel._wakeTime != due:
+         self._schedule( aModel, due )
 
    def advanceSim( self, numTicks=1 ):
       '''Run the simulation for a specified number of ticks.'''
       for tickCount in range(numTicks):
          self.deliverAllPostedMessages( )
-         for model in self._models:
-            model.tick( )
-         self._time += 1
+         self._ticking = True
+         try:
+            due = self._wheel.pop( self._time, None )
+            if due:
+               self._tickDue( due, ( ) )
+            for tickFn in self._tickFn:
+               tickFn( )
+         finally:
+            self._endTick( )
 
    def tickAllModels_NoMessaging( self, numTicks):
       '''Tick all models (no message delivery, no exception handling).'''
-      for t in range(self._time, self._time + numTicks):
-         for tickFn in self._tickFn:
-            tickFn( t )
-      self._time += numTicks
+      for tickCount in range(numTicks):
+         t = self._time
+         self._ticking = True
+         try:
+            due = self._wheel.pop( t, None )
+            if due:
+               self._tickDue( due, ( t, ) )
+            for tickFn in self._tickFn:
+               tickFn( t )
+         finally:
+            self._endTick( )
    
    def tickAllModelsOnce_NoMessaging( self ):
       '''Tick all models once (no message delivery, no exception handling).'''
-      for tickFn in self._tickFn:
-         #try:
-         tickFn( )
-         #except:
-            #pass
+      self._ticking = True
+      try:
+         due = self._wheel.pop( self._time, None )
+         if due:
+            self._tickDue( due, ( ) )
+         for tickFn in self._tickFn:
+            #try:
+            tickFn( )
+            #except:
+               #pass
+      finally:
+         self._endTick( )
+
+   def _tickDue( self, due, args ):
+      '''Run the models taken from the timing wheel for this tick.'''
+      now = self._time
+      for model in due:
+         if (model._wakeTime != now) or (model._simSlot is None) or (model._tickSlot is not None):
+            continue   # <- stale entry
+
+         period = model.tickPeriod( )
+         if period == 1:
+            model._wakeTime = None
+            self._joinTickList( model )
+            continue
+
+         model.tick( *args )
+         if (model._wakeTime == now) and (model._simSlot is not None):   # <- didn't sleep or leave
+            model._wakeTime = None
+            if period is not None:
+               self._schedule( model, now + period )
+
+   def _enlist( self, aModel ):
+      '''Put a newly added model on the tick list or in the timing wheel as
+      its tick period says.'''
+      period = aModel.tickPeriod( )
+      if period == 1:
+         self._joinTickList( aModel )
+      elif period is not None:
+         self._schedule( aModel, self.nextTickTime() )
+
+   def _schedule( self, aModel, simTime ):
+      aModel._wakeTime = simTime
+      try:
+         self._wheel[ simTime ].append( aModel )
+      except KeyError:
+         self._wheel[ simTime ] = [ aModel ]
+
+   def _joinTickList( self, aModel ):
+      aModel._tickSlot = len(self._tickers)
+      self._tickers.append( aModel )
+      self._tickFn.append( aModel.tick )
+
+   def _leaveTickList( self, aModel ):
+      slot = aModel._tickSlot
+      if slot is not None:
+         self._tickers[ slot ] = None
+         self._tickFn[ slot ]  = _tombstone
+         self._tickDropped += 1
+         aModel._tickSlot = None
+
+   def _endTick( self ):
+      '''Advance the clock, flush the event log, bring the models added
+      during the tick into the simulation, squeeze the tombstones out of
+      the lists and call the functions waiting for the tick to end.'''
+      self._ticking = False
       self._time += 1
+      self._events.flush( )
+      if self._pending:
+         self._models.extend( self._pending )
+         for model in self._pending:
+            if model is not None:
+               self._enlist( model )
+         self._pending = [ ]
+
+      if self._tickDropped != 0:
+         self._tickFn  = [ tickFn for model,tickFn in zip(self._tickers, self._tickFn) if model is not None ]
+         self._tickers = [ model for model in self._tickers if model is not None ]
+         for slot,model in enumerate( self._tickers ):
+            model._tickSlot = slot
+         self._tickDropped = 0
+
+      if self._dropped != 0:
+         self._models = [ model for model in self._models if model is not None ]
+         for slot,model in enumerate( self._models ):
+            model._simSlot = slot
+         self._dropped = 0
+
+      if self._betweenTicks:
+         functions, self._betweenTicks = self._betweenTicks, [ ]
+         for aFunction in functions:
+            aFunction( )
 
 
 if __name__ == '__main__':
+   # Self-check: models with tick periods, sleeping, waking on a post, and
+   # being added or dropped mid-tick, tick at exactly the expected times
+   # under both update policies.
+   class Recorder( Model ):
+      def __init__( self, period=1, onTick=None ):
+         super().__init__( )
+         self.period = period
+         self.onTick = onTick   # function( model, simTime ) called in each tick
+         self.ticks  = [ ]
+
+      def handleMessage( self, aMsg ):
+         pass
+
+      def subscriptionTopics( self ):
+         return [ ]
+
+      def tickPeriod( self ):
+         return self.period
+
+      def tick( self ):
+         self.ticks.append( self._sim.simTime() )
+         if self.onTick is not None:
+            self.onTick( self, self._sim.simTime() )
+
+   def checkScheduler( policy ):
+      sim = Simulation( policy=policy )
+      periodic = { period:Recorder( period ) for period in ( 1, 2, 3, 7 ) }
+      for model in periodic.values( ):
+         sim.add( model )
+
+      def napAt2( model, now ):
+         if now == 2:
+            model.sleepFor( 5 )
+      napper = Recorder( onTick=napAt2 )
+      sim.add( napper )
+
+      waiter = Recorder( onTick=lambda model,now: model.sleepUntilPosted('ping') )
+      sim.add( waiter )
+      pinger = Recorder( 10, onTick=lambda model,now: model.postMessage('ping') if now > 0 else None )
+      sim.add( pinger )
+
+      late  = Recorder( )
+      doomed = Recorder( )
+      def addAndDropAt5( model, now ):
+         if now == 5:
+            sim.add( late )
+            sim.drop( doomed )
+      sim.add( Recorder(onTick=addAndDropAt5) )
+      sim.add( doomed )
+
+      sim.advanceSim( 30 )
+      for period,model in periodic.items( ):
+         assert model.ticks == list( range(0, 30, period) ), (period, model.ticks)
+      assert napper.ticks == [ 0, 1, 2 ] + list( range(7, 30) ), napper.ticks
+      assert waiter.ticks == [ 0, 11, 21 ], waiter.ticks
+      assert doomed.ticks == list( range(5) ), doomed.ticks
+      assert late.ticks == list( range(5 if policy == Simulation.IMMEDIATE else 6, 30) ), late.ticks
+      assert sim.size( ) == 9
+
+   for policy in ( Simulation.IMMEDIATE, Simulation.DEFERRED ):
+      checkScheduler( policy )
+   print( 'scheduler ok' )
+
    gVal = 0
    
    class TestModel_A( Model ):
@@ -126,14 +473,13 @@ if __name__ == '__main__':
    class TestModel_B( Model ):
       def __init__( self ):
          super().__init__( self )
+         self.seen = None
       
       def subscriptionTopics( self ):
          return [ ]
       
       def tick( self, t ):
-         global gVal
-         
-         print( gVal )
+         self.seen = gVal
    
    SIM = Simulation( )
    SIM.add( TestModel_A() )
@@ -143,12 +489,10 @@ if __name__ == '__main__':
       SIM.advanceSim(1000)
    
    def runSim2( ):
-      for x in range(1000):
-         SIM.tickAllModels( 1 )
+      SIM.tickAllModels_NoMessaging( 1000 )
    
    import timeit
    print( '==> ', timeit.timeit( 'runSim2()', setup='from __main__ import runSim2', number=100 ) )
    
    #import profile
    #profile.run( 'runSim3()' )
-   
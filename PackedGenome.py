@@ -0,0 +1,64 @@
+import Params
+
+
+class PackedGenome( int ):
+   '''An immutable genome of SimpleCell genes packed into an int, BITS bits
+   per gene: gene i is held as its index in Params.GENES in bits
+   BITS*i .. BITS*i + BITS-1.  A 1 bit above the last gene marks the
+   length, so genomes of different lengths never compare equal.
+
+   Being an int, a PackedGenome hashes and compares by value, costs a few
+   dozen bytes whatever its length and can key genome-frequency tables
+   directly.  Genes are decoded through Params.GENES, which mustn't be
+   reordered while genomes are live.
+
+      PackedGenome( 'NESSWWWW' )     from a string (or sequence) of genes
+      PackedGenome( anInt )          from its packed value'''
+   BITS = 3
+   MASK = (1 << BITS) - 1
+
+   def __new__( cls, genes ):
+      if isinstance( genes, int ):
+         return int.__new__( cls, genes )
+
+      geneCodes = { gene:code for code,gene in enumerate(Params.GENES) }
+      if len(geneCodes) > PackedGenome.MASK + 1:
+         raise Exception( 'Too many genes in Params.GENES to pack.' )
+
+      value = 1
+      for gene in reversed( genes ):
+         try:
+            value = (value << PackedGenome.BITS) | geneCodes[ gene ]
+         except KeyError:
+            raise Exception( 'Unknown gene: {0!r}'.format(gene) )
+      return int.__new__( cls, value )
+
+   def __len__( self ):
+      return (self.bit_length() - 1) // PackedGenome.BITS
+
+   def __getitem__( self, pos ):
+      return Params.GENES[ (self >> (PackedGenome.BITS * pos)) & PackedGenome.MASK ]
+
+   def __iter__( self ):
+      for pos in range( len(self) ):
+         yield self[ pos ]
+
+   def __str__( self ):
+      return ''.join( self )
+
+   def __repr__( self ):
+      return 'PackedGenome({0!r})'.format( str(self) )
+
+   def geneCode( self, pos ):
+      '''Return the index in Params.GENES of the gene at pos.'''
+      return (self >> (PackedGenome.BITS * pos)) & PackedGenome.MASK
+
+   def mutated( self, pos, gene ):
+      '''Return the genome with the gene at pos replaced by gene.'''
+      if not (0 <= pos < len(self)):
+         raise IndexError( 'gene position out of range' )
+
+      shift = PackedGenome.BITS * pos
+      value = (self & ~(PackedGenome.MASK << shift)) | (Params.GENES.index(gene) << shift)
+      return int.__new__( PackedGenome, value )
+
@@ -0,0 +1,153 @@
+'''Sweep the SimpleCell ecology over combinations of Params.
+
+   python ParamSweep.py [--grid NAME=V1,V2,...] [--random NAME=LO:HI]
+                        [--samples N] [-r REPLICATES] [-t TICKS] [-j JOBS]
+                        [-p PARAMSFILE] [--set NAME=VALUE ...]
+                        [--engine objects|population] [-o OUTFILE.csv]
+
+The design is the product of the --grid values with N points drawn
+uniformly from the --random ranges (integer ranges give integers).  Each
+point of the design is run REPLICATES times with different seeds.  Every run
+is an independent HeadlessSim run in a pool of worker processes.  Params is
+the one module global a run depends on; each run resets it to its defaults
+before applying its settings, so a worker carries nothing over from one run
+to the next.  One CSV row is written per run.'''
+from HeadlessSim import readParams, setParams, parseSetting, runHeadless, ENGINES, WORLDS
+from Checkpoint import paramsState
+import Params
+
+import argparse
+import ast
+import csv
+import itertools
+import multiprocessing
+import random
+import sys
+
+
+DEFAULT_PARAMS = paramsState( )   # <- the values in Params.py, restored before each run
+
+
+def gridDesign( grid ):
+   '''grid is a list of (name, [values]).  Return a list of dicts, one per
+   combination of values.'''
+   names = [ name for name,values in grid ]
+   return [ dict(zip(names, combo)) for combo in itertools.product( *[values for name,values in grid] ) ]
+
+def randomDesign( ranges, samples, rng ):
+   '''ranges is a list of (name, lo, hi).  Return a list of samples dicts of
+   values drawn uniformly from the ranges.'''
+   design = [ ]
+   for sampleNum in range( samples ):
+      point = { }
+      for name,lo,hi in ranges:
+         if isinstance( lo, int ) and isinstance( hi, int ):
+            point[ name ] = rng.randint( lo, hi )
+         else:
+            point[ name ] = rng.uniform( lo, hi )
+      design.append( point )
+   return design
+
+def sweepRuns( design, replicates, baseSeed=0 ):
+   '''Return a list of (runNum, replicate, seed, settings) for each point of
+   design run replicates times.'''
+   runs = [ ]
+   for point in design:
+      for replicate in range( replicates ):
+         runNum = len(runs)
+         runs.append( (runNum, replicate, baseSeed + runNum, point) )
+   return runs
+
+def _runOne( job ):
+   runNum, replicate, seed, settings, baseSettings, ticks, engine, worldType = job
+   row = { 'run':runNum, 'replicate':replicate }
+   row.update( settings )
+   try:
+      setParams( DEFAULT_PARAMS )
+      setParams( baseSettings )
+      setParams( settings )
+      row.update( runHeadless(ticks, seed, engine, worldType) )
+   except Exception as ex:
+      row[ 'seed' ]  = seed
+      row[ 'error' ] = '{0}: {1}'.format( type(ex).__name__, ex )
+   return row
+
+def runSweep( runs, ticks, baseSettings=None, engine='objects', worldType=None, jobs=None ):
+   '''Run each of runs (see sweepRuns()) in a pool of jobs worker processes
+   (default: one per core) and return a list of result rows (dicts), in run
+   order.  A worker runs one simulation after another, resetting Params
+   to DEFAULT_PARAMS before each.'''
+   tasks = [ (runNum, replicate, seed, settings, baseSettings or { }, ticks, engine, worldType)
+             for runNum,replicate,seed,settings in runs ]
+   with multiprocessing.Pool( jobs ) as pool:
+      return pool.map( _runOne, tasks, chunksize=1 )
+
+def writeRows( rows, outFile ):
+   columns = [ ]
+   for row in rows:
+      columns.extend( key for key in row if key not in columns )
+
+   writer = csv.DictWriter( outFile, columns )
+   writer.writeheader( )
+   writer.writerows( rows )
+
+def parseValues( setting ):
+   '''Parse a NAME=V1,V2,... command line grid axis.'''
+   name,value = parseSetting( setting )
+   if not isinstance( value, tuple ):
+      value = ( value, )
+   return name, list(value)
+
+def parseRange( setting ):
+   '''Parse a NAME=LO:HI command line random range.'''
+   name,sep,value = setting.partition( '=' )
+   lo,sep2,hi = value.partition( ':' )
+   if not (sep and sep2):
+      raise argparse.ArgumentTypeError( 'expected NAME=LO:HI, got {0!r}'.format(setting) )
+
+   try:
+      return name.strip(), ast.literal_eval( lo ), ast.literal_eval( hi )
+   except (ValueError, SyntaxError):
+      raise argparse.ArgumentTypeError( 'expected numeric bounds, got {0!r}'.format(setting) )
+
+def main( argv=None ):
+   parser = argparse.ArgumentParser( description='Sweep the SimpleCell ecology over combinations of Params.' )
+   parser.add_argument( '--grid', action='append', default=[ ], type=parseValues, metavar='NAME=V1,V2,...', help='grid axis (repeatable)' )
+   parser.add_argument( '--random', action='append', default=[ ], type=parseRange, metavar='NAME=LO:HI', help='random design range (repeatable)' )
+   parser.add_argument( '--samples', type=int, default=10, help='number of random design points (default 10)' )
+   parser.add_argument( '-r', '--replicates', type=int, default=1, help='runs per design point (default 1)' )
+   parser.add_argument( '-t', '--ticks', type=int, default=1000, help='ticks per run (default 1000)' )
+   parser.add_argument( '-s', '--seed', type=int, default=0, help='seed of the random design and of the first run' )
+   parser.add_argument( '-j', '--jobs', type=int, default=None, help='worker processes (default: one per core)' )
+   parser.add_argument( '-p', '--params', help='file of Params assignments applied to every run' )
+   parser.add_argument( '--set', action='append', default=[ ], type=parseSetting, metavar='NAME=VALUE', help='set a Param for every run (repeatable)' )
+   parser.add_argument( '--engine', choices=ENGINES, default='objects' )
+   parser.add_argument( '--world', choices=WORLDS, default=None )
+   parser.add_argument( '-o', '--output', help='CSV file (default: standard output)' )
+   args = parser.parse_args( argv )
+
+   baseSettings = readParams( args.params ) if args.params else { }
+   baseSettings.update( args.set )
+
+   design = gridDesign( args.grid )
+   if args.random:
+      samples = randomDesign( args.random, args.samples, random.Random(args.seed) )
+      design  = [ dict(point, **sample) for point in design for sample in samples ]
+
+   # Check the names here rather than have every run fail
+   for name in itertools.chain( baseSettings, *design ):
+      if not hasattr( Params, name ):
+         parser.error( 'unknown parameter: {0}'.format(name) )
+
+   runs = sweepRuns( design, args.replicates, args.seed )
+   rows = runSweep( runs, args.ticks, baseSettings, args.engine, args.world, args.jobs )
+
+   if args.output:
+      with open( args.output, 'w', newline='' ) as outFile:
+         writeRows( rows, outFile )
+   else:
+      writeRows( rows, sys.stdout )
+
+
+if __name__ == '__main__':
+   sys.exit( main() )
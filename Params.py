@@ -7,6 +7,7 @@ PLANT_SPECIES         = 'Sinuous'
 ENERGY_PER_PLANT_CELL = 10
 MAX_PLANT_POPULATION  = 880
 RAND_GROWTH_FACTOR    = 0.3
+PLANT_GROWTH_MODE     = 'scan'        # 'scan', 'vectorized' (ArrayWorld only) or 'frontier'; see Plant
 
 # Cells
 GENOME_LENGTH         = 8
@@ -21,4 +22,5 @@ STARTING_CELL_COUNT   = 1
 
 # Simulation
 TICK_LENGTH           = 1
+UPDATE_POLICY         = 'immediate'   # When models added mid-tick first tick: 'immediate' or 'deferred'; see Simulation
 
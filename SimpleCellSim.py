@@ -1,36 +1,114 @@
 from CellSim import *
+from array import array
 import random
 from collections import OrderedDict
+from PackedGenome import PackedGenome
+
+
+class EcologyContext( CellSimContext ):
+   '''SimContext of a simulation of cells feeding on a Plant.  Energy given
+   back by the cells goes through freeEnergy(), which wakes the plants
+   asleep until there's enough of it for them to grow.'''
+   def __init__( self ):
+      CellSimContext.__init__( self )
+      self.availableEnergy = 0              # Energy free for the Plant to grow with
+      self._sleepingPlants = [ ]            # Plants asleep until availableEnergy reaches _wakeLevel
+      self._wakeLevel      = float( 'inf' ) # the least energy a sleeping plant is waiting for
+
+   def freeEnergy( self, units ):
+      '''Add units to the energy available, waking the sleeping plants once
+      it reaches the level they're waiting for.'''
+      self.availableEnergy += units
+      if self.availableEnergy >= self._wakeLevel:
+         plants, self._sleepingPlants = self._sleepingPlants, [ ]
+         self._wakeLevel = float( 'inf' )
+         for plant in plants:
+            plant.wake( )
+
+   def sleepUntilEnergy( self, aPlant, level ):
+      '''Put aPlant to sleep until availableEnergy reaches level.'''
+      aPlant.sleepUntilWoken( )
+      self._sleepingPlants.append( aPlant )
+      self._wakeLevel = min( self._wakeLevel, level )
 
 
 class PlantCell( WorldObject ):
-   WORLD           = None
-   PLANT           = None
-   ENERGY_PER_CELL = None
-   
-   def __init__( self, row, col ):
-      WorldObject.__init__( self, PlantCell.WORLD, row, col )
+   def __init__( self, plant, row, col ):
+      WorldObject.__init__( self, plant.world( ), row, col )
+      self._plant = plant
 
    def feed( self ):
-      PlantCell.PLANT.freePlantCell( self )
-      return PlantCell.ENERGY_PER_CELL
+      self._plant.freePlantCell( self )
+      return self._plant.energyPerCell( )
 
 
 class Plant( Model ):
-   AVAILABLE_ENERGY = 0
-
-   def __init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor ):
+   '''growthMode selects how grow() finds where to grow (subclasses which
+   support it):
+      'scan'        visit each plant cell's empty neighbors in turn
+      'vectorized'  choose from the whole frontier at once with
+                    ArrayWorld.growthSites() (requires an ArrayWorld)
+      'frontier'    sample the frontier Plant keeps up to date as plant
+                    cells grow and are eaten (Plant_D sweeps the plant
+                    cells beside it instead)
+
+   The frontier is the set of positions with plant cells among their 4
+   neighbors which aren't plant cells themselves.  Positions in it may
+   hold other objects; they are checked for room when sampled.  Only in
+   'frontier' mode is it kept up to date (with the neighbor table it's
+   worked out from, which is rebuilt rather than pickled); the other modes
+   pay nothing for it as cells grow and are eaten.
+
+   A Plant with ONE_CHILD_PER_PARENT (Plant_D) grows at most one new cell
+   from each of its cells in each pass, in every mode.
+
+   A Plant grows from the energy available in its simulation's context (an
+   EcologyContext), so it must be added to the simulation before
+   startPlant() is called.  With energy or room for fewer than
+   MIN_CELLS_TO_GROW new cells it sleeps, and isn't ticked, until the
+   context has freed enough energy (see EcologyContext.freeEnergy()) or
+   enough of its cells have been eaten.'''
+   GROWTH_MODES     = ( 'scan', 'vectorized', 'frontier' )
+   ONE_CHILD_PER_PARENT = False
+   MIN_CELLS_TO_GROW    = 20
+
+   def __init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor, growthMode='scan' ):
       Model.__init__( self )
       
-      PlantCell.WORLD  = aWorld
-      PlantCell.PLANT  = self
-      PlantCell.ENERGY_PER_CELL = energyPerCell
+      if growthMode not in Plant.GROWTH_MODES:
+         raise Exception( 'Unknown growth mode: {0}'.format(growthMode) )
+      if (growthMode == 'vectorized') and not hasattr( aWorld, 'growthSites' ):
+         raise Exception( "Growth mode 'vectorized' requires an ArrayWorld." )
       
       self._world            = aWorld
       self._maxSize          = maxPlantSize
-      self._plantCells       = OrderedDict( )
+      self._energyPerCell    = energyPerCell
+      self._plantCells       = OrderedDict( )            # Map: linear index of position -> PlantCell
       self._randGrowthFactor = randGrowthFactor
+      self._growthMode       = growthMode
       self._availableGrowthEnergy = 0
+      self._waitingForRoom   = False                     # True while asleep until cells are eaten
+      
+      numRows, numCols       = aWorld.size( )
+      self._numCols          = numCols
+      if growthMode == 'frontier':
+         self._frontier       = SlotSet( numRows * numCols )                # linear indices of the frontier positions
+         self._plantNeighbors = array( 'i', [ 0 ] ) * (numRows * numCols)    # linear index -> number of neighboring plant cells
+         self._edge           = SlotSet( numRows * numCols )                # linear indices of the plant cells with a neighbor which isn't one
+         self._initNeighborhood( )
+
+   def __getstate__( self ):
+      state = dict( self.__dict__ )
+      state.pop( '_cNeighbors', None )
+      return state
+
+   def __setstate__( self, state ):
+      self.__dict__.update( state )
+      if self._growthMode == 'frontier':
+         self._initNeighborhood( )
+
+   def _initNeighborhood( self ):
+      self._cNeighbors = neighborIndexTables( *self._world.size() )[ 1 ]   # linear index * 4 + CDIR_xx -> linear index of the neighbor
 
    # Specialization of Subscriber
    def subscriptionTopics( self ):
@@ -47,30 +125,173 @@ class Plant( Model ):
 
    # Specialization of Model
    def tick( self ):
-      numPlantCellsToTryToGrow = min( self._maxSize - len(self._plantCells), Plant.AVAILABLE_ENERGY // Params.ENERGY_PER_PLANT_CELL )
+      context = self._sim.context( )
+      self._waitingForRoom = False
+      numPlantCellsToTryToGrow = self._numCellsToTryToGrow( context )
       
-      if numPlantCellsToTryToGrow < 20:
+      if numPlantCellsToTryToGrow < Plant.MIN_CELLS_TO_GROW:
+         self._sleepUntilGrowth( context )
          return 0
       
       numPlantCellsGrown = self.grow( numPlantCellsToTryToGrow )
 
-      Plant.AVAILABLE_ENERGY -= (numPlantCellsGrown * Params.ENERGY_PER_PLANT_CELL)
+      context.availableEnergy -= (numPlantCellsGrown * Params.ENERGY_PER_PLANT_CELL)
+      if self._numCellsToTryToGrow( context ) < Plant.MIN_CELLS_TO_GROW:
+         self._sleepUntilGrowth( context )   # <- now, rather than being ticked again just to find it can't grow
    
    # Extension
    def size( self ):
       return len(self._plantCells)
 
+   def world( self ):
+      return self._world
+
+   def energyPerCell( self ):
+      return self._energyPerCell
+
    def startPlant( self, row, col ):
-      c = PlantCell( row, col )
-      self._plantCells[ c.ident() ] = c
+      self.addPlantCell( row, col )
       self.tick()   # <- enter a growth cycle to prime the Plant
    
    def grow( self ):
       raise NotImplementedError( )
 
+   def addPlantCell( self, row, col ):
+      '''Grow a new plant cell at the empty position row,col.'''
+      newCell = PlantCell( self, row, col )
+      idx = row * self._numCols + col
+      plantCells = self._plantCells
+      plantCells[ idx ] = newCell
+      if self._growthMode != 'frontier':
+         return newCell
+      
+      plantNeighbors = self._plantNeighbors
+      self._frontier.discard( idx )
+      for nIdx in self._cNeighbors[ idx * 4:idx * 4 + 4 ]:
+         plantNeighbors[ nIdx ] += 1
+         if nIdx not in plantCells:
+            self._frontier.add( nIdx )
+         elif plantNeighbors[ nIdx ] == 4:
+            self._edge.discard( nIdx )
+      
+      if plantNeighbors[ idx ] < 4:
+         self._edge.add( idx )
+      
+      return newCell
+
+   def growVectorized( self, numPlantCellsToTryToGrow ):
+      '''Grow numPlantCellsToTryToGrow plant cells, or as many as there is
+      room for.  Each pass gives every empty position on the frontier a
+      chance of randGrowthFactor per neighboring plant cell, as a scan does,
+      but draws for the whole frontier at once.  With ONE_CHILD_PER_PARENT
+      each plant cell instead tries its empty neighbors in turn and grows
+      into the first which succeeds (ArrayWorld.offspringSites()), as the
+      scan of Plant_D does.'''
+      numPlantCellsGrown = 0
+      while numPlantCellsGrown < numPlantCellsToTryToGrow:
+         quota = numPlantCellsToTryToGrow - numPlantCellsGrown
+         if self.ONE_CHILD_PER_PARENT:
+            sites = self._world.offspringSites( list(reversed(self._plantCells)), self._randGrowthFactor, quota )
+         else:
+            sites = self._world.growthSites( PlantCell, self._randGrowthFactor, quota )
+         if not sites and (len(self._world.frontierOf( PlantCell )[0]) == 0):
+            break                                                # <- no room left to grow
+         
+         for row,col in sites:
+            self.addPlantCell( row, col )
+         numPlantCellsGrown += len(sites)
+      
+      return numPlantCellsGrown
+
+   def growFromFrontier( self, numPlantCellsToTryToGrow ):
+      '''Grow numPlantCellsToTryToGrow plant cells, or as many as there is
+      room for, at positions drawn at random from the frontier.  A drawn
+      position grows if it's empty, with a chance of randGrowthFactor per
+      neighboring plant cell, as a scan would give it.  Gives up after a
+      run of misses several times the size of the frontier.
+
+      With ONE_CHILD_PER_PARENT the plant cells beside the frontier are
+      swept in passes instead (see _sweepFrontier()).'''
+      if self.ONE_CHILD_PER_PARENT:
+         return self._sweepFrontier( numPlantCellsToTryToGrow )
+      
+      numPlantCellsGrown = 0
+      misses = 0
+      while (numPlantCellsGrown < numPlantCellsToTryToGrow) and (misses < 8 * len(self._frontier)):
+         idx = self._frontier.randomSlot( )
+         row,col = divmod( idx, self._numCols )
+         if (self._world.getAt( row, col ) is None) and \
+               (random.random() < 1.0 - (1.0 - self._randGrowthFactor) ** self._plantNeighbors[ idx ]):
+            self.addPlantCell( row, col )
+            numPlantCellsGrown += 1
+            misses = 0
+         else:
+            misses += 1
+      
+      return numPlantCellsGrown
+
    def freePlantCell( self, aCell ):
-      del self._plantCells[ aCell._ident ]
-      PlantCell.WORLD.remove( aCell._r, aCell._c, aCell )
+      idx = aCell._r * self._numCols + aCell._c
+      plantCells = self._plantCells
+      del plantCells[ idx ]
+      self._world.remove( aCell._r, aCell._c, aCell )
+      
+      if self._growthMode == 'frontier':
+         plantNeighbors = self._plantNeighbors
+         for nIdx in self._cNeighbors[ idx * 4:idx * 4 + 4 ]:
+            plantNeighbors[ nIdx ] -= 1
+            if plantNeighbors[ nIdx ] == 0:
+               self._frontier.discard( nIdx )
+            if nIdx in plantCells:
+               self._edge.add( nIdx )
+         
+         self._edge.discard( idx )
+         if plantNeighbors[ idx ] > 0:
+            self._frontier.add( idx )
+      
+      if self._waitingForRoom and (self._maxSize - len(self._plantCells) >= Plant.MIN_CELLS_TO_GROW):
+         self._waitingForRoom = False
+         self.wake( )
+
+   def _sweepFrontier( self, numPlantCellsToTryToGrow ):
+      '''Grow as the scan of Plant_D does, visiting only the plant cells at
+      the edge of the plant (those beside the frontier) rather than every
+      plant cell.  The others have no room to grow, so the scan draws
+      nothing for them, and the result (with the random stream) is the
+      same.'''
+      numPlantCellsGrown = 0
+      edge = self._edge
+      frontier = True
+      while frontier and (numPlantCellsGrown < numPlantCellsToTryToGrow):
+         frontier = False
+         for plantCellIdx in list(reversed(self._plantCells)):     # <- newest first, as the scan
+            if plantCellIdx not in edge:
+               continue
+            
+            for row,col in self._world.emptyCNeighbors( *divmod(plantCellIdx, self._numCols) ):
+               frontier = True
+               if numPlantCellsGrown >= numPlantCellsToTryToGrow:
+                  return numPlantCellsGrown
+               
+               if random.random() < self._randGrowthFactor:
+                  self.addPlantCell( row, col )
+                  numPlantCellsGrown += 1
+                  break
+      
+      return numPlantCellsGrown
+
+   def _numCellsToTryToGrow( self, context ):
+      return min( self._maxSize - len(self._plantCells), context.availableEnergy // Params.ENERGY_PER_PLANT_CELL )
+
+   def _sleepUntilGrowth( self, context ):
+      '''Sleep until there's energy for MIN_CELLS_TO_GROW cells (woken by
+      the context) or, if there's energy enough, room for them (woken by
+      freePlantCell()).'''
+      if context.availableEnergy // Params.ENERGY_PER_PLANT_CELL < Plant.MIN_CELLS_TO_GROW:
+         context.sleepUntilEnergy( self, Plant.MIN_CELLS_TO_GROW * Params.ENERGY_PER_PLANT_CELL )
+      else:
+         self._waitingForRoom = True
+         self.sleepUntilWoken( )
 
 
 class Plant_A( Plant ):
@@ -80,16 +301,14 @@ class Plant_A( Plant ):
    def grow( self, numPlantCellsToTryToGrow ):
       numPlantCellsGrown = 0
       
-      plantCellIds = list(self._plantCells.keys())
-      for plantCellIdent in plantCellIds:
-         plantRowCol = self._plantCells[ plantCellIdent ].position( )
+      plantCellIdxs = list(self._plantCells.keys())
+      for plantCellIdx in plantCellIdxs:
+         plantRowCol = self._plantCells[ plantCellIdx ].position( )
          for row,col in self._world.emptyNeighbors( *plantRowCol ):
             if numPlantCellsGrown >= numPlantCellsToTryToGrow:
                return numPlantCellsGrown
             
-            newCell = PlantCell( row, col )
-            PlantCell.WORLD.setAt( row, col, newCell )
-            self._plantCells[ newCell.ident() ] = newCell
+            self.addPlantCell( row, col )
             numPlantCellsGrown += 1
       
       return numPlantCellsGrown
@@ -102,53 +321,67 @@ class Plant_B( Plant ):
    def grow( self, numPlantCellsToTryToGrow ):
       numPlantCellsGrown = 0
       
-      plantCellIds = sorted(self._plantCells.keys(), reverse=True)
-      for plantCellIdent in plantCellIds:
-         plantRowCol = self._plantCells[ plantCellIdent ].position( )
+      plantCellIdxs = list(reversed(self._plantCells))          # <- newest first
+      for plantCellIdx in plantCellIdxs:
+         plantRowCol = self._plantCells[ plantCellIdx ].position( )
          for row,col in self._world.allNeighbors2( *plantRowCol ):
             if numPlantCellsGrown >= numPlantCellsToTryToGrow:
                return numPlantCellsGrown
             
-            newCell = PlantCell( row, col )
-            PlantCell.WORLD.setAt( row, col, newCell )
-            self._plantCells[ newCell.ident() ] = newCell
+            self.addPlantCell( row, col )
             numPlantCellsGrown += 1
 
       return numPlantCellsGrown
 
 
 class Plant_C( Plant ):
-   def __init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor ):
-      Plant.__init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor )
+   def __init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor, growthMode='scan' ):
+      Plant.__init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor, growthMode )
    
    def grow( self, numPlantCellsToTryToGrow ):
+      if self._growthMode == 'vectorized':
+         return self.growVectorized( numPlantCellsToTryToGrow )
+      elif self._growthMode == 'frontier':
+         return self.growFromFrontier( numPlantCellsToTryToGrow )
+      
       numPlantCellsGrown = 0
-      while numPlantCellsGrown < numPlantCellsToTryToGrow:
-         for plantCellIdent in reversed(self._plantCells):
-            plantRowCol = self._plantCells[ plantCellIdent ].position( )
+      frontier = True
+      while frontier and (numPlantCellsGrown < numPlantCellsToTryToGrow):
+         frontier = False
+         for plantCellIdx in list(reversed(self._plantCells)):     # <- grows into self._plantCells
+            plantRowCol = self._plantCells[ plantCellIdx ].position( )
             for row,col in self._world.emptyCNeighbors( *plantRowCol ):
+               frontier = True
                if numPlantCellsGrown >= numPlantCellsToTryToGrow:
                   return numPlantCellsGrown
                
                if random.random() < self._randGrowthFactor:        # 1.0 mimics Plant_A
-                  newCell = PlantCell( row, col )
-                  self._plantCells[ newCell.ident() ] = newCell
+                  self.addPlantCell( row, col )
                   numPlantCellsGrown += 1
       
       return numPlantCellsGrown
 
 
 class Plant_D( Plant ):
-   def __init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor ):
-      Plant.__init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor )
+   ONE_CHILD_PER_PARENT = True
+
+   def __init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor, growthMode='scan' ):
+      Plant.__init__( self, aWorld, maxPlantSize, energyPerCell, randGrowthFactor, growthMode )
    
    def grow( self, numPlantCellsToTryToGrow ):
+      if self._growthMode == 'vectorized':
+         return self.growVectorized( numPlantCellsToTryToGrow )
+      elif self._growthMode == 'frontier':
+         return self.growFromFrontier( numPlantCellsToTryToGrow )
+      
       numPlantCellsGrown = 0
-      while numPlantCellsGrown < numPlantCellsToTryToGrow:
-         revPlantCells = reversed(self._plantCells)
-         for plantCellIdent in revPlantCells:                    ### REQUIRES PYTHON 3.2 OR 3.3
-            plantCell = self._plantCells[ plantCellIdent ]
-            plantRowCol = self._plantCells[ plantCellIdent ].position( )
+      frontier = True
+      while frontier and (numPlantCellsGrown < numPlantCellsToTryToGrow):
+         frontier = False
+         revPlantCells = list(reversed(self._plantCells))         # <- grows into self._plantCells
+         for plantCellIdx in revPlantCells:
+            plantCell = self._plantCells[ plantCellIdx ]
+            plantRowCol = self._plantCells[ plantCellIdx ].position( )
 
             #try:
                #nbrRowCol = random.choice( self._world.emptyCNeighbors(*plantRowCol) )
@@ -159,12 +392,12 @@ class Plant_D( Plant ):
                #pass
 
             for row,col in self._world.emptyCNeighbors( *plantRowCol ):
+               frontier = True
                if numPlantCellsGrown >= numPlantCellsToTryToGrow:
                   return numPlantCellsGrown
                
                if random.random() < self._randGrowthFactor:        # 1.0 mimics Plant_A
-                  newCell = PlantCell( row, col )
-                  self._plantCells[ newCell.ident() ] = newCell
+                  self.addPlantCell( row, col )
                   numPlantCellsGrown += 1
                   break    #  <--- C differs from D only by no 'break' here
       
@@ -174,17 +407,22 @@ class Plant_D( Plant ):
 import Params
 
 class SimpleCell( Cell ):
+   '''genes is a PackedGenome.'''
    def __init__( self, aWorld, genes, generation=0, ident=None, energy=0, row=None, col=None ):
       Cell.__init__( self, aWorld, generation, ident, energy, row, col )
       self._currentState = 0
       self._genes        = genes
 
+   def genome( self ):
+      return self._genes
+
    def tick( self ):
       if self._store <= 0:
          self._behavior_die( )
       else:
+         context = self._sim.context( )
          self._store -= Params.ENERGY_PER_MOVE
-         Plant.AVAILABLE_ENERGY += Params.ENERGY_PER_MOVE
+         context.freeEnergy( Params.ENERGY_PER_MOVE )
          
          try:
             # Try to eat
@@ -193,7 +431,7 @@ class SimpleCell( Cell ):
             self._store += plantCellInst.feed( )
          except:
             try:
-               if (self._store >= Params.WELL_FED_LEVEL) and (self._age > Params.MATURITY) and (Cell.POPULATION < Params.MAX_CELL_POPULATION):
+               if (self._store >= Params.WELL_FED_LEVEL) and (self._age > Params.MATURITY) and (context.cellPopulation < Params.MAX_CELL_POPULATION):
                   self._behavior_clone( )       # <- throws if no place to put a daughter
                else:
                   nextDir = self._genes[ self._currentState ]
@@ -215,8 +453,8 @@ class SimpleCell( Cell ):
          return False
 
       # Create the daughter's genes
-      daughterGenes = self._genes[:] # <- copy the mother's genes
-      daughterGenes[ randint(0,Params.GENOME_LENGTH-1) ] = choice( Params.GENES ) # <- mutate
+      gene          = choice( Params.GENES )
+      daughterGenes = self._genes.mutated( randint(0,Params.GENOME_LENGTH-1), gene ) # <- the mother's genes, mutated
       
       # Perform the clone
       daughter = SimpleCell( self._world, daughterGenes, self._generation + 1, energy=self._store // 2, row=daughterRow, col=daughterCol )
@@ -231,6 +469,34 @@ class SimpleCell( Cell ):
       return True
 
 
+def buildEcology( aSim, aWorld, population=None ):
+   '''Set up the SimpleCell ecology described by Params in aWorld: Eve at
+   the center of the board and a plant started beside her, both added to
+   aSim, whose context must be an EcologyContext.  If population (a
+   CellPopulation already added to aSim) is given, Eve is added to it rather
+   than created as a SimpleCell.  Return the plant.'''
+   eveRow = Params.ROWS // 2
+   eveCol = Params.COLUMNS // 2
+   if population is None:
+      eve = SimpleCell( aWorld, PackedGenome(Params.EVE_GENOME), energy=Params.ENERGY_PER_PLANT_CELL, row=eveRow, col=eveCol )
+      aSim.add( eve )
+   else:
+      population.addCell( Params.EVE_GENOME, Params.ENERGY_PER_PLANT_CELL, eveRow, eveCol )
+   
+   # Create food
+   aSim.context( ).availableEnergy = (Params.MAX_PLANT_POPULATION * Params.ENERGY_PER_PLANT_CELL) - (2 * Params.ENERGY_PER_PLANT_CELL)
+   if Params.PLANT_SPECIES == 'Geometric':
+      plant = Plant_A( aWorld, Params.MAX_PLANT_POPULATION, Params.ENERGY_PER_PLANT_CELL, Params.RAND_GROWTH_FACTOR )
+   elif Params.PLANT_SPECIES == 'Sinuous':
+      plant = Plant_D( aWorld, Params.MAX_PLANT_POPULATION, Params.ENERGY_PER_PLANT_CELL, Params.RAND_GROWTH_FACTOR, Params.PLANT_GROWTH_MODE )
+   else:
+      raise Exception( 'Unknown plant species: {0}'.format(Params.PLANT_SPECIES) )
+   aSim.add( plant )
+   plant.startPlant( eveRow + 1, eveRow )
+   
+   return plant
+
+
 from chromosome import Chromosome
 class CrCell( Cell ):
    def __init__( self, chromosomes, aWorld, generation=0, ident=None, energy=0, row=None, col=None ):
@@ -1,7 +1,7 @@
 from ModelSim import *
 from CellSim import *
 from random import choice, random, randint
-from copy import copy, deepcopy
+from operator import itemgetter
 
 '''
 Message Publication
@@ -10,20 +10,82 @@ Topic        Sender      Payload dictionary          Comments
 join         PostOffice  who:   newly joined object
                          xy:    xy location          optional
 leave        PostOffice  who:   object leaving
-move         Entity      oldxy: orig row, col        =None if new object
-                         newxy: new row, col
-                         dir:   movement dir         =None if object is new
-eat          Entity      xy:    entity row,col
-                         food_xy:food row,col
-                         dir:       food dir from entity
-die          Entity      xy:        entity row, col
-clone        Entity      xy:        parent row, col
-                         dxy:       daughter row, col
-                         daughter:  daughter
-                         d_mutated: True | False     Is the daugher mutated
 horn of plenty  God                                  deploy lots of food
+
+Events Recorded (in the Simulation's EventLog; every record starts with
+tick and sender, the entity's ident interned by the log until it's dropped)
+Topic        Fields                                  Comments
+-----------  --------------------------------------  ---------------------------
+move         x, y, newX, newY, dir                   dir as DIR_NUMBER
+eat          x, y, foodX, foodY, dir                 dir to the food, as DIR_NUMBER
+die          x, y, reason                            reason interned by the log
+clone        x, y, daughterX, daughterY, mutated     mutated is 1 or 0
+turn         turn, heading                           turn is 1 (right) or -1 (left);
+                                                     heading as DIR_NUMBER
 '''
 
+class SELFContext( SimContext ):
+   '''SimContext of a SELF simulation.  Its rules are interned (see
+   rule()), so equal rules are the same object and are shared by every
+   genome holding them.'''
+   def __init__( self, entityClass=None ):
+      SimContext.__init__( self )
+      self.species = RuleSpeciesTree( entityClass or HeadedEntity )
+      self._rules  = { }   # Map: (intCond, extCond, behavior) -> the interned Rule
+
+   def rule( self, intCond, extCond, behavior ):
+      '''Return the simulation's Rule of these terms.'''
+      terms = ( intCond, extCond, behavior )
+      try:
+         return self._rules[ terms ]
+      except KeyError:
+         aRule = Rule( *terms )
+         self._rules[ terms ] = aRule
+         return aRule
+
+
+RIGHT_OF = { direction:DIRECTIONS[ (dirNum + 1) % 4 ] for dirNum,direction in enumerate(DIRECTIONS) }   # heading -> heading after a right turn
+LEFT_OF  = { direction:DIRECTIONS[ (dirNum - 1) % 4 ] for dirNum,direction in enumerate(DIRECTIONS) }   # heading -> heading after a left turn
+
+
+class Die( Exception ):
+   '''Raised by an Entity which has died, to end its tick.'''
+   pass
+
+
+class Food( WorldObject ):
+   '''A lump of food of mass units, eaten a unit at a time.  Food never
+   ticks.  Placed at xy (row, col), or at a random free position.'''
+   def __init__( self, aBoard, mass=1, xy=None ):
+      if xy is None:
+         xy = aBoard.findRandomFreePos( )
+      WorldObject.__init__( self, aBoard, xy[0], xy[1] )
+      self._mass = mass
+
+   # Specialization of Subscriber
+   def handleMessage( self, aMsg ):
+      pass
+
+   # Specialization of Model
+   def subscriptionTopics( self ):
+      return [ ]
+
+   def tickPeriod( self ):
+      return None
+
+   # Extension
+   def mass( self ):
+      return self._mass
+
+   def feed( self, who, amount=1 ):
+      '''who takes a bite of amount units.  The food is gone once it's all
+      eaten.'''
+      self._mass -= amount
+      if self._mass <= 0:
+         self._world.remove( self._r, self._c, self )
+         self._sim.drop( self )
+
+
 class God( Model ):
    def __init__( self, aBoard ):
       super().__init__( 'God' )
@@ -39,26 +101,117 @@ class God( Model ):
       return
 
    def tick( self ):
-      livingEntities = Entity.SPECIES.entitiesAliveAt( )
-      if (SIM.simTime() >= self._nextSoonestRain) and (livingEntities <= 4):
+      # Sleep through the dry spell after each rain
+      if self._sim.simTime() < self._nextSoonestRain:
+         self.sleepUntil( self._nextSoonestRain )
+         return
+
+      livingEntities = self._board.countOfType( Entity )
+      if livingEntities <= 4:
          self.hornOfPlenty(20)
+         self.sleepUntil( self._nextSoonestRain )
    
    def hornOfPlenty( self, numFoodToDeploy, massPerFood=1 ):
       for ct in range(numFoodToDeploy):
          try:
             f = Food(self._board)
-            SIM.add( f, xy=f.position() )
+            self._sim.add( f )
          except:
             pass
       
-      SIM.postMessage( Message('horn of plenty', self, self._sim.simTime()) )
-      self._nextSoonestRain = SIM.simTime() + 30
+      self.postMessage( 'horn of plenty' )
+      self._nextSoonestRain = self._sim.simTime() + 30
+
+class Rule( tuple ):
+   '''An immutable rule: (intCond, extCond, behavior).  A simulation's rules
+   are interned by its context (see SELFContext.rule()).'''
+   __slots__ = ( )
+
+   def __new__( cls, intCond, extCond, behavior ):
+      return tuple.__new__( cls, (intCond, extCond, behavior) )
+
+   def __getnewargs__( self ):
+      return tuple( self )
+
+   intCond  = property( itemgetter(0) )
+   extCond  = property( itemgetter(1) )
+   behavior = property( itemgetter(2) )
+
+   def replace( self, intCond=None, extCond=None, behavior=None ):
+      '''Return the terms of the rule with the given terms replaced.'''
+      return ( intCond or self[0], extCond or self[1], behavior or self[2] )
+
 
-class Rule( object ):
-   def __init__( self, intCond, extCond, behavior ):
-      self.intCond  = intCond
-      self.extCond  = extCond
-      self.behavior = behavior
+class Senses( object ):
+   '''What an Entity has sensed of its surroundings during one tick.  Each
+   part is sensed when it's first asked for (see Entity._senses()).  They
+   hold only for the entity's own turn in the tick; the others move too.'''
+   __slots__ = ( 'time', 'forward', 'neighbors', 'emptyMask' )
+
+   def __init__( self, time ):
+      self.time      = time
+      self.forward   = None   # (row, col, contents) of the position ahead of a HeadedEntity
+      self.neighbors = None   # Map: direction -> (row, col, contents) of the 8 neighbors
+      self.emptyMask = 0      # bit DIR_NUMBER[direction] set for each empty neighbor (once neighbors are sensed)
+
+
+class RuleGenome( SpeciesGenome ):
+   '''The genome of a SELF species: its tuple of Rules, and the program
+   compiled from them for each class of Entity (see Entity.compileRules()).'''
+   def __init__( self, parentSpeciesId, rules ):
+      SpeciesGenome.__init__( self, parentSpeciesId )
+      self._rules    = rules
+      self._programs = { }    # Map: Entity class -> compiled program
+
+   def rules( self ):
+      return self._rules
+
+   def program( self, entityClass ):
+      try:
+         return self._programs[ entityClass ]
+      except KeyError:
+         program = entityClass.compileRules( self._rules )
+         self._programs[ entityClass ] = program
+         return program
+
+   # Specialization of SpeciesGenome
+   def genes( self ):
+      return self._rules
+
+
+class RuleSpeciesTree( SpeciesTree ):
+   '''SpeciesTree of RuleGenomes.  Genomes are interned: there is one
+   species per distinct sequence of rules.  A species' rules are compiled
+   for entityClass as the species is recorded.'''
+   def __init__( self, entityClass ):
+      SpeciesTree.__init__( self )
+      self._entityClass = entityClass
+      self._speciesOf   = { }   # Map: tuple of Rules -> speciesID
+
+   def newSpecies( self, parentSpeciesId, rules ):
+      '''Return the id of the species with rules, recording a new one (a
+      descendant of parentSpeciesId) if there is none.'''
+      rules = tuple( rules )
+      try:
+         return self._speciesOf[ rules ]
+      except KeyError:
+         pass
+
+      genome = RuleGenome( parentSpeciesId, rules )
+      genome.program( self._entityClass )
+      self.recordNewSpecies( genome )
+      self._speciesOf[ rules ] = genome.ident( )
+      return genome.ident( )
+
+   def species( self, speciesId ):
+      return self._species[ speciesId ]
+
+   def report( self ):
+      for speciesId,genome in self._species.items( ):
+         print( 'Species {0:4}  parent {1!s:4}  living {2:5}  total {3:5}'.format(
+                   speciesId, genome.parentSpeciesIdent(), genome.membersAliveAt(), genome.totalMembers()) )
+         for rule in genome.rules( ):
+            print( '   {0:10} {1:20} {2}'.format(rule.intCond, rule.extCond, rule.behavior) )
 
 
 class Entity( WorldObject ):
@@ -85,6 +238,16 @@ class Entity( WorldObject ):
    MASS_OF_1_RULE                  =   10     # Each rule is 20 units of mass
    
    CHOOSE_BEHAVIOR_METHOD          = 'PRIORITIZED'  # Values: RANDOM, PRIORITIZED
+
+   # Events recorded (topic -> fields)
+   EVENT_FIELDS = {
+      'move':  ( 'x', 'y', 'newX', 'newY', 'dir' ),
+      'eat':   ( 'x', 'y', 'foodX', 'foodY', 'dir' ),
+      'die':   ( 'x', 'y', 'reason' ),
+      'clone': ( 'x', 'y', 'daughterX', 'daughterY', 'mutated' ),
+      'turn':  ( 'turn', 'heading' )
+      }
+   EVENT_INTERNED = { 'die': ( 'reason', ) }   # the fields of EVENT_FIELDS holding codes interned by the log
    
    MUTATIONS = [ 'DOUBLE RULE', 'OMITT RULE', 'CHANGE INT COND', 'CHANGE EXT COND', 'CHANGE BEHAVIOR' ]
    INT_CONDS = [ 'ANY', 'RAND_LOW', 'CAN_CLONE' ]
@@ -93,21 +256,44 @@ class Entity( WorldObject ):
    BEHAVIORS = [ 'MOVE_FORWARD', 'EAT_FORWARD', 'TURN_RIGHT', 'TURN_LEFT', 'TURN_RAND', 'CLONE' ]
    #BEHAVIORS = [ 'MOVE_RAND', 'MOVE_LINE', 'EAT_N', 'EAT_S', 'CLONE' ]  # BUMP_<dir>, EAT_ANYDIR
 
-   SPECIES = SpeciesTree( )
-   
+   # Rule vocabulary (name -> method; see compileRules()).  'ANY' compiles to no test at all.
+   CONDITIONS = {
+      'ANY':                '_test_any',
+      'RAND_LOW':           '_itest_rand_low',
+      'OBJ_FOOD_N_1':       '_xtest_food_N_1',
+      'OBJ_FOOD_S_1':       '_xtest_food_S_1',
+      'CAN_CLONE':          '_itest_can_clone',
+      'EMPTY_NEIGHBOR_POS': '_xtest_empty_neighbor_pos'
+      }
+   ACTIONS = {
+      'MOVE_RAND':          '_action_moveRandom',
+      'MOVE_LINE':          '_action_moveLine',
+      'EAT_N':              '_action_eat_N',
+      'EAT_S':              '_action_eat_S',
+      'CLONE':              '_action_clone'
+      }
+
    def __init__( self, aBoard, speciesId, ident=None, parentID=None, energy=None, xy=None ):
-      super().__init__( world, xy, ident )
+      '''The entity is placed at xy (row, col), or at a random free
+      position.'''
+      if xy is None:
+         xy = aBoard.findRandomFreePos( )
+      super().__init__( aBoard, xy[0], xy[1], ident )
       self._speciesId       = speciesId
       self._generation      = 0
       self._storeCapacity   = 200000
       self._store           = energy
-      self._rules           = Entity.SPECIES.species( speciesId ).rules( )
+      self._rules           = None    # assigned from the species in _addedToSimulation()
+      self._baseMass        = None    # mass of the cell body and rules (see _setRules())
+      self._cloneThreshold  = None    # _store must exceed this to clone (see _setRules())
+      self._program         = None    # the rules compiled for this class (see compileRules())
       self._birthTime       = 0
       self._mortality       = 0
-      self._parentId        = None
+      self._parentId        = parentID
       
       self._userDict        = { }
-      Entity.SPECIES.species( speciesId ).recordBirth( self )
+      self._senderCode      = None    # code of the ident in the simulation's EventLog (assigned in _addedToSimulation())
+      self._sensed          = None    # Senses of the current tick (see _senses())
 
    def subscriptionTopics( self ):
       return [ ]
@@ -117,22 +303,34 @@ class Entity( WorldObject ):
       
       self._birthTime = self._sim.simTime( )
       self._mortality = self._birthTime + Entity.BASE_MORTALITY
+      
+      species = self._sim.context( ).species.species( self._speciesId )
+      self._setRules( species.rules() )
+      self._program = species.program( type(self) )
+      species.recordBirth( self )
+
+      events = self._sim.events( )
+      if not events.hasTopic( 'move' ):
+         for topic,fields in Entity.EVENT_FIELDS.items( ):
+            events.defineTopic( topic, *fields, interned=Entity.EVENT_INTERNED.get(topic, ( )) )
+      self._senderCode = events.code( self._ident )
 
    def _droppedFromSimulation( self, aSimulation ):
-      pass
+      aSimulation.events( ).release( self._ident )   # <- the ident's code is reused once this tick's records are flushed
+      self._senderCode = None
 
    def handleMessage( self, aMsg ):
       pass
 
    def tick( self ):
       try:
-         if self._mortality <= SIM.simTime():
+         if self._mortality <= self._sim.simTime():
             self._action_die( self._userDict, reason='age' )
          
          self._consumeEnergy( self._basalTickEnergy() )
-         theChosenBehavior = self._chooseBehavior( )
-         if theChosenBehavior is not None:
-            self._realizeBehavior( theChosenBehavior )
+         theChosenAction = self._chooseBehavior( )
+         if theChosenAction is not None:
+            theChosenAction( self, self._userDict )
       except Die:
          pass
    
@@ -155,55 +353,82 @@ class Entity( WorldObject ):
    def mass( self ):
       return self._totalCellMass()
 
+   def birthTime( self ):
+      return self._birthTime
+
+   def _record( self, topic, *values ):
+      '''Record an event in the simulation's EventLog.'''
+      self._sim.events( ).topic( topic ).append( self._sim.simTime(), self._senderCode, *values )
+
+   @classmethod
+   def compileRules( cls, rules ):
+      '''Compile rules into a tuple of (intTest, extTest, action) functions
+      of ( entity, userDict ), looked up by name in CONDITIONS and ACTIONS.
+      A test is None where the rule's condition is 'ANY'.'''
+      def lookup( table, name ):
+         try:
+            return getattr( cls, table[name] )
+         except KeyError:
+            raise Exception( 'Unknown rule term for {0}: {1}'.format(cls.__name__, name) )
+
+      program = [ ]
+      for rule in rules:
+         intTest = None if rule.intCond == 'ANY' else lookup( cls.CONDITIONS, rule.intCond )
+         extTest = None if rule.extCond == 'ANY' else lookup( cls.CONDITIONS, rule.extCond )
+         program.append( (intTest, extTest, lookup(cls.ACTIONS, rule.behavior)) )
+      return tuple( program )
+
    def _chooseBehavior( self ):
-      # Identify applicable rules
-      ruleSet = [ ]
-      for ruleNum,rule in enumerate(self._rules):
-         if (self._test(rule.intCond) and self._test(rule.extCond)):
-            ruleSet.append( ruleNum )
-      
-      # Choose behavior
-      try:
-         if Entity.CHOOSE_BEHAVIOR_METHOD == 'PRIORITIZED':
-            ruleNum = ruleSet[ 0 ]
-         elif Entity.CHOOSE_BEHAVIOR_METHOD == 'RANDOM':
-            ruleNum = choice( ruleSet )   # The entity may be failed -- having no rules
-         else:
-            raise Exception( )
-      except:
-         return
-      
-      return self._rules[ ruleNum ].behavior
-   
-   def _test( self, condition ):
-      if condition == 'ANY':
-         return self._test_any( self._userDict )
-      if condition == 'RAND_LOW':
-         return self._itest_rand_low( self._userDict )
-      elif condition == 'OBJ_FOOD_N_1':
-         return self._xtest_food_N_1( self._userDict )
-      elif condition == 'OBJ_FOOD_S_1':
-         return self._xtest_food_S_1( self._userDict )
-      elif condition == 'CAN_CLONE':
-         return self._itest_can_clone( self._userDict )
-      elif condition == 'EMPTY_NEIGHBOR_POS':
-         return self._xtest_empty_neighbor_pos( self._userDict )
-      else:
-         raise Exception( )
-   
-   def _realizeBehavior( self, behavior ):
-      if behavior == 'MOVE_RAND':
-         self._action_moveRandom( self._userDict )
-      elif behavior == 'MOVE_LINE':
-         self._action_moveLine( self._userDict )
-      elif behavior == 'EAT_N':
-         self._action_eat_N( self._userDict )
-      elif behavior == 'EAT_S':
-         self._action_eat_S( self._userDict )
-      elif behavior == 'CLONE':
-         self._action_clone( self._userDict )
+      '''Return the action of the rule chosen to fire, or None.'''
+      userDict = self._userDict
+      if Entity.CHOOSE_BEHAVIOR_METHOD == 'PRIORITIZED':
+         # The first applicable rule fires; the rest needn't be tested
+         for intTest,extTest,action in self._program:
+            if ((intTest is None) or intTest(self, userDict)) and ((extTest is None) or extTest(self, userDict)):
+               return action
+         return None
+      elif Entity.CHOOSE_BEHAVIOR_METHOD == 'RANDOM':
+         actions = [ action for intTest,extTest,action in self._program
+                     if ((intTest is None) or intTest(self, userDict)) and ((extTest is None) or extTest(self, userDict)) ]
+         return choice( actions ) if actions else None   # The entity may be failed -- having no rules
       else:
-         raise Exception( )
+         raise Exception( 'Unknown CHOOSE_BEHAVIOR_METHOD: {0}'.format(Entity.CHOOSE_BEHAVIOR_METHOD) )
+
+   def _senses( self ):
+      '''Return the Senses of the current tick.  They start afresh each tick
+      and after each action which changes the entity's surroundings.'''
+      senses = self._sensed
+      if (senses is None) or (senses.time != self._sim.simTime()):
+         senses = Senses( self._sim.simTime() )
+         self._sensed = senses
+      return senses
+
+   def _neighbors( self ):
+      '''Return the sensed map: direction -> (row, col, contents) of the 8
+      neighboring positions.'''
+      senses = self._senses( )
+      if senses.neighbors is None:
+         senses.neighbors = self._world.neighborsOf( self._r, self._c )
+         for direction,cell in senses.neighbors.items( ):
+            if cell[2] is None:
+               senses.emptyMask |= 1 << DIR_NUMBER[ direction ]
+      return senses.neighbors
+
+   def _emptyNeighborMask( self ):
+      self._neighbors( )
+      return self._sensed.emptyMask
+
+   def _emptyNeighborDirs( self ):
+      mask = self._emptyNeighborMask( )
+      return [ direction for dirNum,direction in enumerate(ALL_DIRECTIONS) if mask & (1 << dirNum) ]
+
+   def _firstEmptyNeighbor( self ):
+      '''Return (row, col, None) of the first empty neighbor in
+      ALL_DIRECTIONS order, or None.'''
+      mask = self._emptyNeighborMask( )
+      if mask == 0:
+         return None
+      return self._neighbors( )[ ALL_DIRECTIONS[ (mask & -mask).bit_length() - 1 ] ]
 
    def _test_any( self, userDict ):
       return True
@@ -212,9 +437,7 @@ class Entity( WorldObject ):
       return random() < Entity.RAND_LOW_THREASHOLD
    
    def _xtest_food_N_1( self, userDict ):
-      objN = self._board.getAt( self._xy[0] - 1, self._xy[1] )
-      if isinstance( objN, Food ):
-         return True
+      return isinstance( self._neighbors()[ 'N' ][2], Food )
    
    def _xtest_food_NE( self, userDict ):
       pass
@@ -226,9 +449,7 @@ class Entity( WorldObject ):
       pass
    
    def _xtest_food_S_1( self, userDict ):
-      objS = self._board.getAt( self._xy[0] + 1, self._xy[1] )
-      if isinstance( objS, Food ):
-         return True
+      return isinstance( self._neighbors()[ 'S' ][2], Food )
    
    def _xtest_food_SW( self, userDict ):
       pass
@@ -240,33 +461,24 @@ class Entity( WorldObject ):
       pass
    
    def _itest_can_clone( self, userDict ):
-      return self._store > self._minimumStoreToClone()
+      return self._store > self._cloneThreshold   # <- same as self._store > self._minimumStoreToClone()
 
    def _xtest_empty_neighbor_pos( self, userDict ):
-      neighbors = self._board.allNeighborsOf( *self._xy )
-      freeCellFound = False
-      for direction,cell in neighbors.items():
-         x, y, contents = cell
-         if contents is None:
-            freeCellFound = True
-            break
-      return freeCellFound
+      return self._emptyNeighborMask( ) != 0
    
    def _action_look( self, userDict ):
       # consume the energy
       # self._consumeEnergy( 1 )  # A basic look is free of energy cost
       
       # perform the action
-      world = SIM.providers( "world" )[0]
-      return world.mNeighbors( self )
+      return self._neighbors( )
    
    def _action_probe( self, direction, userDict ):
       # consume the energy
       self._consumeEnergy( 1 )
       
       # perform the action
-      world = SIM.providers( "world" )[0]
-      return world.mLook( self, direction )
+      return self._world.getPosNeighbor( self._r, self._c, direction )
    
    def _action_moveRandom( self, userDict ):
       dirs = self._findAvailableMoveDirs_( )
@@ -276,35 +488,9 @@ class Entity( WorldObject ):
          return  # No available moves
       
       self._action_move( direction, userDict )
-      
-      return
-      # Look at the neighbors
-      availableMoves = [ ]
-      neighbors = self._board.allNeighborsOf( *self._xy )
-      for direction,cell in neighbors.items():
-         nx, ny, contents = cell
-         if contents is None:
-            availableMoves.append( direction )
-
-      # perform the action
-      try:
-         direction = choice( availableMoves )
-      except:
-         return   # No available moves
-      
-      self._action_move( direction )
 
    def _findAvailableMoveDirs_( self ):
-      # Look at the neighbors
-      availableMoves = [ ]
-      neighbors = self._board.allNeighborsOf( *self._xy )
-      
-      for direction,cell in neighbors.items():
-         nx, ny, contents = cell
-         if contents is None:
-            availableMoves.append( direction )
-      
-      return availableMoves
+      return self._emptyNeighborDirs( )
 
    def _action_moveLine( self, userDict ):
       # Decide if we change direction
@@ -314,7 +500,7 @@ class Entity( WorldObject ):
          changeDir = True
       else:
          origDirection = userDict[ '_action_moveLine' ]
-         nx, ny, neighbor = self._board.getPosNeighbor( self._xy[0], self._xy[1], origDirection )
+         nx, ny, neighbor = self._neighbors( )[ origDirection ]
          if neighbor is not None:
             changeDir = True
          else:
@@ -346,22 +532,18 @@ class Entity( WorldObject ):
       self._consumeEnergy( energyNeeded )
 
       # Perform the move
-      oldxy = self._xy
-      newxy = self._board.newPos( self._xy[0], self._xy[1], direction, 1 )
-
-      self._board.setAt( self._xy[0], self._xy[1], None )
-      self._xy = newxy
-      self._board.setAt( self._xy[0], self._xy[1], self )
+      oldRow, oldCol = self._r, self._c
+      self.moveTo( *self._world.newPos( oldRow, oldCol, direction, 1 ) )
+      self._sensed = None
       
-      self.postMessage( 'move', oldxy=oldxy, newxy=newxy, dir=direction )
+      self._record( 'move', oldRow, oldCol, self._r, self._c, DIR_NUMBER[direction] )
    
    def _action_eat_N( self, userDict ):
       # consume the energy
       self._consumeEnergy( Entity.ENERGY_TO_EAT_1_MASS )
       
       # perform the action
-      nx, ny, food = self._board.getPosNeighbor( self._xy[0], self._xy[1], 'N' )
-      food_xy = (nx, ny)
+      nx, ny, food = self._neighbors( )[ 'N' ]
       
       try:
          food.feed( who=self, amount=1 )   # take a bite
@@ -369,18 +551,18 @@ class Entity( WorldObject ):
          return
       
       self._store += Entity.ENERGY_PER_MASS
+      self._sensed = None
       
       self._mortality += Entity.ADDITIONAL_MORTALITY_UPON_EAT
       
-      self.postMessage('eat', xy=self._xy, food_xy=food_xy, dir='N')
+      self._record( 'eat', self._r, self._c, nx, ny, DIR_NUMBER['N'] )
    
    def _action_eat_S( self, userDict ):
       # consume the energy
       self._consumeEnergy( Entity.ENERGY_TO_EAT_1_MASS )
       
       # perform the action
-      nx, ny, food = self._board.getPosNeighbor( self._xy[0], self._xy[1], 'S' )
-      food_xy = ( nx, ny )
+      nx, ny, food = self._neighbors( )[ 'S' ]
       
       try:
          food.feed( who=self, amount=1 )   # take a bite
@@ -388,49 +570,24 @@ class Entity( WorldObject ):
          return
       
       self._store += Entity.ENERGY_PER_MASS
+      self._sensed = None
       
       self._mortality += Entity.ADDITIONAL_MORTALITY_UPON_EAT
       
-      SIM.postMessage( Message('eat', self, self._sim.simTime(),
-                               xy=self._xy, food_xy=food_xy,
-                               dir='S') )
+      self._record( 'eat', self._r, self._c, nx, ny, DIR_NUMBER['S'] )
    
    def _action_clone( self, userDict ):
       # Determine where to place the daughter cell
-      neighbors = self._board.allNeighborsOf( *self._xy )
-      found = False
-      for direction,cell in neighbors.items():
-         daughterX, daughterY, contents = cell
-         if contents is None:
-            found = True
-            break
-      
-      if not found:
+      place = self._firstEmptyNeighbor( )
+      if place is None:
          return
+      daughterX, daughterY, contents = place
       
       # Will the daughter be mutated
       mutateDaughter = False #random() <= Entity.MUTATION_RATE
       if mutateDaughter:
-         daughterRules = deepcopy( self._rules )
-         
-         mutationType = choice( Entity.MUTATIONS )
-         
-         if mutationType == 'DOUBLE RULE':
-            ruleToDouble = choice( daughterRules )
-            daughterRules.append( deepcopy(ruleToDouble) )
-         elif mutationType == 'OMITT RULE':
-            ruleToSkip = randint( 0, len(daughterRules) - 1 )
-            del daughterRules[ ruleToSkip ]
-         elif mutationType in [ 'CHANGE INT COND', 'CHANGE EXT COND', 'CHANGE BEHAVIOR' ]:
-            ruleToMutate = randint( 0, len(daughterRules) - 1 )
-            if mutationType == 'CHANGE INT COND':
-               daughterRules[ ruleToMutate ].intCond = choice( Entity.INT_CONDS )
-            elif mutationType == 'CHANGE EXT COND':
-               daughterRules[ ruleToMutate ].extCond = choice( Entity.EXT_CONDS )
-            elif mutationType == 'CHANGE BEHAVIOR':
-               daughterRules[ ruleToMutate ].behavior = choice( Entity.BEHAVIORS )
-         
-         daughterSpeciesId = Entity.SPECIES.newSpecies( self._speciesId, daughterRules )
+         daughterRules = self._mutatedRules( choice(Entity.MUTATIONS) )
+         daughterSpeciesId = self._sim.context( ).species.newSpecies( self._speciesId, daughterRules )
       
       else:
          daughterSpeciesId = self._speciesId
@@ -441,24 +598,46 @@ class Entity( WorldObject ):
       costToClone          = self._costToClone()
       self._consumeEnergy( costToClone )
       
-      massOfCellBody       = self._massOfCellBody()
-      massOfRules          = self._massOfRules()
-      massEnergyOfCellBase = (massOfCellBody + massOfRules) * Entity.ENERGY_PER_MASS
+      massEnergyOfCellBase = self._baseMass * Entity.ENERGY_PER_MASS
       self._consumeEnergy( massEnergyOfCellBase )
          
       # put her together
-      daughter = Entity( self._board, daughterSpeciesId, energy=(self._store/2), xy=(daughterX,daughterY) )
+      daughter = Entity( self._world, daughterSpeciesId, parentID=self._ident, energy=(self._store/2), xy=(daughterX,daughterY) )
       #daughter.report( )
       
       self._consumeEnergy( self._store/2 )
       #self.report( )
       
       # set her aloft
-      SIM.add( daughter )
+      self._sim.add( daughter )
+      self._sensed = None
       
       self._mortality += Entity.ADDITIONAL_MORTALITY_UPON_CLONE
    
-      self.postMessage( 'clone', xy=self._xy, dxy=(daughterX, daughterY), mutated=mutateDaughter )
+      self._record( 'clone', self._r, self._c, daughterX, daughterY, int(mutateDaughter) )
+
+   def _mutatedRules( self, mutationType ):
+      '''Return a new tuple of rules, the entity's own mutated as
+      mutationType says.  The rules not mutated are shared; a changed rule
+      is interned by the context.'''
+      rules = self._rules
+      if mutationType == 'DOUBLE RULE':
+         return rules + ( choice(rules), )
+      elif mutationType == 'OMITT RULE':
+         ruleToSkip = randint( 0, len(rules) - 1 )
+         return rules[ :ruleToSkip ] + rules[ ruleToSkip+1: ]
+      elif mutationType in [ 'CHANGE INT COND', 'CHANGE EXT COND', 'CHANGE BEHAVIOR' ]:
+         ruleToMutate = randint( 0, len(rules) - 1 )
+         rule = rules[ ruleToMutate ]
+         if mutationType == 'CHANGE INT COND':
+            terms = rule.replace( intCond=choice(Entity.INT_CONDS) )
+         elif mutationType == 'CHANGE EXT COND':
+            terms = rule.replace( extCond=choice(Entity.EXT_CONDS) )
+         elif mutationType == 'CHANGE BEHAVIOR':
+            terms = rule.replace( behavior=choice(Entity.BEHAVIORS) )
+         rule = self._sim.context( ).rule( *terms )
+         return rules[ :ruleToMutate ] + ( rule, ) + rules[ ruleToMutate+1: ]
+      return rules
 
    def _action_drop( self, thing, userDict ):
       self._consumeEnergy( Entity.ENERGY_TO_DROP_1_MASS )
@@ -466,16 +645,16 @@ class Entity( WorldObject ):
    
    def _action_die( self, userDict, reason=None ):
       # Remove the entity model from the simulation, and free the obj
-      self._board.setAt( self._xy[0], self._xy[1], None )
-      self.postMessage( 'die', xy=self._xy, reason=reason )
+      self._world.remove( self._r, self._c, self )
+      self._record( 'die', self._r, self._c, self._sim.events().code(reason) )
       self._sim.drop(self)
       
       # Record the death in the SpeciesHistory
-      self.SPECIES.species( self._speciesId ).recordDeath( self )
+      self._sim.context( ).species.species( self._speciesId ).recordDeath( self )
       
       # Create a food object in the entity's place of equal value
       residualMass = self._totalCellMass( ) * Entity.ENERGY_REMAINING_UPON_DEATH
-      self._sim.add( Food(world, mass=residualMass, xy=self._xy) )
+      self._sim.add( Food(self._world, mass=residualMass, xy=(self._r, self._c)) )
       
       raise Die( )
 
@@ -485,6 +664,19 @@ class Entity( WorldObject ):
       
       self._store -= energyUnits
 
+   def _setRules( self, rules ):
+      '''Assign the rules and the quantities derived from them alone.  The
+      mass of the cell body and rules is fixed from then on, so the mass and
+      energy figures below need only add the stored energy to it.'''
+      self._rules    = rules
+      self._baseMass = self._massOfCellBody() + self._massOfRules()
+
+      # _minimumStoreToClone() is  B*EPM + (B + store/EPM)*k + MIN  for base
+      # mass B and clone cost k; solved for store it's a constant.
+      cloneCost = Entity.ENERGY_TO_CLONE_1_MASS
+      self._cloneThreshold = ( (self._baseMass * (Entity.ENERGY_PER_MASS + cloneCost) + Entity.MIN_ENERGY_AFTER_CLONE)
+                               / (1 - cloneCost / Entity.ENERGY_PER_MASS) )
+
    def _massOfRules( self ):
       return len(self._rules) * Entity.MASS_OF_1_RULE
    
@@ -495,22 +687,22 @@ class Entity( WorldObject ):
       return self._storeCapacity / 10000
    
    def _totalCellMass( self ):
-      return self._massOfCellBody() + self._massOfRules() + self._massOfStoredEnergy()
+      return self._baseMass + self._store / Entity.ENERGY_PER_MASS
 
    def _basalTickEnergy( self ):
-      return self._totalCellMass() * Entity.ENERGY_TO_SURVIVE_1_MASS
+      return (self._baseMass + self._store / Entity.ENERGY_PER_MASS) * Entity.ENERGY_TO_SURVIVE_1_MASS
 
    def _energyNeededToReproduce( self ):
-      basicCellMass        = self._massOfCellBody() + self._massOfRules()
+      basicCellMass        = self._baseMass
       energyToPerformClone = basicCellMass * Entity.ENERGY_TO_CLONE_1_MASS
       energyOfMother       = basicCellMass * Entity.ENERGY_PER_MASS
       return energyToPerformClone + energyOfMother + (2 * Entity.MIN_ENERGY_AFTER_CLONE)
    
    def _costToClone( self ):
-      return self._totalCellMass() * Entity.ENERGY_TO_CLONE_1_MASS
+      return (self._baseMass + self._store / Entity.ENERGY_PER_MASS) * Entity.ENERGY_TO_CLONE_1_MASS
    
    def _prospectiveDaugherCellMass( self ):
-      baseMass = self._massOfCellBody() + self._massOfRules()
+      baseMass = self._baseMass
       baseMassAsEnergy = baseMass * Entity.ENERGY_PER_MASS
       mothersEnergyAfterClone = self._store - (baseMassAsEnergy + self._costToClone())
       
@@ -523,61 +715,52 @@ class Entity( WorldObject ):
       return daughtersMass
 
    def _minimumStoreToClone( self ):
-      baseMass = self._massOfCellBody() + self._massOfRules()
+      baseMass = self._baseMass
       baseMassAsEnergy = baseMass * Entity.ENERGY_PER_MASS
       return baseMassAsEnergy + self._costToClone() + Entity.MIN_ENERGY_AFTER_CLONE
 
 
 class HeadedEntity( Entity ):
+   CONDITIONS = dict( Entity.CONDITIONS,
+      FOOD_FORWARD      = '_xtest_food_forward',
+      EMPTY_FORWARD     = '_xtest_empty_forward',
+      NON_EMPTY_FORWARD = '_xtest_nonEmptyForward'
+      )
+   ACTIONS = dict( Entity.ACTIONS,
+      EAT_FORWARD       = '_action_eatForward',
+      MOVE_FORWARD      = '_action_moveForward',
+      TURN_RIGHT        = '_action_turnRight',
+      TURN_LEFT         = '_action_turnLeft',
+      TURN_RAND         = '_action_turnRand'
+      )
+
    def __init__( self, aBoard, speciesId, ident=None, parentID=None, energy=None, xy=None, heading=None ):
       super().__init__( aBoard, speciesId, ident, parentID, energy, xy )
       self._head = heading
       
       if heading is None:
-         self._head = choice( World.DIRECTIONS )
-
-   def _test( self, condition ):
-      if condition == 'ANY':
-         return self._test_any( self._userDict )
-      if condition == 'FOOD_FORWARD':
-         return self._xtest_food_forward( self._userDict )
-      elif condition == 'EMPTY_FORWARD':
-         return self._xtest_empty_forward( self._userDict )
-      elif condition == 'EMPTY_NEIGHBOR_POS':
-         return self._xtest_empty_neighbor_pos( self._userDict )
-      elif condition == 'CAN_CLONE':
-         return self._itest_can_clone( self._userDict )
-      elif condition == 'NON_EMPTY_FORWARD':
-         return self._xtest_nonEmptyForward( self._userDict )
-      else:
-         raise Exception( )
-   
-   def _realizeBehavior( self, behavior ):
-      if behavior == 'EAT_FORWARD':
-         self._action_eatForward( self._userDict )
-      elif behavior == 'MOVE_FORWARD':
-         self._action_moveForward( self._userDict )
-      elif behavior == 'TURN_RIGHT':
-         self._action_turnRight( self._userDict )
-      elif behavior == 'TURN_LEFT':
-         self._action_turnLeft( self._userDict )
-      elif behavior == 'TURN_RAND':
-         self._action_turnRand( self._userDict )
-      elif behavior == 'CLONE':
-         self._action_clone( self._userDict )
-      else:
-         raise Exception( )
+         self._head = choice( DIRECTIONS )
+
+   def _forward( self ):
+      '''Return the sensed (row, col, contents) of the position ahead.'''
+      senses = self._senses( )
+      if senses.forward is None:
+         if senses.neighbors is not None:
+            senses.forward = senses.neighbors[ self._head ]
+         else:
+            senses.forward = self._world.getPosNeighbor( self._r, self._c, self._head )
+      return senses.forward
 
    def _xtest_food_forward( self, userDict ):
-      nx, ny, contents = self._board.getPosNeighbor( self._xy[0], self._xy[1], self._head )
+      nx, ny, contents = self._forward( )
       return isinstance( contents, Food )
 
    def _xtest_empty_forward( self, userDict ):
-      nx, ny, contents = self._board.getPosNeighbor( self._xy[0], self._xy[1], self._head )
+      nx, ny, contents = self._forward( )
       return contents is None
    
    def _xtest_nonEmptyForward( self, userDict ):
-      nx, ny, contents = self._board.getPosNeighbor( self._xy[0], self._xy[1], self._head )
+      nx, ny, contents = self._forward( )
       return (not isinstance(contents,Food)) and (contents is not None)
    
    def _action_moveForward( self, userDict ):
@@ -586,17 +769,15 @@ class HeadedEntity( Entity ):
       self._consumeEnergy( energyNeeded )
 
       # Perform the move
-      nx, ny, contents = self._board.getPosNeighbor( self._xy[0], self._xy[1], self._head )
+      nx, ny, contents = self._forward( )
       if contents is not None:
          return
       
-      oldxy    = self._xy
-      self._board.setAt( self._xy[0], self._xy[1], None )
-      self._xy = (nx, ny)
-      newxy    = self._xy
-      self._board.setAt( self._xy[0], self._xy[1], self )
+      oldRow, oldCol = self._r, self._c
+      self.moveTo( nx, ny )
+      self._sensed = None
       
-      self.postMessage( 'move', oldxy=oldxy, newxy=newxy, dir=self._head )
+      self._record( 'move', oldRow, oldCol, nx, ny, DIR_NUMBER[self._head] )
 
    def _action_turnRight( self, userDict ):
       # Consume the energy
@@ -604,9 +785,10 @@ class HeadedEntity( Entity ):
       self._consumeEnergy( energyNeeded )
 
       # Perform the move
-      self._head = self._board.rightOf( self._head )
+      self._head = RIGHT_OF[ self._head ]
+      self._sensed = None
       
-      self.postMessage( 'turn', direction='right', heading=self._head )
+      self._record( 'turn', 1, DIR_NUMBER[self._head] )
    
    def _action_turnLeft( self, userDict ):
       # Consume the energy
@@ -614,9 +796,10 @@ class HeadedEntity( Entity ):
       self._consumeEnergy( energyNeeded )
 
       # Perform the move
-      self._head = self._board.leftOf( self._head )
+      self._head = LEFT_OF[ self._head ]
+      self._sensed = None
       
-      self.postMessage( 'turn', direction='left', heading=self._head )
+      self._record( 'turn', -1, DIR_NUMBER[self._head] )
    
    def _action_turnRand( self, userDict ):
       # Consume the energy
@@ -626,48 +809,25 @@ class HeadedEntity( Entity ):
       # Perform the move
       turnDir = choice( [ 'right', 'left' ] )
       if turnDir == 'right':
-         self._head = self._board.rightOf( self._head )
+         self._head = RIGHT_OF[ self._head ]
       else:
-         self._head = self._board.leftOf( self._head )
+         self._head = LEFT_OF[ self._head ]
+      self._sensed = None
       
-      self.postMessage( 'turn', direction=turnDir, heading=self._head )
+      self._record( 'turn', 1 if turnDir == 'right' else -1, DIR_NUMBER[self._head] )
    
    def _action_clone( self, userDict ):
       # Determine where to place the daughter cell
-      neighbors = self._board.allNeighborsOf( *self._xy )
-      found = False
-      for direction,cell in neighbors.items():
-         daughterX, daughterY, contents = cell
-         if contents is None:
-            found = True
-            break
-      
-      if not found:
+      place = self._firstEmptyNeighbor( )
+      if place is None:
          return
+      daughterX, daughterY, contents = place
       
       # Will the daughter be mutated
       mutateDaughter = False #random() <= Entity.MUTATION_RATE
       if mutateDaughter:
-         daughterRules = deepcopy( self._rules )
-         
-         mutationType = choice( Entity.MUTATIONS )
-         
-         if mutationType == 'DOUBLE RULE':
-            ruleToDouble = choice( daughterRules )
-            daughterRules.append( deepcopy(ruleToDouble) )
-         elif mutationType == 'OMITT RULE':
-            ruleToSkip = randint( 0, len(daughterRules) - 1 )
-            del daughterRules[ ruleToSkip ]
-         elif mutationType in [ 'CHANGE INT COND', 'CHANGE EXT COND', 'CHANGE BEHAVIOR' ]:
-            ruleToMutate = randint( 0, len(daughterRules) - 1 )
-            if mutationType == 'CHANGE INT COND':
-               daughterRules[ ruleToMutate ].intCond = choice( Entity.INT_CONDS )
-            elif mutationType == 'CHANGE EXT COND':
-               daughterRules[ ruleToMutate ].extCond = choice( Entity.EXT_CONDS )
-            elif mutationType == 'CHANGE BEHAVIOR':
-               daughterRules[ ruleToMutate ].behavior = choice( Entity.BEHAVIORS )
-         
-         daughterSpeciesId = Entity.SPECIES.newSpecies( self._speciesId, daughterRules )
+         daughterRules = self._mutatedRules( choice(Entity.MUTATIONS) )
+         daughterSpeciesId = self._sim.context( ).species.newSpecies( self._speciesId, daughterRules )
       
       else:
          daughterSpeciesId = self._speciesId
@@ -678,32 +838,30 @@ class HeadedEntity( Entity ):
       costToClone          = self._costToClone()
       self._consumeEnergy( costToClone )
       
-      massOfCellBody       = self._massOfCellBody()
-      massOfRules          = self._massOfRules()
-      massEnergyOfCellBase = (massOfCellBody + massOfRules) * Entity.ENERGY_PER_MASS
+      massEnergyOfCellBase = self._baseMass * Entity.ENERGY_PER_MASS
       self._consumeEnergy( massEnergyOfCellBase )
          
       # put her together
-      daughter = HeadedEntity( self._board, daughterSpeciesId, energy=(self._store/2), xy=(daughterX,daughterY) )
+      daughter = HeadedEntity( self._world, daughterSpeciesId, parentID=self._ident, energy=(self._store/2), xy=(daughterX,daughterY) )
       #daughter.report( )
       
       self._consumeEnergy( self._store/2 )
       #self.report( )
       
       # set her aloft
-      SIM.add( daughter )
+      self._sim.add( daughter )
+      self._sensed = None
       
       self._mortality += Entity.ADDITIONAL_MORTALITY_UPON_CLONE
    
-      self.postMessage( 'clone', xy=self._xy, dxy=(daughterX, daughterY), mutated=mutateDaughter )
+      self._record( 'clone', self._r, self._c, daughterX, daughterY, int(mutateDaughter) )
 
    def _action_eatForward( self, userDict ):
       # consume the energy
       self._consumeEnergy( Entity.ENERGY_TO_EAT_1_MASS )
       
       # perform the action
-      nx, ny, food = self._board.getPosNeighbor( self._xy[0], self._xy[1], self._head )
-      food_xy = (nx, ny)
+      nx, ny, food = self._forward( )
       
       try:
          food.feed( who=self, amount=1 )   # take a bite
@@ -711,50 +869,204 @@ class HeadedEntity( Entity ):
          return
       
       self._store += Entity.ENERGY_PER_MASS
+      self._sensed = None
       
       self._mortality += Entity.ADDITIONAL_MORTALITY_UPON_EAT
       
-      self.postMessage('eat', xy=self._xy, food_xy=food_xy, dir=self._head)
+      self._record( 'eat', self._r, self._c, nx, ny, DIR_NUMBER[self._head] )
    
 
-SIM = Simulation( )
+if __name__ == '__main__':
+   # Self-check: the compiled programs choose the action the rule walk they
+   # replace chose, testing every rule's conditions by name and firing the
+   # first rule (PRIORITIZED) or any rule (RANDOM) whose conditions hold.
+   # RAND_LOW is made certain or impossible so both see the same outcome.
+   def ruleWalk( entity ):
+      entityClass = type( entity )
+      def test( condition ):
+         return (condition == 'ANY') or getattr( entity, entityClass.CONDITIONS[condition] )( entity._userDict )
+      return [ getattr( entityClass, entityClass.ACTIONS[rule.behavior] )
+               for rule in entity._rules if test(rule.intCond) and test(rule.extCond) ]
 
+   def randomRules( aContext ):
+      return [ aContext.rule( choice(Entity.INT_CONDS), choice(Entity.EXT_CONDS), choice(Entity.BEHAVIORS) ) for ruleNum in range( randint(1, 6) ) ]
 
-world = World( 15, 15 )
+   def populate( aSim, aWorld, numEntities, numFood ):
+      species = aSim.context( ).species
+      for entityNum in range( numEntities ):
+         speciesId = species.newSpecies( None, randomRules(aSim.context()) )
+         aSim.add( HeadedEntity(aWorld, speciesId, energy=randint(0, 20000)) )
+      for foodNum in range( numFood ):
+         aSim.add( Food(aWorld) )
+      return [ model for model in aSim if isinstance(model, Entity) ]
 
-logger = Monitor(world)
-SIM.add( logger )
+   savedThreshold, savedMethod = Entity.RAND_LOW_THREASHOLD, Entity.CHOOSE_BEHAVIOR_METHOD
+   chosen = 0
+   for trial in range( 200 ):
+      checkSim = Simulation( SELFContext() )
+      entities = populate( checkSim, World( 6, 6 ), 8, 10 )
+      for threshold in ( 0.0, 1.0 ):
+         Entity.RAND_LOW_THREASHOLD = threshold
+         for entity in entities:
+            walked = ruleWalk( entity )
+            Entity.CHOOSE_BEHAVIOR_METHOD = 'PRIORITIZED'
+            assert entity._chooseBehavior( ) is (walked[0] if walked else None)
+            Entity.CHOOSE_BEHAVIOR_METHOD = 'RANDOM'
+            action = entity._chooseBehavior( )
+            assert (action in walked) if walked else (action is None)
+            chosen += bool( walked )
+   Entity.RAND_LOW_THREASHOLD, Entity.CHOOSE_BEHAVIOR_METHOD = savedThreshold, savedMethod
+   print( 'rule programs ok ({0} choices)'.format(chosen) )
 
-god = God( world )
-SIM.add( god )
+   # Self-check: the tests read from an entity's Senses agree with the
+   # board queried afresh for each test, as each rule used to, at the start
+   # of every tick and after each entity's own actions.
+   def directTests( entity ):
+      world, row, col = entity._world, entity._r, entity._c
+      ahead     = world.getPosNeighbor( row, col, entity._head )[2]
+      neighbors = world.neighborsOf( row, col )
+      return { 'FOOD_FORWARD':       isinstance( ahead, Food ),
+               'EMPTY_FORWARD':      ahead is None,
+               'NON_EMPTY_FORWARD':  (ahead is not None) and not isinstance( ahead, Food ),
+               'EMPTY_NEIGHBOR_POS': any( contents is None for nRow,nCol,contents in neighbors.values() ),
+               'OBJ_FOOD_N_1':       isinstance( neighbors['N'][2], Food ),
+               'OBJ_FOOD_S_1':       isinstance( neighbors['S'][2], Food ) }
 
-# Create Eve - our first entity
-rules = [ ]
-rules.append( Rule( 'ANY',       'FOOD_FORWARD',       'EAT_FORWARD'     ) )
-rules.append( Rule( 'CAN_CLONE', 'EMPTY_NEIGHBOR_POS', 'CLONE'           ) )
-rules.append( Rule( 'ANY',       'EMPTY_FORWARD',      'MOVE_FORWARD'    ) )
-rules.append( Rule( 'ANY',       'NON_EMPTY_FORWARD',  'TURN_RIGHT'      ) )
-speciesId = Entity.SPECIES.newSpecies( None, rules )
+   def checkSenses( entity ):
+      for condition,expected in directTests( entity ).items( ):
+         assert getattr( entity, HeadedEntity.CONDITIONS[condition] )( entity._userDict ) == expected, condition
 
-eve = HeadedEntity(world, speciesId, ident='E', energy=10000)
-SIM.add( eve, xy=eve.position() )
+   class CheckedEntity( HeadedEntity ):
+      def tick( self ):
+         HeadedEntity.tick( self )
+         if self._simSlot is not None:   # <- still alive
+            checkSenses( self )
 
-print( '### Species Report ###' )
-Entity.SPECIES.report( )
+   checks = 0
+   for trial in range( 20 ):
+      checkSim = Simulation( SELFContext(CheckedEntity) )
+      checkWorld = World( 8, 8 )
+      for entityNum in range( 6 ):
+         speciesId = checkSim.context( ).species.newSpecies( None, randomRules(checkSim.context()) )
+         checkSim.add( CheckedEntity(checkWorld, speciesId, energy=randint(5000, 20000)) )
+      for foodNum in range( 15 ):
+         checkSim.add( Food(checkWorld, mass=3) )
+      for tick in range( 50 ):
+         for entity in [ model for model in checkSim if isinstance(model, Entity) ]:
+            checkSenses( entity )
+            entity._sensed = None   # <- sensed for the check, not in the entity's turn
+            checks += 1
+         checkSim.advanceSim( )
+   print( 'senses ok ({0} entity ticks)'.format(checks) )
 
-print( )
-print( )
-print( '### Entity Report: Eve ###' )
-eve.report()
+   # Self-check: the figures derived from the cached base mass and clone
+   # threshold match those computed from scratch, as they used to be, for
+   # entities of 1 to 12 rules and stores on either side of the threshold.
+   from math import isclose
 
-god.hornOfPlenty( 40 )
+   def figuresFromScratch( entity ):
+      baseMass  = entity._massOfCellBody( ) + len(entity._rules) * Entity.MASS_OF_1_RULE
+      totalMass = baseMass + entity._store / Entity.ENERGY_PER_MASS
+      costToClone = totalMass * Entity.ENERGY_TO_CLONE_1_MASS
+      return ( totalMass, totalMass * Entity.ENERGY_TO_SURVIVE_1_MASS, costToClone,
+               baseMass * Entity.ENERGY_PER_MASS + costToClone + Entity.MIN_ENERGY_AFTER_CLONE )
 
-for tick in range( 3000 ):
-   if Entity.SPECIES.entitiesAliveAt() == 0:
-      break
-   
-   SIM.advanceSim( )
+   compared = 0
+   checkSim = Simulation( SELFContext() )
+   checkWorld = World( 10, 10 )
+   for numRules in range( 1, 13 ):
+      speciesId = checkSim.context( ).species.newSpecies( None, [ checkSim.context().rule('ANY', 'ANY', 'CLONE') ] * numRules )
+      entity = HeadedEntity( checkWorld, speciesId, energy=0 )
+      checkSim.add( entity )
+      threshold = entity._cloneThreshold
+      for store in [ randint(0, 40000) for storeNum in range(200) ] + [ threshold - 0.01, threshold + 0.01 ]:
+         entity._store = store
+         totalMass, basalEnergy, costToClone, minimumStore = figuresFromScratch( entity )
+         assert isclose( entity._totalCellMass(), totalMass )
+         assert isclose( entity._basalTickEnergy(), basalEnergy )
+         assert isclose( entity._costToClone(), costToClone )
+         assert isclose( entity._minimumStoreToClone(), minimumStore )
+         assert entity._itest_can_clone( entity._userDict ) == (store > minimumStore)
+         compared += 1
+   print( 'mass figures ok ({0} stores)'.format(compared) )
+
+   # Self-check: a mutated genome shares the rules left alone with its
+   # parent's, a changed rule is the one the context interned for its terms,
+   # and the species of a genome is found again from equal rules.
+   mutated = 0
+   checkSim = Simulation( SELFContext() )
+   checkContext = checkSim.context( )
+   checkWorld = World( 10, 10 )
+   for trial in range( 200 ):
+      rules = randomRules( checkContext )
+      speciesId = checkContext.species.newSpecies( None, rules + [ choice(rules) ] )
+      entity = HeadedEntity( checkWorld, speciesId, energy=0 )
+      checkSim.add( entity )
+      parentRules = entity._rules
+      for mutationType in Entity.MUTATIONS:
+         daughterRules = entity._mutatedRules( mutationType )
+         if mutationType == 'DOUBLE RULE':
+            assert len(daughterRules) == len(parentRules) + 1
+            assert daughterRules[ :-1 ] == parentRules and any( daughterRules[-1] is rule for rule in parentRules )
+         elif mutationType == 'OMITT RULE':
+            assert len(daughterRules) == len(parentRules) - 1
+            assert all( any(rule is parentRule for parentRule in parentRules) for rule in daughterRules )
+         else:
+            assert len(daughterRules) == len(parentRules)
+            changed = [ num for num,rule in enumerate(daughterRules) if rule is not parentRules[num] ]
+            assert len(changed) <= 1
+            for num in changed:
+               assert daughterRules[ num ] is checkContext.rule( *daughterRules[num] )
+         daughterId = checkContext.species.newSpecies( speciesId, daughterRules )
+         assert daughterId == checkContext.species.newSpecies( speciesId, list(daughterRules) )
+         assert (daughterId == speciesId) == (daughterRules == parentRules)
+         mutated += 1
+      checkSim.drop( entity )
+      checkWorld.remove( entity._r, entity._c, entity )
+   print( 'mutations ok ({0} mutated genomes)'.format(mutated) )
+
+   sim = Simulation( SELFContext() )
+   context = sim.context( )
+   species = context.species
+
+
+   world = World( 15, 15 )
+
+   logger = Monitor( world, countTypes=(Entity, Food) )
+   sim.add( logger )
+   sim.subscribeAsync( logger, *logger.subscriptionTopics(), policy=AsyncSubscriber.DROP_OLDEST )   # <- printing mustn't stall the ticks
+
+   god = God( world )
+   sim.add( god )
+
+   # Create Eve - our first entity
+   rules = [ ]
+   rules.append( context.rule( 'ANY',       'FOOD_FORWARD',       'EAT_FORWARD'     ) )
+   rules.append( context.rule( 'CAN_CLONE', 'EMPTY_NEIGHBOR_POS', 'CLONE'           ) )
+   rules.append( context.rule( 'ANY',       'EMPTY_FORWARD',      'MOVE_FORWARD'    ) )
+   rules.append( context.rule( 'ANY',       'NON_EMPTY_FORWARD',  'TURN_RIGHT'      ) )
+   speciesId = species.newSpecies( None, rules )
+
+   eve = HeadedEntity(world, speciesId, ident='E', energy=10000)
+   sim.add( eve )
+
+   print( '### Species Report ###' )
+   species.report( )
+
+   print( )
+   print( )
+   print( '### Entity Report: Eve ###' )
+   eve.report()
+
+   god.hornOfPlenty( 40 )
+
+   for tick in range( 3000 ):
+      if species.entitiesAliveAt() == 0:
+         break
+
+      sim.advanceSim( )
 
-SIM.advanceSim( )
+   sim.advanceSim( )
+   sim.drainAsync( )
 
-print( 'DONE' )
\ No newline at end of file
+   print( 'DONE' )
@@ -0,0 +1,252 @@
+'''Binary logs of the age at death of cells, by gene count.
+
+An AgeAtDeathTracker follows one gene: for each number of copies of the gene
+a genome may have (its bucket) it keeps the number of such cells died so
+far, the total of their ages at death and so the mean.  Each death updates
+one bucket, and the bucket's new figures are appended to a stats file as a
+record of RECORD:
+
+   tick       simulation time of the death (-1 if not known)
+   bucket     the number of copies of the gene in the dead cell's genome
+   n          cells died so far with that many copies
+   totalAge   total of their ages at death
+   mean       totalAge / n
+
+A stats file is HEADER followed by the records, packed little-endian with no
+padding, so a file can be appended to (StatsWriter) and read back as a
+memory-mapped NumPy structured array (readStats()) whose columns are
+stats['tick'], stats['bucket'], etc.  The state of the table after any
+record is recovered by taking the last record of each bucket up to it.
+
+The text dumps written by earlier versions (n-stats.txt, r-stats.txt: the
+whole table printed as a dict per death) are converted by convertTextStats(),
+or from the command line:
+
+   python StatsLog.py TEXTFILE [STATSFILE]
+
+Run without arguments, the module checks itself.'''
+import numpy as np
+
+import ast
+import io
+import os
+import struct
+import sys
+
+
+RECORD = np.dtype( [ ('tick', '<i8'), ('bucket', '<i4'), ('n', '<i8'), ('totalAge', '<i8'), ('mean', '<f8') ] )
+MAGIC  = b'EVSTATS1'
+HEADER = struct.Struct( '<8sI' )   # MAGIC, RECORD.itemsize
+
+
+class StatsWriter( object ):
+   '''Appends records to a stats file, chunkSize records at a time.  An
+   existing file is appended to.
+
+   A pickled writer (as in a Checkpoint) remembers the length of its file
+   and the records it hadn't written; unpickled, it cuts the file back to
+   that length, dropping anything written since, and carries on.'''
+   def __init__( self, filename, chunkSize=4096 ):
+      self._filename = filename
+      self._chunk    = np.zeros( chunkSize, dtype=RECORD )
+      self._count    = 0    # records in _chunk not yet written
+
+      if os.path.exists( filename ) and (os.path.getsize(filename) > 0):
+         readHeader( filename )
+         self._file = open( filename, 'ab' )
+      else:
+         self._file = open( filename, 'wb' )
+         self._file.write( HEADER.pack(MAGIC, RECORD.itemsize) )
+
+   def __getstate__( self ):
+      # Nothing is written or flushed:  in a forked child (see Checkpoint)
+      # the file is shared with the parent.
+      state = dict( self.__dict__ )
+      state[ '_file' ] = self._file.tell( ) if not self._file.closed else None
+      return state
+
+   def __setstate__( self, state ):
+      self.__dict__.update( state )
+      length = self._file
+      if length is None:   # <- closed when pickled
+         self._file = io.BytesIO( )
+         self._file.close( )
+         return
+
+      self._file = open( self._filename, 'r+b' )
+      self._file.truncate( length )
+      self._file.seek( length )
+
+   def __enter__( self ):
+      return self
+
+   def __exit__( self, *excInfo ):
+      self.close( )
+
+   def record( self, tick, bucket, n, totalAge, mean ):
+      self._chunk[ self._count ] = ( tick, bucket, n, totalAge, mean )
+      self._count += 1
+      if self._count == len(self._chunk):
+         self.flush( )
+
+   def flush( self ):
+      '''Write the records held so far.'''
+      if self._count:
+         self._file.write( self._chunk[ :self._count ].tobytes() )
+         self._count = 0
+      self._file.flush( )
+
+   def close( self ):
+      if not self._file.closed:
+         self.flush( )
+         self._file.close( )
+
+
+class AgeAtDeathTracker( object ):
+   '''Tally of the ages at death of cells by the number of copies of gene in
+   their genomes, logged to writer (a StatsWriter) if given.'''
+   def __init__( self, gene, writer=None, genomeLength=None ):
+      if genomeLength is None:
+         import Params
+         genomeLength = Params.GENOME_LENGTH
+
+      self._gene     = gene
+      self._writer   = writer
+      self._num      = [ 0 ] * (genomeLength + 1)
+      self._totalAge = [ 0 ] * (genomeLength + 1)
+
+   def gene( self ):
+      return self._gene
+
+   def writer( self ):
+      return self._writer
+
+   def recordDeath( self, tick, genome, age ):
+      '''Record the death at tick of a cell of age with genome (a sequence of
+      genes).'''
+      bucket = ''.join( genome ).count( self._gene )
+      self._num[ bucket ]      += 1
+      self._totalAge[ bucket ] += age
+      if self._writer is not None:
+         num, totalAge = self._num[ bucket ], self._totalAge[ bucket ]
+         self._writer.record( tick, bucket, num, totalAge, totalAge / num )
+
+   def table( self ):
+      '''Return the tally as a dict: bucket -> [ n, totalAge, mean ].'''
+      return { bucket:[ num, totalAge, (totalAge / num) if num else 0 ]
+               for bucket,(num,totalAge) in enumerate(zip(self._num, self._totalAge)) }
+
+
+def readHeader( filename ):
+   '''Check that filename is a stats file of RECORDs.'''
+   with open( filename, 'rb' ) as statsFile:
+      header = statsFile.read( HEADER.size )
+
+   if len(header) < HEADER.size:
+      raise Exception( '{0} is not a stats file.'.format(filename) )
+
+   magic, itemSize = HEADER.unpack( header )
+   if magic != MAGIC:
+      raise Exception( '{0} is not a stats file.'.format(filename) )
+   if itemSize != RECORD.itemsize:
+      raise Exception( '{0} has records of {1} bytes, expected {2}.'.format(filename, itemSize, RECORD.itemsize) )
+
+def readStats( filename ):
+   '''Return the records of the stats file as a read-only memory-mapped
+   structured array of RECORD.  A partly written last record is ignored.'''
+   readHeader( filename )
+   count = (os.path.getsize( filename ) - HEADER.size) // RECORD.itemsize
+   if count == 0:
+      return np.zeros( 0, dtype=RECORD )
+
+   return np.memmap( filename, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count,) )
+
+def convertTextStats( textFilename, statsFilename ):
+   '''Convert a text dump of tracker tables, one dict per line, to a stats
+   file.  Each line is compared with the one before it and a record written
+   for each bucket that changed; the text has no times, so tick is -1.
+   Return the number of records written.'''
+   written  = 0
+   previous = { }
+   with open( textFilename ) as textFile, StatsWriter( statsFilename ) as writer:
+      for line in textFile:
+         line = line.strip( )
+         if not line:
+            continue
+
+         table = ast.literal_eval( line )
+         for bucket,figures in sorted( table.items() ):
+            if figures != previous.get( bucket, [ 0, 0, 0 ] ):
+               num, totalAge, mean = figures
+               writer.record( -1, bucket, num, totalAge, mean )
+               written += 1
+         previous = table
+
+   return written
+
+def main( argv=None ):
+   argv = sys.argv[1:] if argv is None else argv
+   if len(argv) not in ( 1, 2 ):
+      print( 'usage: python StatsLog.py TEXTFILE [STATSFILE]' )
+      return 2
+
+   textFilename  = argv[0]
+   statsFilename = argv[1] if len(argv) == 2 else os.path.splitext( textFilename )[0] + '.stats'
+   written = convertTextStats( textFilename, statsFilename )
+   print( '{0}: {1} records written to {2}'.format(textFilename, written, statsFilename) )
+
+
+if __name__ == '__main__':
+   if len(sys.argv) > 1:
+      sys.exit( main() )
+
+   # Self-check: the records of a tracker's writer, those converted from
+   # the text dump of its tables and the tables themselves agree, across
+   # chunks, and a pickled writer cuts its file back when unpickled.
+   from random import choice, randint
+   import pickle
+   import tempfile
+   import timeit
+
+   with tempfile.TemporaryDirectory( ) as tmpDir:
+      statsFilename = os.path.join( tmpDir, 'n.stats' )
+      textFilename  = os.path.join( tmpDir, 'n-stats.txt' )
+      with StatsWriter( statsFilename, chunkSize=64 ) as writer, open( textFilename, 'w' ) as textFile:
+         tracker = AgeAtDeathTracker( 'n', writer, genomeLength=8 )
+         for tick in range( 1000 ):
+            tracker.recordDeath( tick, [ choice('nrlf') for geneNum in range(8) ], randint(0, 500) )
+            print( tracker.table(), file=textFile )
+
+      stats = readStats( statsFilename )
+      assert len(stats) == 1000 and list( stats['tick'] ) == list( range(1000) )
+      table = { bucket:[ 0, 0, 0 ] for bucket in range(9) }
+      for record in stats:
+         table[ int(record['bucket']) ] = [ int(record['n']), int(record['totalAge']), float(record['mean']) ]
+      assert table == tracker.table( )
+
+      convertedFilename = os.path.join( tmpDir, 'n-converted.stats' )
+      assert convertTextStats( textFilename, convertedFilename ) == 1000
+      converted = readStats( convertedFilename )
+      assert (converted['tick'] == -1).all( )
+      for field in ( 'bucket', 'n', 'totalAge', 'mean' ):
+         assert (converted[ field ] == stats[ field ]).all( ), field
+      del stats, converted   # <- release the memory maps
+
+      writer = StatsWriter( statsFilename, chunkSize=64 )
+      writer.record( 1000, 0, 1, 1, 1.0 )
+      saved = pickle.dumps( writer )
+      for tick in range( 1001, 1200 ):
+         writer.record( tick, 0, 1, 1, 1.0 )
+      writer.close( )
+      assert len(readStats( statsFilename )) == 1200
+      pickle.loads( saved ).close( )
+      assert len(readStats( statsFilename )) == 1001
+      print( 'stats ok' )
+
+      writer = StatsWriter( os.path.join(tmpDir, 'timing.stats') )
+      def record( ):
+         for tick in range( 1000 ):
+            writer.record( tick, 3, tick, tick * 10, 10.0 )
+
+      print( '==> ', timeit.timeit( 'record()', setup='from __main__ import record', number=100 ) )
+      writer.close( )
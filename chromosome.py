@@ -58,9 +58,8 @@ class CoordinatingChromosome( Chromosome ):
       return CoordinatingChromosome( *clonedSubordinates )
 
    def express( self, message, cell, environment ):
-      from SimpleCellSim import Plant
       cell._store -= Params.ENERGY_PER_MOVE
-      Plant.AVAILABLE_ENERGY += Params.ENERGY_PER_MOVE
+      cell._sim.context( ).freeEnergy( Params.ENERGY_PER_MOVE )
       
       for sub in self._subordinates:
          try:
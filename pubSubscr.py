@@ -1,22 +1,33 @@
+from collections import deque
+import threading
+
+
 class Message( object ):
-   NEXT_SERIAL_NO = 0
+   __slots__ = ( 'serialNo', 'time', 'topic', 'sender', 'payload', '_pooled' )
+
    def __init__( self, topic, sender, time, **payload ):
-      self.serialNo = Message.NEXT_SERIAL_NO
+      self.serialNo = None    # Assigned by the PostOffice the message is posted to
       self.time     = time
 
       self.topic    = topic
       self.sender   = sender
       self.payload  = payload
-
-      Message.NEXT_SERIAL_NO += 1
+      self._pooled  = False   # True if owned by a PostOffice's pool (see PostOffice.post())
 
    def __getitem__( self, key ):
       return self.payload[ key ]
 
+   def copy( self ):
+      '''Return an unpooled copy of the message, safe to keep after the
+      message has been delivered.'''
+      result = Message( self.topic, self.sender, self.time, **self.payload )
+      result.serialNo = self.serialNo
+      return result
+
    def __str__( self ):
       result = '[{0:05}] {1:05} - {2:10}: sender=\'{3}\''.format(
                    self.time, self.serialNo, self.topic, self.sender.ident())
-      
+
       for key,val in self.payload.items():
          result += '; {0}={1}'.format(key, val)
 
@@ -29,61 +40,326 @@ class Subscriber( object ):
       raise NotImplementedError( )
 
 
+class AsyncSubscriber( Subscriber ):
+   '''Delivers messages to a slow subscriber (a logger, an exporter) on a
+   thread of its own through a bounded queue, so it doesn't hold up the
+   delivering thread.  Messages are copied as they're queued.  When the
+   queue is full the policy decides:
+      BLOCK        wait for room
+      DROP_OLDEST  drop the oldest queued message to make room
+      SAMPLE       keep one in every sampleRate of the messages arriving
+                   while it's full, dropping the oldest to make room for
+                   it, and drop the rest
+   Exceptions raised by the subscriber are counted in errors and otherwise
+   ignored.  Pickling keeps the subscriber, the options and the queued
+   messages; the unpickled copy starts a thread of its own.'''
+   BLOCK       = 'block'
+   DROP_OLDEST = 'drop_oldest'
+   SAMPLE      = 'sample'
+
+   def __init__( self, aSubscriber, maxSize=1024, policy=BLOCK, sampleRate=10 ):
+      if policy not in ( AsyncSubscriber.BLOCK, AsyncSubscriber.DROP_OLDEST, AsyncSubscriber.SAMPLE ):
+         raise Exception( 'Unknown backpressure policy: {0}'.format(policy) )
+
+      self._subscriber = aSubscriber
+      self._maxSize    = maxSize
+      self._policy     = policy
+      self._sampleRate = sampleRate
+      self._queue      = deque( )
+      self._busy       = False   # True while the thread is handling a message
+      self._closed     = False
+      self._arrivals   = 0       # messages arrived while the queue was full (SAMPLE)
+      self.dropped     = 0       # messages dropped by the policy
+      self.errors      = 0       # exceptions raised by the subscriber
+      self._start( )
+
+   def __getstate__( self ):
+      # The lock isn't taken: in a forked child (see Checkpoint) it may be
+      # held by a thread that no longer exists.
+      state = dict( self.__dict__ )
+      del state[ '_ready' ], state[ '_thread' ]
+      state[ '_queue' ] = list( self._queue )
+      state[ '_busy' ]  = False
+      return state
+
+   def __setstate__( self, state ):
+      self.__dict__.update( state )
+      self._queue = deque( self._queue )
+      self._start( )
+
+   # Specialization of Subscriber
+   def handleMessage( self, aMsg ):
+      if aMsg._pooled:
+         aMsg = aMsg.copy( )
+
+      with self._ready:
+         if len(self._queue) >= self._maxSize:
+            if self._policy == AsyncSubscriber.BLOCK:
+               while (len(self._queue) >= self._maxSize) and not self._closed:
+                  self._ready.wait( )
+            else:
+               self._arrivals += 1
+               self.dropped   += 1
+               if (self._policy == AsyncSubscriber.SAMPLE) and (self._arrivals % self._sampleRate != 0):
+                  return
+               self._queue.popleft( )
+
+         self._queue.append( aMsg )
+         self._ready.notify_all( )
+
+   # Extension
+   def subscriber( self ):
+      return self._subscriber
+
+   def drain( self ):
+      '''Wait until every queued message has been handled.'''
+      with self._ready:
+         while (self._queue or self._busy) and self._thread.is_alive():
+            self._ready.wait( )
+
+   def close( self ):
+      '''Handle the messages still queued, then stop the thread.'''
+      with self._ready:
+         self._closed = True
+         self._ready.notify_all( )
+      self._thread.join( )
+
+   def _start( self ):
+      self._ready  = threading.Condition( )
+      self._thread = threading.Thread( target=self._run, name='AsyncSubscriber', daemon=True )
+      self._thread.start( )
+
+   def _run( self ):
+      while True:
+         with self._ready:
+            while not self._queue:
+               if self._closed:
+                  return
+               self._ready.wait( )
+
+            aMsg = self._queue.popleft( )
+            self._busy = True
+            self._ready.notify_all( )
+
+         try:
+            self._subscriber.handleMessage( aMsg )
+         except Exception:
+            self.errors += 1
+         finally:
+            with self._ready:
+               self._busy = False
+               self._ready.notify_all( )
+
+
 class PostOffice( object ):
+   '''Subscribers to '*' receive every message, once.  Delivery looks up a
+   tuple of the subscribers to the message's topic followed by the '*'
+   subscribers; the tuples are built on first use and thrown away
+   whenever a subscription changes.
+
+   Messages made by post() come from a pool and go back to it once
+   delivered, so a handler must copy() a message it wants to keep.
+   Messages made directly and passed to postMessage() are never
+   recycled.
+
+   A subscriber registered with subscribeAsync() is handed its messages
+   on a thread of its own (see AsyncSubscriber); drainAsync() waits for
+   them to be handled.'''
+   MAX_POOL_SIZE = 1024
+
    def __init__( self ):
-      self._subscriptions  = { '*':[ ] }  # Map: topic -> list of Subscriber instances
+      self._subscriptions  = { }          # Map: topic -> dict of Subscriber instances (used as an ordered set)
+      self._wildcard       = { }          # dict of the Subscribers to '*'
+      self._dispatch       = { }          # Map: topic -> tuple of the Subscribers to deliver to
       self._postedMessages = [ ]          # Messages not yet delivered
+      self._nextSerialNo   = 0            # Serial number of the next message posted
+      self._pool           = [ ]          # delivered pooled Messages available for reuse
+      self._async          = { }          # Map: Subscriber -> its AsyncSubscriber
 
    # Extension
    def subscribeTo( self, aSubscriber, *topics ):
       '''Register a Subscriber to one or more topics.'''
-      if '*' in topics:
-         self._subscriptions[ '*' ].append( aSubscriber )
-         for topic in self._subscriptions.values():
-            topic.append( aSubscriber )
-      else:
-         for topic in topics:
-            try:
-               self._subscriptions[topic].append( aSubscriber )
-            except:
-               self._subscriptions[topic] = [ aSubscriber ] + self._subscriptions[ '*' ]
+      for topic in topics:
+         if topic == '*':
+            self._wildcard[ aSubscriber ] = None
+         else:
+            self._subscriptions.setdefault( topic, { } )[ aSubscriber ] = None
+      self._dispatch.clear( )
+
+   def subscribeAsync( self, aSubscriber, *topics, maxSize=1024, policy=AsyncSubscriber.BLOCK, sampleRate=10 ):
+      '''Register a Subscriber to one or more topics, to be delivered to on
+      a thread of its own.  Return its AsyncSubscriber.  The queue options
+      apply when the subscriber is first registered this way.'''
+      try:
+         wrapper = self._async[ aSubscriber ]
+      except KeyError:
+         wrapper = AsyncSubscriber( aSubscriber, maxSize, policy, sampleRate )
+         self._async[ aSubscriber ] = wrapper
+
+      self.subscribeTo( wrapper, *topics )
+      return wrapper
 
    def unsubscribeFrom( self, aSubscriber, *topics ):
       '''Unregister a Subscriber from one or more topics.'''
+      aSubscriber = self._async.get( aSubscriber, aSubscriber )
       for topic in topics:
-         try:
-            subscrList = self._subscriptionLists[ aTopic ]
-            subscrList.remove( aSubscriber )
+         if topic == '*':
+            self._wildcard.pop( aSubscriber, None )
+            continue
 
-            if len(subscrList) == 0:
-               del self._subscriptionLists[ aTopic ]
-         except:
-            pass
+         subscribers = self._subscriptions.get( topic )
+         if subscribers is not None:
+            subscribers.pop( aSubscriber, None )
+            if len(subscribers) == 0:
+               del self._subscriptions[ topic ]
+      self._dispatch.clear( )
 
    def unsubscribeFromAll( self, aSubscriber ):
-      '''Remove all a Subscriber from all subscriptions.'''
-      self.unsubscribeFrom( aSubscriber, *self._subscriptions.keys( ) )
+      '''Remove all a Subscriber from all subscriptions.  An asynchronous
+      subscriber's thread is closed once its queue is handled.'''
+      self.unsubscribeFrom( aSubscriber, '*', *list(self._subscriptions.keys()) )
+      wrapper = self._async.pop( aSubscriber, None )
+      if wrapper is not None:
+         wrapper.close( )
+
+   def drainAsync( self ):
+      '''Wait until the asynchronous subscribers have handled every message
+      delivered to them.'''
+      for wrapper in self._async.values( ):
+         wrapper.drain( )
+
+   def post( self, topic, sender, time, **payload ):
+      '''Post a message made from the pool.'''
+      if self._pool:
+         aMsg = self._pool.pop( )
+         aMsg.time    = time
+         aMsg.topic   = topic
+         aMsg.sender  = sender
+         aMsg.payload = payload
+      else:
+         aMsg = Message( topic, sender, time, **payload )
+         aMsg._pooled = True
+      self.postMessage( aMsg )
 
    def postMessage( self, aMsg ):
       '''Post a message to the message queue.  Delivery will occur in
       batch when deliverAllPostedMessages( ) is called.'''
+      aMsg.serialNo = self._nextSerialNo
+      self._nextSerialNo += 1
       self._postedMessages.append( aMsg )
 
    def deliverMessage( self, aMsg ):
-      '''Deliver aMsg to all subscribers of aMsg.topic.'''
-      try:
-         for subscriber in self._subscriptions[aMsg.topic]:
-            try:
+      '''Deliver aMsg to all subscribers of aMsg.topic.  A subscriber
+      which fails to handle it is reported in an ERROR message carrying a
+      copy of aMsg, and delivery carries on with the next subscriber.'''
+      subscribers = self._dispatch.get( aMsg.topic )
+      if subscribers is None:
+         subscribers = self._dispatchTuple( aMsg.topic )
+
+      remaining = iter( subscribers )
+      while True:
+         try:
+            for subscriber in remaining:
                subscriber.handleMessage( aMsg )
-            except:
-               self.postMessage( Message('ERROR', subscriber, '?', msg='Unable to handle message', detail=aMsg) )
-      except:
-         pass
+            return
+         except Exception:
+            self.postMessage( Message('ERROR', subscriber, aMsg.time, msg='Unable to handle message', detail=aMsg.copy()) )
 
    def deliverAllPostedMessages( self ):
-      '''Deliver all posted messages.'''
-      for msg in self._postedMessages:
-         self.deliverMessage( msg )
-      
-      self._postedMessages.clear( )
+      '''Deliver all posted messages, including any posted while they're
+      delivered.'''
+      pool = self._pool
+      while self._postedMessages:
+         batch = self._postedMessages
+         self._postedMessages = [ ]
+         for msg in batch:
+            self.deliverMessage( msg )
+            if msg._pooled and (len(pool) < PostOffice.MAX_POOL_SIZE):
+               msg.sender  = None
+               msg.payload = None
+               pool.append( msg )
+
+   def _dispatchTuple( self, topic ):
+      subscribers = dict( self._subscriptions.get(topic, ()) )
+      subscribers.update( self._wildcard )
+      result = tuple( subscribers )
+      self._dispatch[ topic ] = result
+      return result
+
+
+
+if __name__ == '__main__':
+   # Self-check: each subscriber gets each message once, whether subscribed
+   # to its topic, to '*' or both, as subscriptions change; pooled messages
+   # are recycled only after delivery; a failing subscriber is reported
+   # without stopping delivery; async subscribers get their messages in order.
+   class Sender( object ):
+      def ident( self ):
+         return 'sender'
+
+   class Keeper( Subscriber ):
+      def __init__( self ):
+         self.received = [ ]
+
+      def handleMessage( self, aMsg ):
+         self.received.append( (aMsg.topic, aMsg['n']) if aMsg.topic != 'ERROR' else ('ERROR', aMsg['detail']['n']) )
+
+   class Failer( Subscriber ):
+      def handleMessage( self, aMsg ):
+         raise Exception( 'failed' )
+
+   sender = Sender( )
+   office = PostOffice( )
+   a, b, c, errors = Keeper( ), Keeper( ), Keeper( ), Keeper( )
+   office.subscribeTo( a, 'x' )
+   office.subscribeTo( b, 'x', '*' )
+   office.subscribeTo( errors, 'ERROR' )
+   office.post( 'x', sender, 0, n=1 )
+   office.post( 'y', sender, 0, n=2 )
+   office.deliverAllPostedMessages( )
+   assert a.received == [ ('x', 1) ] and b.received == [ ('x', 1), ('y', 2) ]
+
+   office.subscribeTo( c, 'y' )
+   office.subscribeTo( Failer(), 'y' )
+   office.post( 'y', sender, 1, n=3 )
+   office.deliverAllPostedMessages( )
+   assert b.received[ -2: ] == [ ('y', 3), ('ERROR', 3) ] and c.received == [ ('y', 3) ] and errors.received == [ ('ERROR', 3) ]
+
+   office.unsubscribeFrom( b, '*' )
+   office.post( 'y', sender, 1, n=4 )
+   office.post( 'x', sender, 1, n=5 )
+   office.deliverAllPostedMessages( )
+   assert a.received == [ ('x', 1), ('x', 5) ]
+   assert b.received == [ ('x', 1), ('y', 2), ('y', 3), ('ERROR', 3), ('x', 5) ]
+   assert c.received == [ ('y', 3), ('y', 4) ]
+   assert errors.received == [ ('ERROR', 3), ('ERROR', 4) ]
+   assert len(office._pool) == 2 and all( msg.payload is None for msg in office._pool )   # <- reused by each round; the ERROR messages aren't pooled
+
+   kept = Message( 'x', sender, 2, n=6 )
+   office.postMessage( kept )
+   office.post( 'x', sender, 2, n=7 )
+   office.deliverAllPostedMessages( )
+   assert (kept not in office._pool) and (kept['n'] == 6) and (kept.serialNo == 7)
+   assert a.received[ -2: ] == [ ('x', 6), ('x', 7) ]
+
+   slow = Keeper( )
+   office.subscribeAsync( slow, 'x', maxSize=8, policy=AsyncSubscriber.BLOCK )
+   for n in range( 100 ):
+      office.post( 'x', sender, 3, n=n )
+   office.deliverAllPostedMessages( )
+   office.drainAsync( )
+   assert slow.received == [ ('x', n) for n in range(100) ]
+   office.unsubscribeFromAll( slow )
+   print( 'post office ok' )
+
+   import timeit
+   office = PostOffice( )
+   for subscriberNum in range( 10 ):
+      office.subscribeTo( Keeper(), 'x' )
+
+   def postAndDeliver( ):
+      for n in range( 100 ):
+         office.post( 'x', sender, 0, n=n )
+      office.deliverAllPostedMessages( )
 
+   print( '==> ', timeit.timeit( 'postAndDeliver()', setup='from __main__ import postAndDeliver', number=100 ) )